@@ -0,0 +1,484 @@
+"""A local stand-in for the TMDB API and image CDN, for benchmarks.
+
+It serves TMDB-shaped responses for the endpoints the app uses, with a
+configurable latency and rate of injected errors. Responses come from a
+directory of recorded fixtures where one exists, and are otherwise
+generated deterministically from the request path, so every run sees the
+same data.
+
+A fixture is a TMDB response saved as JSON under the request path, e.g.
+fixtures/3/movie/popular.page-2.json for the second page of popular
+movies, or fixtures/3/movie/550.json for every request of that path.
+
+Run it on its own and point the app at it:
+
+    python -m benchmarks.fake_tmdb --port 8765 --latency 80
+    TMDB_API_ORIGIN=http://127.0.0.1:8765 \\
+        TMDB_IMAGE_ORIGIN=http://127.0.0.1:8765 python src/main.py
+
+or let benchmarks.load_test start it.
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+PAGE_SIZE = 20
+LIST_PAGES = 500
+TITLE_WORDS = [
+    "Dark",
+    "Night",
+    "Star",
+    "Love",
+    "War",
+    "City",
+    "Last",
+    "Blood",
+    "King",
+    "Dream",
+    "Ghost",
+    "River",
+    "Storm",
+    "Kitchen",
+    "Secret",
+    "Summer",
+    "Shadow",
+    "Island",
+    "Heart",
+    "Empire",
+]
+GENRE_IDS = [12, 14, 16, 18, 27, 28, 35, 36, 80, 99, 878, 9648, 10749]
+# A 1x1 transparent PNG, served for every image.
+PIXEL = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYA"
+    "AjCB0C8AAAAASUVORK5CYII="
+)
+
+
+class FakeTMDB:
+    """Builds the responses of the fake API.
+
+    Args:
+        library_size (int, optional): The number of movies in each of
+            the user's rated, watchlist and favorite lists. Defaults to
+            200.
+        fixtures_dir (Optional[str], optional): A directory of recorded
+            responses to serve instead of generated ones. Defaults to
+            None.
+    """
+
+    def __init__(
+        self, library_size: int = 200, fixtures_dir: Optional[str] = None
+    ):
+        self.library_size = library_size
+        self.fixtures_dir = fixtures_dir
+
+    def respond(
+        self, method: str, path: str, params: Dict[str, str]
+    ) -> Tuple[int, Any]:
+        """Returns the status and JSON body of a request."""
+        path = path.strip("/")
+        page = int(params.get("page") or 1)
+        fixture = self._load_fixture(path, page)
+        if fixture is not None:
+            return 200, fixture
+        if method != "GET":
+            return 201, {"success": True, "status_code": 1}
+
+        match = re.fullmatch(r"3/movie/(\d+)", path)
+        if match:
+            return 200, self.movie_details(int(match[1]), params)
+        match = re.fullmatch(r"3/person/(\d+)", path)
+        if match:
+            return 200, self.person_details(int(match[1]), params)
+        if path == "3/authentication/token/new":
+            return 200, {"success": True, "request_token": "token"}
+        if path == "3/authentication/session/new":
+            token = params.get("request_token", "")
+            return 200, {"success": True, "session_id": f"session{token}"}
+        if path == "3/account":
+            return 200, {"id": 1, "username": "benchmark"}
+        match = re.fullmatch(
+            r"3/account/\d+/(rated|watchlist|favorite)/movies", path
+        )
+        if match:
+            return 200, self.library_page(match[1], page)
+        if path == "3/movie/changes":
+            return 200, self.list_page(path, page, fields=("id",))
+        if path == "3/search/movie":
+            return 200, self.search_page(params.get("query", ""), page)
+        return 200, self.list_page(path, page)
+
+    def movie(self, movie_id: int) -> Dict[str, Any]:
+        """Generates a movie as it appears in TMDB list responses."""
+        rng = random.Random(movie_id)
+        title = " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3)))
+        return {
+            "adult": False,
+            "backdrop_path": f"/backdrop{movie_id}.jpg",
+            "genre_ids": rng.sample(GENRE_IDS, 2),
+            "id": movie_id,
+            "original_language": "en",
+            "original_title": title,
+            "overview": f"The story of {title}. " * 6,
+            "popularity": round(rng.uniform(1, 3000), 3),
+            "poster_path": f"/poster{movie_id}.jpg",
+            "release_date": f"{rng.randint(1950, 2023)}-"
+            f"{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "title": title,
+            "video": False,
+            "vote_average": round(rng.uniform(1, 10), 1),
+            "vote_count": rng.randint(0, 30000),
+        }
+
+    def list_page(
+        self, path: str, page: int, total_pages: int = LIST_PAGES, fields=None
+    ) -> Dict[str, Any]:
+        """Generates a page of a movie list, different for every path."""
+        offset = zlib.crc32(path.encode()) % 100000 * 10
+        movies = [
+            self.movie(offset + (page - 1) * PAGE_SIZE + index)
+            for index in range(PAGE_SIZE)
+        ]
+        if fields:
+            movies = [
+                {field: movie[field] for field in fields} for movie in movies
+            ]
+        return {
+            "page": page,
+            "results": movies if page <= total_pages else [],
+            "total_pages": total_pages,
+            "total_results": total_pages * PAGE_SIZE,
+        }
+
+    def library_page(self, library: str, page: int) -> Dict[str, Any]:
+        """Generates a page of one of the user's lists."""
+        total_pages = max(math.ceil(self.library_size / PAGE_SIZE), 1)
+        response = self.list_page(f"library/{library}", page, total_pages)
+        if library == "rated":
+            for movie in response["results"]:
+                movie["rating"] = movie["id"] % 10 + 1
+        return response
+
+    def search_page(self, query: str, page: int) -> Dict[str, Any]:
+        """Generates search results whose titles contain the query."""
+        response = self.list_page(f"search/{query.lower()}", page, 5)
+        for movie in response["results"]:
+            movie["title"] = f"{query.title()} {movie['title']}"
+        return response
+
+    def movie_details(
+        self, movie_id: int, params: Dict[str, str]
+    ) -> Dict[str, Any]:
+        movie = self.movie(movie_id)
+        ids = movie.pop("genre_ids")
+        movie.update(
+            budget=movie_id * 1000,
+            genres=[{"id": genre_id, "name": "Genre"} for genre_id in ids],
+            runtime=100 + movie_id % 60,
+            tagline="A tagline.",
+        )
+        parts = {
+            "credits": lambda: self.credits(movie_id),
+            "videos": lambda: {
+                "results": [{"key": f"video{movie_id}", "site": "YouTube"}]
+            },
+            "keywords": lambda: {
+                "keywords": [
+                    {"id": movie_id % 50 + index, "name": f"keyword {index}"}
+                    for index in range(8)
+                ]
+            },
+        }
+        return self._append_parts(movie, parts, params)
+
+    def credits(self, movie_id: int) -> Dict[str, Any]:
+        def person(person_id: int) -> Dict[str, Any]:
+            return {
+                "adult": False,
+                "gender": person_id % 3,
+                "id": person_id,
+                "known_for_department": "Acting",
+                "name": f"Person {person_id}",
+                "original_name": f"Person {person_id}",
+                "popularity": person_id % 100 / 3,
+                "profile_path": f"/profile{person_id}.jpg",
+                "credit_id": f"{person_id:024x}",
+            }
+
+        return {
+            "id": movie_id,
+            "cast": [
+                {
+                    **person(movie_id * 100 + index),
+                    "cast_id": index,
+                    "character": f"Character {index}",
+                    "order": index,
+                }
+                for index in range(60)
+            ],
+            "crew": [
+                {
+                    **person(movie_id * 100 + index),
+                    "department": "Production",
+                    "job": ["Director", "Producer", "Writer"][index % 3],
+                }
+                for index in range(80)
+            ],
+        }
+
+    def person_details(
+        self, person_id: int, params: Dict[str, str]
+    ) -> Dict[str, Any]:
+        person = {
+            "biography": "A biography. " * 40,
+            "birthday": "1970-01-01",
+            "id": person_id,
+            "name": f"Person {person_id}",
+            "profile_path": f"/profile{person_id}.jpg",
+        }
+        movies = self.list_page(f"person/{person_id}", 1, 1)["results"] * 10
+        parts = {
+            "images": lambda: {
+                "profiles": [
+                    {"file_path": f"/profile{person_id}_{index}.jpg"}
+                    for index in range(10)
+                ]
+            },
+            "tagged_images": lambda: {"results": []},
+            "movie_credits": lambda: {
+                "cast": [
+                    {**movie, "character": "Character", "credit_id": "c"}
+                    for movie in movies
+                ],
+                "crew": [
+                    {**movie, "job": "Producer", "department": "Production"}
+                    for movie in movies[:50]
+                ],
+            },
+        }
+        return self._append_parts(person, parts, params)
+
+    def _append_parts(
+        self, resource: Dict[str, Any], parts, params: Dict[str, str]
+    ) -> Dict[str, Any]:
+        for part in params.get("append_to_response", "").split(","):
+            if part in parts:
+                resource[part] = parts[part]()
+        return resource
+
+    def _load_fixture(self, path: str, page: int) -> Optional[Any]:
+        if not self.fixtures_dir:
+            return None
+        for name in (f"{path}.page-{page}.json", f"{path}.json"):
+            fixture_path = os.path.join(self.fixtures_dir, name)
+            if os.path.isfile(fixture_path):
+                with open(fixture_path, encoding="utf-8") as file:
+                    return json.load(file)
+        return None
+
+
+class FakeTMDBServer(ThreadingHTTPServer):
+    """Serves FakeTMDB over HTTP with simulated latency and errors.
+
+    Args:
+        port (int, optional): The port to listen on, or 0 for any free
+            port. Defaults to 0.
+        latency (float, optional): The mean response delay in seconds.
+            Defaults to 0.05.
+        jitter (float, optional): The maximum deviation from latency,
+            in seconds. Defaults to 0.02.
+        error_rate (float, optional): The fraction of API requests
+            answered with 503. Defaults to 0.
+        throttle_rate (float, optional): The fraction of API requests
+            answered with 429 and a Retry-After of one second.
+            Defaults to 0.
+        api (Optional[FakeTMDB], optional): The responses to serve.
+            Defaults to a FakeTMDB with default settings.
+    """
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.05,
+        jitter: float = 0.02,
+        error_rate: float = 0,
+        throttle_rate: float = 0,
+        api: Optional[FakeTMDB] = None,
+    ):
+        super().__init__(("127.0.0.1", port), FakeTMDBHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.api = api or FakeTMDB()
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def origin(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """Serves in a background thread and returns the origin URL."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.origin
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def delay(self) -> None:
+        seconds = self.latency + random.uniform(-self.jitter, self.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class FakeTMDBHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeTMDBServer
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_DELETE(self) -> None:
+        self._handle("DELETE")
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _handle(self, method: str) -> None:
+        server = self.server
+        with server._count_lock:
+            server.request_count += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        url = urlsplit(self.path)
+        params = {
+            name: values[-1] for name, values in parse_qs(url.query).items()
+        }
+        server.delay()
+
+        if url.path.startswith("/t/p/"):
+            self._send(200, PIXEL, "image/png")
+            return
+
+        roll = random.random()
+        if roll < server.error_rate:
+            self._send_json(503, {"status_message": "Injected error."})
+        elif roll < server.error_rate + server.throttle_rate:
+            self._send_json(
+                429,
+                {"status_message": "Injected rate limit."},
+                {"Retry-After": "1"},
+            )
+        else:
+            self._send_json(*server.api.respond(method, url.path, params))
+
+    def _send_json(
+        self, status: int, body: Any, headers: Dict[str, str] = None
+    ) -> None:
+        self._send(
+            status, json.dumps(body).encode(), "application/json", headers
+        )
+
+    def _send(
+        self,
+        status: int,
+        content: bytes,
+        content_type: str,
+        headers: Dict[str, str] = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the options of FakeTMDBServer to a command line parser."""
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=50,
+        help="Mean TMDB response delay in milliseconds.",
+    )
+    parser.add_argument(
+        "--jitter",
+        type=float,
+        default=20,
+        help="Maximum deviation from the latency in milliseconds.",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="Fraction of TMDB requests answered with 503.",
+    )
+    parser.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0,
+        help="Fraction of TMDB requests answered with 429.",
+    )
+    parser.add_argument(
+        "--library-size",
+        type=int,
+        default=200,
+        help="Movies in each of the user's rated, watchlist and favorite "
+        "lists.",
+    )
+    parser.add_argument(
+        "--fixtures", help="Directory of recorded TMDB responses to serve."
+    )
+
+
+def create_server(args: argparse.Namespace, port: int = 0) -> FakeTMDBServer:
+    """Creates a FakeTMDBServer from parsed add_server_arguments."""
+    return FakeTMDBServer(
+        port=port,
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        api=FakeTMDB(args.library_size, args.fixtures),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args, args.port)
+    print(f"Serving a fake TMDB on {server.origin}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
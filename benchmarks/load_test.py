@@ -0,0 +1,290 @@
+"""Load scenarios for the Flask routes, run against a local fake TMDB.
+
+Each scenario is a sequence of requests that one simulated user makes
+over and over. The scenarios run one after another, each with
+--concurrency users for --duration seconds after a short warmup, and
+report throughput and latency percentiles per request. No network
+access is needed: the app runs in process and TMDB is replaced by
+benchmarks.fake_tmdb.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --scenario detail --latency 150 \\
+        --error-rate 0.02 --concurrency 32
+    python -m benchmarks.load_test --async-upstream --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from .fake_tmdb import TITLE_WORDS, add_server_arguments, create_server
+
+# A request is a label to group its results under and the path to get.
+Request = Tuple[str, str]
+
+
+def anonymous_home(rng: random.Random) -> Iterator[Request]:
+    """An anonymous user opens the home page and scrolls three pages."""
+    yield "/", "/"
+    yield "/?format=json", "/?format=json"
+    for cursor in range(2, 4):
+        yield "/?format=json&cursor=N", f"/?format=json&cursor={cursor}"
+
+
+def logged_in(rng: random.Random) -> Iterator[Request]:
+    """A logged-in user with large lists browses their pages."""
+    yield "/", "/"
+    yield "/?format=json", "/?format=json"
+    yield "/rated-movies?format=json", "/rated-movies?format=json"
+    yield "/watchlist-movies", "/watchlist-movies"
+    yield "/recommendations", "/recommendations"
+    yield "/movie/<id>/", f"/movie/{rng.randint(1, 1000)}/"
+
+
+def detail(rng: random.Random) -> Iterator[Request]:
+    """A user opens movie and person pages."""
+    yield "/movie/<id>/", f"/movie/{rng.randint(1, 100000)}/"
+    yield "/person/<id>/", f"/person/{rng.randint(1, 100000)}/"
+    yield (
+        "/similar-movies/<id>/?format=json",
+        f"/similar-movies/{rng.randint(1, 100000)}/?title=x&format=json",
+    )
+
+
+def search(rng: random.Random) -> Iterator[Request]:
+    """A user types a query, then searches for it."""
+    word = rng.choice(TITLE_WORDS).lower()
+    for length in range(2, len(word) + 1, 2):
+        yield (
+            "/api/search/suggest",
+            f"/api/search/suggest?query={word[:length]}",
+        )
+    yield "/search", f"/search?query={word}"
+    yield "/search?format=json", f"/search?query={word}&format=json"
+
+
+SCENARIOS: Dict[str, Tuple[Callable, bool]] = {
+    "anonymous-home": (anonymous_home, False),
+    "logged-in": (logged_in, True),
+    "detail": (detail, False),
+    "search": (search, False),
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Returns the nearest-rank percentile of sorted values."""
+    if not values:
+        return 0
+    index = min(int(fraction * len(values)), len(values) - 1)
+    return values[index]
+
+
+class Worker(threading.Thread):
+    """A simulated user running a scenario until a deadline."""
+
+    def __init__(self, app, scenario: Callable, login: bool, seed: int):
+        super().__init__(daemon=True)
+        self.client = app.test_client()
+        # Session cookies are only sent over HTTPS.
+        self.client.environ_base["wsgi.url_scheme"] = "https"
+        self.scenario = scenario
+        self.login = login
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.deadline = 0
+        self.recording = False
+        self.results: List[Tuple[str, float, int]] = []
+
+    def run(self) -> None:
+        if self.login:
+            self.client.get(f"/create_session?request_token={self.seed}")
+        while time.monotonic() < self.deadline:
+            for label, path in self.scenario(self.rng):
+                started_at = time.perf_counter()
+                try:
+                    status = self.client.get(path).status_code
+                except Exception:
+                    status = 0
+                seconds = time.perf_counter() - started_at
+                if self.recording:
+                    self.results.append((label, seconds, status))
+
+
+def run_scenario(
+    app, name: str, concurrency: int, duration: float, warmup: float
+) -> Dict:
+    """Runs a scenario and summarizes its results."""
+    scenario, login = SCENARIOS[name]
+    workers = [
+        Worker(app, scenario, login, seed) for seed in range(concurrency)
+    ]
+    started_at = time.monotonic()
+    for worker in workers:
+        worker.deadline = started_at + warmup + duration
+        worker.start()
+    time.sleep(warmup)
+    for worker in workers:
+        worker.recording = True
+    measured_at = time.monotonic()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - measured_at
+
+    by_label = defaultdict(list)
+    errors = defaultdict(int)
+    for worker in workers:
+        for label, seconds, status in worker.results:
+            by_label[label].append(seconds)
+            if not 200 <= status < 400:
+                errors[label] += 1
+    all_latencies = sorted(
+        seconds for latencies in by_label.values() for seconds in latencies
+    )
+
+    def summarize(latencies: List[float], error_count: int) -> Dict:
+        latencies = sorted(latencies)
+        return {
+            "requests": len(latencies),
+            "errors": error_count,
+            "throughput": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p90_ms": percentile(latencies, 0.9) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0) * 1000,
+        }
+
+    return {
+        "scenario": name,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "total": summarize(all_latencies, sum(errors.values())),
+        "requests": {
+            label: summarize(latencies, errors[label])
+            for label, latencies in sorted(by_label.items())
+        },
+    }
+
+
+def print_report(report: Dict, upstream_requests: int) -> None:
+    print(
+        f"\n{report['scenario']}: {report['concurrency']} users for "
+        f"{report['seconds']:.1f}s, {upstream_requests} TMDB requests"
+    )
+    print(
+        f"  {'request':<36}{'count':>7}{'err':>5}{'req/s':>8}"
+        f"{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}"
+    )
+    rows = [*report["requests"].items(), ("total", report["total"])]
+    for label, stats in rows:
+        print(
+            f"  {label[:35]:<36}{stats['requests']:>7}{stats['errors']:>5}"
+            f"{stats['throughput']:>8.1f}{stats['p50_ms']:>8.1f}"
+            f"{stats['p90_ms']:>8.1f}{stats['p99_ms']:>8.1f}"
+            f"{stats['max_ms']:>8.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Runs load scenarios against the app and a fake TMDB."
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Scenario to run; can be repeated. Defaults to all of them.",
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--duration", type=float, default=10, help="Seconds per scenario."
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=2,
+        help="Seconds per scenario before results are recorded.",
+    )
+    parser.add_argument(
+        "--async-upstream",
+        action="store_true",
+        help="Fetch from TMDB on the shared event loop (ASYNC_UPSTREAM).",
+    )
+    parser.add_argument(
+        "--upstream-rate-limit",
+        type=float,
+        help="Override the app's TMDB requests per second "
+        "(UPSTREAM_RATE_LIMIT).",
+    )
+    parser.add_argument(
+        "--no-prefetch",
+        action="store_true",
+        help="Do not warm the hot lists in the background "
+        "(PREFETCH_ENABLED).",
+    )
+    parser.add_argument("--json", help="Also write the results to a file.")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = create_server(args)
+    origin = server.start()
+    work_dir = tempfile.mkdtemp(prefix="reelrecs-benchmark-")
+    try:
+        # The app reads its settings when it is imported, so they are
+        # set first. Every file the app reads or writes is kept in
+        # work_dir, so that a run neither touches nor uses the
+        # checkout's own. A missing catalog, model and similarity index
+        # keep every page on the fake TMDB.
+        os.environ.update(
+            TMDB_API_ORIGIN=origin,
+            TMDB_IMAGE_ORIGIN=origin,
+            CATALOG_DIR=os.path.join(work_dir, "catalog"),
+            IMAGE_CACHE_DIR=os.path.join(work_dir, "images"),
+            MUTATION_QUEUE_PATH=os.path.join(work_dir, "mutations.sqlite3"),
+            RATINGS_LOG_PATH=os.path.join(work_dir, "ratings.log"),
+            CF_MODEL_DIR=os.path.join(work_dir, "cf_model"),
+            SIMILARITY_INDEX_DIR=os.path.join(work_dir, "similarity_index"),
+            PREFETCH_LOCK_PATH=os.path.join(work_dir, "prefetch.lock"),
+            CACHE_BACKEND="memory",
+            ASYNC_UPSTREAM=str(args.async_upstream),
+            PREFETCH_ENABLED=str(not args.no_prefetch),
+        )
+        if args.upstream_rate_limit:
+            os.environ["UPSTREAM_RATE_LIMIT"] = str(args.upstream_rate_limit)
+        for name in ("API_KEY", "API_ACCESS_TOKEN", "ACCOUNT_OBJECT_ID"):
+            os.environ.setdefault(name, "benchmark")
+        from src.app.flask_app import app
+
+        reports = []
+        for name in args.scenario or list(SCENARIOS):
+            requests_before = server.request_count
+            report = run_scenario(
+                app, name, args.concurrency, args.duration, args.warmup
+            )
+            report["upstream_requests"] = (
+                server.request_count - requests_before
+            )
+            print_report(report, report["upstream_requests"])
+            reports.append(report)
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(
+                    {"settings": vars(args), "scenarios": reports},
+                    file,
+                    indent=2,
+                )
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
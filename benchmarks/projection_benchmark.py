@@ -0,0 +1,135 @@
+"""Compares the projection of TMDB responses with the recursive
+clean_data it replaced, on a 20-movie list page and on a prolific
+person's movie credits, of which the person page embeds the first
+PERSON_CREDITS_PAGE_SIZE movies.
+
+Run from the repository root:
+
+    python -m benchmarks.projection_benchmark
+"""
+import json
+import random
+import timeit
+from typing import Any, Callable, Dict, List, Union
+
+from src.constants.api_constants import PERSON_CREDITS_PAGE_SIZE
+from src.services.projection_service import (
+    get_credits_page,
+    project_movies,
+    project_person_credits,
+)
+
+ROUNDS = 5
+
+
+def clean_data(
+    data: Union[Dict[str, Any], List[Any], Any]
+) -> Union[Dict[str, Any], List[Any], Any]:
+    """The recursive None-stripping previously applied to every page."""
+    if isinstance(data, dict):
+        return {k: clean_data(v) for k, v in data.items() if v is not None}
+    elif isinstance(data, list):
+        return [clean_data(v) for v in data if v is not None]
+    else:
+        return data
+
+
+def make_movie(movie_id: int) -> Dict[str, Any]:
+    """Builds a movie shaped like a TMDB list result."""
+    return {
+        "adult": False,
+        "backdrop_path": f"/backdrop{movie_id}.jpg",
+        "genre_ids": random.sample([12, 14, 16, 18, 28, 35, 80, 878], 3),
+        "id": movie_id,
+        "original_language": "en",
+        "original_title": f"Original Title {movie_id}",
+        "overview": "A plot summary of a few sentences. " * 8,
+        "popularity": random.uniform(1, 5000),
+        "poster_path": random.choice([f"/poster{movie_id}.jpg", None]),
+        "release_date": "2023-07-19",
+        "title": f"Title {movie_id}",
+        "video": False,
+        "vote_average": random.uniform(1, 10),
+        "vote_count": random.randint(0, 30000),
+    }
+
+
+def make_page() -> Dict[str, Any]:
+    """Builds a TMDB list page of 20 movies."""
+    return {
+        "page": 1,
+        "results": [make_movie(movie_id) for movie_id in range(20)],
+        "total_pages": 500,
+        "total_results": 10000,
+    }
+
+
+def make_person_credits(cast: int = 300, crew: int = 150) -> Dict[str, Any]:
+    """Builds a person's movie_credits response."""
+    return {
+        "cast": [
+            {
+                **make_movie(movie_id),
+                "character": f"Character {movie_id}",
+                "credit_id": f"{movie_id:024x}",
+                "order": movie_id % 30,
+            }
+            for movie_id in range(cast)
+        ],
+        "crew": [
+            {
+                **make_movie(movie_id),
+                "credit_id": f"{movie_id:024x}",
+                "department": "Production",
+                "job": random.choice(["Producer", "Director", None]),
+            }
+            for movie_id in range(crew)
+        ],
+        "id": 1,
+    }
+
+
+def measure(func: Callable[[], Any]) -> float:
+    """Returns the best time of ROUNDS runs of func, in microseconds."""
+    number, _ = timeit.Timer(func).autorange()
+    best = min(timeit.repeat(func, number=number, repeat=ROUNDS))
+    return best / number * 1e6
+
+
+def report(name: str, payload: Any, old: Callable, new: Callable) -> None:
+    old_time = measure(lambda: old(payload))
+    new_time = measure(lambda: new(payload))
+    old_size = len(json.dumps(old(payload)))
+    new_size = len(json.dumps(new(payload)))
+    old_json = measure(lambda: json.dumps(old(payload)))
+    new_json = measure(lambda: json.dumps(new(payload)))
+    print(name)
+    print(f"  clean_data  {old_time:9.1f} us  {old_size:8d} bytes")
+    print(f"  projection  {new_time:9.1f} us  {new_size:8d} bytes")
+    print(
+        f"  with json.dumps: {old_json:.1f} us -> {new_json:.1f} us "
+        f"({old_json / new_json:.1f}x)"
+    )
+
+
+def main() -> None:
+    random.seed(0)
+    page = make_page()
+    report(
+        "20-movie list page",
+        page,
+        lambda page: clean_data(page["results"]),
+        lambda page: project_movies(page["results"]),
+    )
+    report(
+        "person movie_credits (300 cast, 150 crew)",
+        make_person_credits(),
+        clean_data,
+        lambda credits: get_credits_page(
+            project_person_credits(credits), limit=PERSON_CREDITS_PAGE_SIZE
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
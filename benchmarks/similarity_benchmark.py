@@ -0,0 +1,154 @@
+"""Measures the similar movies index on a synthetic catalog: build time,
+query latency with and without filters, and how many of the exact
+nearest neighbours the IVF index finds compared with brute force.
+
+Run from the repository root:
+
+    python -m benchmarks.similarity_benchmark --movies 200000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from src.services.catalog_service import MovieCatalog
+from src.services.similarity_service import SimilarityIndex
+
+GENRE_IDS = [
+    12, 14, 16, 18, 27, 28, 35, 36, 37, 53,
+    80, 99, 878, 9648, 10402, 10749, 10751, 10752, 10770,
+]
+TOPICS = 200
+KEYWORDS = 5000
+QUERIES = 200
+K = 20
+
+
+def make_catalog(path: str, movies: int) -> MovieCatalog:
+    """Writes a catalog of movies whose genres and keywords are drawn
+    mostly from one of TOPICS topics each."""
+    topics = [
+        {
+            "genres": random.sample(GENRE_IDS, 3),
+            "keywords": random.sample(range(KEYWORDS), 30),
+        }
+        for _ in range(TOPICS)
+    ]
+    records = []
+    for movie_id in range(1, movies + 1):
+        topic = random.choice(topics)
+        records.append(
+            {
+                "id": movie_id,
+                "title": f"Movie {movie_id}",
+                "popularity": random.uniform(1, 500),
+                "vote_average": random.uniform(1, 10),
+                "vote_count": random.randint(0, 5000),
+                "release_date": f"{random.randint(1950, 2024)}-01-01",
+                "genre_ids": random.sample(topic["genres"], 2),
+                "keyword_ids": random.sample(topic["keywords"], 5)
+                + random.sample(range(KEYWORDS), 2),
+            }
+        )
+    catalog = MovieCatalog(path)
+    catalog.write(records)
+    return catalog
+
+
+def measure(query: Callable[[int], List[int]], movie_ids: List[int]):
+    """Returns the results of query for each movie and the 50th and
+    99th percentile latencies in milliseconds."""
+    results, times = [], []
+    for movie_id in movie_ids:
+        started_at = time.perf_counter()
+        results.append(query(movie_id))
+        times.append((time.perf_counter() - started_at) * 1000)
+    return results, np.percentile(times, 50), np.percentile(times, 99)
+
+
+def load_embeddings(index: SimilarityIndex) -> Dict[int, np.ndarray]:
+    """Reads an index's embeddings from disk, by movie ID."""
+    ids = np.load(os.path.join(index.path, "ids.npy"))
+    embeddings = np.load(os.path.join(index.path, "embeddings.npy"))
+    return dict(zip(ids.tolist(), embeddings))
+
+
+def get_recall(
+    embeddings: Dict[int, np.ndarray],
+    movie_ids: List[int],
+    results: List[List[int]],
+    exact_results: List[List[int]],
+) -> float:
+    """Returns the share of results at least as similar as the k-th
+    exact result. Many movies share the same genres and keywords, so
+    comparing IDs would count ties as misses."""
+    found = total = 0
+    for movie_id, result, exact in zip(movie_ids, results, exact_results):
+        if not exact:
+            continue
+        query = embeddings[movie_id]
+        kth_score = embeddings[exact[-1]] @ query
+        found += sum(
+            embeddings[id] @ query >= kth_score - 1e-5 for id in result
+        )
+        total += len(exact)
+    return found / max(total, 1)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the similar movies index."
+    )
+    parser.add_argument("--movies", type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    work_dir = tempfile.mkdtemp(prefix="reelrecs-similarity-")
+    try:
+        catalog = make_catalog(os.path.join(work_dir, "catalog"), args.movies)
+        movie_ids = random.sample(range(1, args.movies + 1), QUERIES)
+        filters: Dict[str, Any] = {"genre_id": 28, "min_year": 2000}
+
+        indexes = {}
+        for name, brute_force_limit in [
+            ("brute force", args.movies),
+            ("IVF", 0),
+        ]:
+            index = SimilarityIndex(os.path.join(work_dir, name))
+            started_at = time.perf_counter()
+            index.build(catalog, brute_force_limit=brute_force_limit)
+            print(f"{name}: built in {time.perf_counter() - started_at:.1f}s")
+            index.load()
+            indexes[name] = index
+
+        exact = {}
+        embeddings = load_embeddings(indexes["brute force"])
+        for name, index in indexes.items():
+            for label, kwargs in [("unfiltered", {}), ("filtered", filters)]:
+                results, p50, p99 = measure(
+                    lambda movie_id: index.similar(movie_id, K, **kwargs),
+                    movie_ids,
+                )
+                line = (
+                    f"  {name:<12}{label:<12}"
+                    f"p50 {p50:6.2f} ms  p99 {p99:6.2f} ms"
+                )
+                if name == "brute force":
+                    exact[label] = results
+                else:
+                    recall = get_recall(
+                        embeddings, movie_ids, results, exact[label]
+                    )
+                    line += f"  recall@{K} {recall:.3f}"
+                print(line)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Measures how long a fresh process takes to import the app, create
+it, render its home page and warm up, taking the median of several
+runs, each in a new interpreter. TMDB is replaced by
+benchmarks.fake_tmdb, answering without delay.
+
+Run from the repository root:
+
+    python -m benchmarks.startup_benchmark --runs 5 --budget-ms 500
+
+Exits with status 1 if the median time to the first response exceeds
+--budget-ms, so that it can guard the cold-start time in CI.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+from .fake_tmdb import FakeTMDBServer
+
+# Runs in the child interpreter and prints the time of each phase in
+# milliseconds, as JSON.
+PROBE = """
+import json, time
+started_at = time.perf_counter()
+times = {}
+
+def mark(phase):
+    times[phase] = (time.perf_counter() - started_at) * 1000
+
+from src.app.flask_app import create_app, warm_up
+mark("import")
+app, _ = create_app()
+mark("create_app")
+response = app.test_client().get("/")
+assert response.status_code == 200, response.status_code
+mark("first_request")
+warm_up(app)
+mark("warm_up")
+print(json.dumps(times))
+"""
+
+PHASES = ["import", "create_app", "first_request", "warm_up"]
+
+
+def run_probe(env: Dict[str, str]) -> Dict[str, float]:
+    """Runs the probe in a new interpreter and returns its phase times.
+
+    Args:
+        env (Dict[str, str]): The child's environment.
+
+    Returns:
+        Dict[str, float]: Milliseconds from start to the end of each
+            phase.
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measures the app's cold-start time."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="Fail if the median time to the first response exceeds "
+        "this many milliseconds.",
+    )
+    parser.add_argument(
+        "--async-upstream",
+        action="store_true",
+        help="Start with the async HTTP client (ASYNC_UPSTREAM).",
+    )
+    args = parser.parse_args()
+
+    server = FakeTMDBServer(latency=0, jitter=0)
+    origin = server.start()
+    work_dir = tempfile.mkdtemp(prefix="reelrecs-startup-")
+    # Every file the app reads or writes is kept in work_dir, and the
+    # background prefetching is turned off, so that each run starts
+    # from the same empty caches.
+    env = {
+        **os.environ,
+        "TMDB_API_ORIGIN": origin,
+        "TMDB_IMAGE_ORIGIN": origin,
+        "CATALOG_DIR": os.path.join(work_dir, "catalog"),
+        "IMAGE_CACHE_DIR": os.path.join(work_dir, "images"),
+        "CACHE_BACKEND": "memory",
+        "MUTATION_QUEUE_PATH": os.path.join(work_dir, "mutations.sqlite3"),
+        "RATINGS_LOG_PATH": os.path.join(work_dir, "ratings.log"),
+        "CF_MODEL_DIR": os.path.join(work_dir, "cf_model"),
+        "SIMILARITY_INDEX_DIR": os.path.join(work_dir, "similarity_index"),
+        "ASYNC_UPSTREAM": str(args.async_upstream),
+        "PREFETCH_ENABLED": "False",
+    }
+    for name in ("API_KEY", "API_ACCESS_TOKEN", "ACCOUNT_OBJECT_ID"):
+        env.setdefault(name, "benchmark")
+
+    try:
+        runs: List[Dict[str, float]] = [
+            run_probe(env) for _ in range(args.runs)
+        ]
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    medians = {
+        phase: statistics.median(run[phase] for run in runs)
+        for phase in PHASES
+    }
+
+    print(f"Median of {args.runs} runs, from the first import:")
+    previous = 0.0
+    for phase in PHASES:
+        print(
+            f"  {phase:<16}{medians[phase]:>8.1f} ms"
+            f"  (+{medians[phase] - previous:.1f})"
+        )
+        previous = medians[phase]
+
+    if args.budget_ms and medians["first_request"] > args.budget_ms:
+        print(
+            f"First response took {medians['first_request']:.1f} ms, "
+            f"over the budget of {args.budget_ms:.0f} ms"
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+"""Serves the app through an ASGI server:
+
+    uvicorn src.app.asgi:app
+
+TMDB calls then run as coroutines on one shared event loop with an async
+HTTP client (ASYNC_UPSTREAM), while the Flask views run on a pool of
+ASGI_WORKER_THREADS threads.
+"""
+import os
+
+os.environ.setdefault("ASYNC_UPSTREAM", "True")
+
+from a2wsgi import WSGIMiddleware  # noqa: E402
+
+from src.constants.api_constants import ASGI_WORKER_THREADS  # noqa: E402
+from .flask_app import app as flask_app  # noqa: E402
+
+app = WSGIMiddleware(flask_app, workers=ASGI_WORKER_THREADS)
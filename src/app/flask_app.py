@@ -1,26 +1,45 @@
+import importlib
 import os
 from datetime import timedelta
 
-import requests
 import tmdbsimple as tmdb
 from flask import Flask
 from flask_login import LoginManager
 
 from src.constants.api_constants import (
-    API_HEADERS,
     API_KEY,
+    ASYNC_UPSTREAM,
+    PREFETCH_ENABLED,
+    SECRET_KEY,
+    UPSTREAM_TIMEOUT,
+    validate_settings,
 )
+from src.services.catalog_service import movie_catalog
+from src.services.http_service import api_session
+from src.services.mutation_service import mutation_queue
+from src.services.prefetch_service import prefetch_scheduler
+from src.services.search_service import search_index
+from src.services.similarity_service import similarity_index
 
 from src.app.routes.auth_routes import set_up_auth_routes
 from src.app.routes.movie_routes import set_up_movie_routes
 from src.app.routes.api_routes import set_up_api_routes
+from src.app.routes.image_routes import set_up_image_routes
+from src.app.routes.metrics_routes import set_up_metrics_routes
+from src.app.routes.cache_routes import set_up_cache_routes
+
+# Modules the services import on first use, which warm_up imports up
+# front.
+LAZY_MODULES = ["scipy.sparse", *(["httpx"] if ASYNC_UPSTREAM else [])]
 
 
 def create_app():
+    validate_settings()
+
     app = Flask(
         __name__,
     )
-    app.secret_key = os.urandom(24)
+    app.secret_key = SECRET_KEY or os.urandom(24)
     app.config["REMEMBER_COOKIE_DURATION"] = timedelta(days=14)
     app.config.update(
         SESSION_COOKIE_SECURE=True,
@@ -32,16 +51,50 @@ def create_app():
     login_manager.init_app(app)
 
     tmdb.API_KEY = API_KEY
-    tmdb.REQUESTS_SESSION = requests.Session()
-    tmdb.REQUESTS_SESSION.headers.update(API_HEADERS)
+    tmdb.REQUESTS_SESSION = api_session
+    tmdb.REQUESTS_TIMEOUT = UPSTREAM_TIMEOUT
 
-    account = tmdb.Account("")
+    set_up_metrics_routes(app)
+    set_up_api_routes(app)
+    set_up_auth_routes(app, login_manager)
+    set_up_movie_routes(app)
+    set_up_image_routes(app)
 
-    set_up_api_routes(app, account)
-    set_up_auth_routes(app, account, login_manager)
-    set_up_movie_routes(app, account)
+    # Background threads do not survive a fork, so they are started on
+    # the first request, in the process that serves it.
+    app.before_request(mutation_queue.start)
+    if PREFETCH_ENABLED:
+        app.before_request(prefetch_scheduler.start)
+    # Set up last, so that the hooks above still run for responses
+    # served from the response cache, and the metrics see their status.
+    set_up_cache_routes(app)
 
     return app, login_manager
 
 
-app, login_manager = create_app()
+def warm_up(app: Flask) -> None:
+    """Does the setup that would otherwise happen on first use: imports
+    the lazily imported modules, maps the catalog and the similar movies
+    index into memory, indexes the catalog for search and compiles the
+    templates.
+
+    Run before forking worker processes, so that they share the result
+    copy-on-write instead of each repeating it.
+    """
+    for module in LAZY_MODULES:
+        importlib.import_module(module)
+    if movie_catalog.load():
+        search_index.index_catalog(movie_catalog, background=False)
+    similarity_index.load()
+    for template in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template)
+
+
+def __getattr__(name: str):
+    # The module-level app is created on first access rather than on
+    # import, so that importing create_app is cheap.
+    if name in ("app", "login_manager"):
+        global app, login_manager
+        app, login_manager = create_app()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
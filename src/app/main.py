@@ -1,9 +1,103 @@
+import argparse
 import os
-from .flask_app import app
+import signal
+import time
+from typing import List
+
+STARTED_AT = time.perf_counter()
+
+from .flask_app import create_app, warm_up  # noqa: E402
 
 
 def main():
-    app.run(debug=is_flask_debug_enabled())
+    parser = argparse.ArgumentParser(description="Runs the ReelRecs server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes to fork, sharing one listening socket.",
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Warm the app up before forking, so that the workers share "
+        "its catalog, indexes and templates copy-on-write.",
+    )
+    args = parser.parse_args()
+
+    app, _ = create_app()
+    if args.preload:
+        warm_up(app)
+
+    if args.workers == 1 and not args.preload:
+        report_startup()
+        app.run(args.host, args.port, debug=is_flask_debug_enabled())
+    else:
+        serve_forked(app, args.host, args.port, args.workers)
+
+
+def serve_forked(app, host: str, port: int, workers: int) -> None:
+    """Serves the app from forked worker processes that accept
+    connections on one shared listening socket.
+
+    Args:
+        app (Flask): The app to serve.
+        host (str): The interface to listen on.
+        port (int): The port to listen on.
+        workers (int): The number of worker processes.
+    """
+    from werkzeug.serving import make_server
+
+    from ..services.movie_service import share_account_states
+
+    if workers > 1:
+        share_account_states()
+    server = make_server(host, port, app, threaded=True)
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            server.serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop_children(signum, frame) -> None:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # A process manager stops the server with SIGTERM, which must reach
+    # the workers too rather than leave them serving without a parent.
+    signal.signal(signal.SIGTERM, stop_children)
+
+    report_startup()
+    print(f"Serving on http://{host}:{port} with {workers} workers")
+    try:
+        reap(children)
+    except KeyboardInterrupt:
+        stop_children(signal.SIGINT, None)
+        reap(children)
+
+
+def reap(children: List[int]) -> None:
+    """Waits for every child process to exit, removing each from
+    children once it has."""
+    while children:
+        try:
+            os.waitpid(children[0], 0)
+        except ChildProcessError:
+            pass
+        children.pop(0)
+
+
+def report_startup() -> None:
+    """Prints how long the server took to start."""
+    print(f"Started in {(time.perf_counter() - STARTED_AT) * 1000:.0f} ms")
 
 
 def is_flask_debug_enabled():
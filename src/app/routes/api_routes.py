@@ -1,11 +1,28 @@
+import tmdbsimple as tmdb
 from flask_login import current_user, login_required
-from ...services.login_service import get_session_id
+from ...services.catalog_service import movie_catalog
+from ...services.collaborative_service import ratings_log
+from ...services.facet_service import facet_index, get_browse_filters
+from ...services.login_service import get_account, get_session_id
+from ...services.movie_service import (
+    MOVIE_DETAIL_PARTS,
+    PERSON_DETAIL_PARTS,
+    ResourceNotFoundError,
+    get_account_states,
+    get_detail_bundle,
+    get_page_memberships,
+    update_account_state,
+)
+from ...services.mutation_service import mutation_queue
+from ...services.prefetch_service import prefetch_scheduler
+from ...services.projection_service import get_credits_page
+from ...services.search_service import search_index
 from ...constants.api_constants import API_ACCESS_TOKEN
+from ...constants.movie_constants import MAX_RATING, MIN_RATING
 from flask import jsonify, request
-import tmdbsimple as tmdb
 
 
-def set_up_api_routes(app, account: tmdb.Account):
+def set_up_api_routes(app):
     @app.route("/api/logged_in", methods=["GET"])
     def logged_in() -> str:
         print(current_user.is_authenticated)
@@ -21,23 +38,108 @@ def set_up_api_routes(app, account: tmdb.Account):
     def access_token() -> str:
         return {"access_token": API_ACCESS_TOKEN}
 
+    @app.route("/api/search/suggest", methods=["GET"])
+    def search_suggestions() -> str:
+        query = request.args.get("query", "")
+        search_index.index_catalog(movie_catalog)
+        return {"results": search_index.suggest(query)}
+
+    @app.route("/api/browse", methods=["GET"])
+    def browse_catalog() -> str:
+        try:
+            filters = get_browse_filters(request.args)
+            offset = max(int(request.args.get("offset", 0)), 0)
+            limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+        except ValueError as e:
+            return {"error": str(e)}, 400
+
+        page = facet_index.browse(**filters, offset=offset, limit=limit)
+        next_offset = offset + limit
+        if next_offset >= page["total"]:
+            next_offset = None
+        # Lets the /browse page mark the movies in the user's lists on
+        # the cards it loads from here.
+        account_states = (
+            get_account_states(get_account())
+            if current_user.is_authenticated
+            else {}
+        )
+        return {
+            **page,
+            "next_offset": next_offset,
+            "memberships": get_page_memberships(
+                account_states, page["results"]
+            ),
+        }
+
+    @app.route("/api/movie/<movie_id>/credits", methods=["GET"])
+    def movie_credits(movie_id: str) -> str:
+        """
+        Route for loading more of a movie's cast or crew than its page
+        shows, from the cached detail bundle.
+
+        Takes role ("cast" or "crew"), offset and limit (at most 100)
+        query parameters.
+        """
+        return get_credits_response(
+            tmdb.Movies(movie_id), MOVIE_DETAIL_PARTS, "credits"
+        )
+
+    @app.route("/api/person/<person_id>/credits", methods=["GET"])
+    def person_credits(person_id: str) -> str:
+        """
+        Route for loading more of a person's movies than their page
+        shows, with the same parameters as movie_credits.
+        """
+        return get_credits_response(
+            tmdb.People(person_id), PERSON_DETAIL_PARTS, "movie_credits"
+        )
+
+    @app.route("/api/prefetch/status", methods=["GET"])
+    def prefetch_status() -> str:
+        return prefetch_scheduler.status()
+
     @app.route("/rate_movie/", methods=["POST"])
     @login_required
     def rate() -> str:
         data = request.get_json()
-        movie_id = data.get("movie_id", None)
-        rating = data.get("rating", None)
 
         try:
-            tmdb.Movies(movie_id).rating(
-                value=rating, session_id=get_session_id()
+            movie_id = int(data.get("movie_id", None))
+            rating = float(data.get("rating", None))
+            if not MIN_RATING <= rating <= MAX_RATING:
+                raise ValueError(
+                    f"rating must be between {MIN_RATING} and {MAX_RATING}"
+                )
+            mutation_queue.enqueue(
+                get_session_id(), "rated", movie_id, True, rating=rating
+            )
+            update_account_state(
+                get_session_id(), "rated", movie_id, True, rating=rating
             )
-            print("successfully rated movie")
-            return jsonify(success=True)
         except Exception as e:
             print(f"error rating movie: {e}")
             return jsonify(success=False, error=str(e))
 
+        log_rating(movie_id, rating)
+        return jsonify(success=True)
+
+    @app.route("/delete_rating/", methods=["POST"])
+    @login_required
+    def delete_rating() -> str:
+        data = request.get_json()
+
+        try:
+            movie_id = int(data.get("movie_id", None))
+            mutation_queue.enqueue(get_session_id(), "rated", movie_id, False)
+            update_account_state(get_session_id(), "rated", movie_id, False)
+        except Exception as e:
+            print(f"error deleting movie rating: {e}")
+            return jsonify(success=False, error=str(e))
+
+        log_rating(movie_id, 0)
+        return jsonify(success=True)
+
     @app.route("/watchlist_movie/", methods=["POST"])
     @login_required
     def watchlist():
@@ -46,8 +148,15 @@ def set_up_api_routes(app, account: tmdb.Account):
         watchlist = data.get("watchlist", True)
 
         try:
-            account.watchlist(
-                media_type="movie", media_id=movie_id, watchlist=watchlist
+            mutation_queue.enqueue(
+                get_session_id(),
+                "watchlist",
+                movie_id,
+                watchlist,
+                account_id=get_account().id,
+            )
+            update_account_state(
+                get_session_id(), "watchlist", movie_id, watchlist
             )
             return jsonify(success=True)
         except Exception as e:
@@ -62,10 +171,48 @@ def set_up_api_routes(app, account: tmdb.Account):
         favorite = data.get("favorite", True)
 
         try:
-            account.favorite(
-                media_type="movie", media_id=movie_id, favorite=favorite
+            mutation_queue.enqueue(
+                get_session_id(),
+                "favorite",
+                movie_id,
+                favorite,
+                account_id=get_account().id,
+            )
+            update_account_state(
+                get_session_id(), "favorite", movie_id, favorite
             )
             return jsonify(success=True)
         except Exception as e:
             print(f"error adding movie to favorites: {e}")
             return jsonify(success=False, error=str(e))
+
+
+def get_credits_response(resource, parts, part: str):
+    """Reads the role, offset and limit query parameters and returns
+    that page of the credits in part of the resource's detail bundle,
+    or an error and 400 if they are malformed, or 404 if TMDB does not
+    know the resource."""
+    role = request.args.get("role", "cast")
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+        limit = min(max(int(request.args.get("limit", 20)), 1), 100)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if role not in ("cast", "crew"):
+        return {"error": "role must be cast or crew"}, 400
+
+    try:
+        credits = get_detail_bundle(resource, parts).get(part, {})
+    except ResourceNotFoundError as e:
+        return {"error": str(e)}, 404
+    return get_credits_page(credits, role, offset, limit)
+
+
+def log_rating(movie_id: int, rating: float) -> None:
+    """Records an accepted rating for the collaborative model, or 0 for
+    a deleted one. The rating is already queued for TMDB, so a failure
+    to record it is only reported."""
+    try:
+        ratings_log.append(get_account().id, movie_id, rating)
+    except Exception as e:
+        print(f"error logging rating: {e}")
@@ -1,12 +1,13 @@
 import tmdbsimple as tmdb
-from flask import redirect, request, url_for
+from flask import redirect, request, session, url_for
 from flask_login import LoginManager, login_user, logout_user
 
 from ...constants.api_constants import TOKEN_AUTH_URL
-from ...services.login_service import User
+from ...services.login_service import User, get_session_id
+from ...services.movie_service import clear_account_states
 
 
-def set_up_auth_routes(app, account: tmdb.Account, login_manager: LoginManager):
+def set_up_auth_routes(app, login_manager: LoginManager):
     @app.route("/login")
     def login() -> str:
         """
@@ -51,13 +52,16 @@ def set_up_auth_routes(app, account: tmdb.Account, login_manager: LoginManager):
         if session_id is not None:
             user = User(session_id)
             login_user(user, remember=True)
-            account.session_id = session_id
+            account = tmdb.Account(session_id)
             account.info()
+            session["account_id"] = account.id
 
         return redirect("/")
 
     @app.route("/logout")
     def logout() -> str:
+        clear_account_states(get_session_id())
+        session.pop("account_id", None)
         logout_user()
         return redirect("/")
 
@@ -0,0 +1,112 @@
+from typing import Optional
+
+from flask import Response, g, request, session
+from flask_login import current_user
+
+from ...constants.api_constants import (
+    PUBLIC_PAGE_MAX_AGE,
+    RESPONSE_CACHE_ENABLED,
+)
+from ...services.response_cache_service import response_cache
+
+# Endpoints that show every anonymous user the same response for the
+# same URL, which browsers, proxies and the response cache may then
+# keep. Logged-in users see their ratings and lists on the same pages,
+# so their copies are only ever cached privately.
+PUBLIC_ENDPOINTS = {
+    "home",
+    "cooking_movies",
+    "browse",
+    "genre_movies",
+    "search",
+    "in_theaters",
+    "top_rated",
+    "upcoming_movies",
+    "similar_movies",
+    "movie_page",
+    "person_page",
+    "search_suggestions",
+    "browse_catalog",
+    "movie_credits",
+    "person_credits",
+}
+CACHEABLE_METHODS = ("GET", "HEAD")
+
+
+def set_up_cache_routes(app):
+    @app.before_request
+    def serve_cached_response() -> Optional[Response]:
+        """
+        Serves a public page to an anonymous user from the response
+        cache without running its view, or 304 Not Modified if the
+        browser already has the same version of it.
+        """
+        if not RESPONSE_CACHE_ENABLED or not is_public_request():
+            return None
+
+        entry = response_cache.get(request.url, label=request.endpoint)
+        if entry is None:
+            return None
+
+        g.from_response_cache = True
+        response = Response(entry["data"], content_type=entry["content_type"])
+        response.set_etag(entry["etag"])
+        set_public(response)
+        return response.make_conditional(request)
+
+    @app.after_request
+    def add_cache_headers(response: Response) -> Response:
+        """
+        Tags every complete GET response with an ETag over its body and
+        answers a matching If-None-Match with 304 Not Modified.
+
+        Public pages served to anonymous users may be reused for
+        PUBLIC_PAGE_MAX_AGE seconds and are kept in the response cache.
+        Every other response is private and revalidated on each use.
+        Responses that set their own Cache-Control, such as images, are
+        left as they are.
+        """
+        if (
+            g.get("from_response_cache")
+            or request.method not in CACHEABLE_METHODS
+            or response.status_code != 200
+            or response.is_streamed
+            or "Cache-Control" in response.headers
+        ):
+            return response
+
+        response.add_etag()
+        # A page that changed the session is about to set a cookie, and
+        # must not be shared.
+        if is_public_request() and not session.modified:
+            set_public(response)
+            if RESPONSE_CACHE_ENABLED:
+                response_cache.set(
+                    request.url,
+                    response.get_data(),
+                    response.content_type,
+                    response.get_etag()[0],
+                )
+        else:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add("Cookie")
+        return response.make_conditional(request)
+
+
+def is_public_request() -> bool:
+    """Whether the current request is an anonymous read of a public
+    page."""
+    return (
+        request.method in CACHEABLE_METHODS
+        and request.endpoint in PUBLIC_ENDPOINTS
+        and not current_user.is_authenticated
+    )
+
+
+def set_public(response: Response) -> None:
+    """Lets browsers and proxies reuse an anonymous user's copy of a
+    page, but not serve it to a user with a session cookie."""
+    response.cache_control.public = True
+    response.cache_control.max_age = PUBLIC_PAGE_MAX_AGE
+    response.vary.add("Cookie")
@@ -0,0 +1,49 @@
+import mimetypes
+
+from flask import Response, abort, redirect, request
+
+from ...constants.api_constants import IMAGE_BASE_URL
+from ...services.image_service import get_image, is_valid_image
+
+# TMDB never changes the image behind a file name, so renditions can be
+# cached by browsers and proxies for a year.
+IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def set_up_image_routes(app):
+    @app.route("/image/<size>/<filename>")
+    def image(size: str, filename: str) -> Response:
+        """
+        Route for serving a TMDB image rendition through the local
+        disk cache.
+
+        Args:
+            size (str): The rendition, e.g. "w342". This is taken from
+                the URL.
+            filename (str): The TMDB image file name. This is taken
+                from the URL.
+
+        Returns:
+            The image, or 304 Not Modified if the browser already has
+            it. If TMDB cannot be reached, the browser is redirected to
+            TMDB's copy of the image.
+        """
+        if not is_valid_image(size, filename):
+            abort(404)
+
+        etag = f"{size}-{filename}"
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            content = get_image(size, filename)
+            if content is None:
+                return redirect(f"{IMAGE_BASE_URL}{size}/{filename}")
+            response = Response(
+                content, mimetype=mimetypes.guess_type(filename)[0]
+            )
+
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = IMAGE_MAX_AGE
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,50 @@
+import time
+
+from flask import Response, g, request
+
+from ...services.metrics_service import (
+    format_server_timing,
+    http_duration,
+    http_requests,
+    render_metrics,
+)
+
+
+def set_up_metrics_routes(app):
+    @app.before_request
+    def start_request_timer() -> None:
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def record_request(response: Response) -> Response:
+        """
+        Counts and times every response, and breaks its time down into
+        fetch, render and total in a Server-Timing header. Streamed
+        responses are timed up to their first byte.
+        """
+        started_at = g.get("request_started_at")
+        if started_at is None:
+            return response
+
+        seconds = time.perf_counter() - started_at
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        http_requests.inc(
+            route=route, method=request.method, status=response.status_code
+        )
+        http_duration.observe(seconds, route=route, method=request.method)
+
+        timings = {**g.get("server_timings", {}), "total": seconds}
+        response.headers["Server-Timing"] = format_server_timing(timings)
+        return response
+
+    @app.route("/metrics")
+    def metrics() -> Response:
+        """
+        Route for scraping the app's metrics.
+
+        Returns:
+            The metrics of this process in the Prometheus text format.
+        """
+        return Response(
+            render_metrics(), mimetype="text/plain; version=0.0.4"
+        )
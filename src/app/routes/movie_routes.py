@@ -1,45 +1,47 @@
 import tmdbsimple as tmdb
-from flask import redirect, request
+from flask import abort, redirect, request, url_for
 from flask_login import current_user, login_required
 
-from ...constants.api_constants import RECOMMENDED_MOVIES_URL, API_HEADERS
-from ...services.login_service import get_session_id
+from ...constants.api_constants import (
+    MIN_LOCAL_LIST_MOVIES,
+    MIN_LOCAL_SEARCH_RESULTS,
+    MIN_LOCAL_SIMILAR_MOVIES,
+    MIN_LOCAL_TOP_RATED_CATALOG,
+    MOVIE_CAST_PAGE_SIZE,
+    PERSON_CREDITS_PAGE_SIZE,
+)
+from ...constants.movie_constants import COOKING_KEYWORDS, GENRES
+from ...services.catalog_service import movie_catalog
+from ...services.collaborative_service import collaborative_model
+from ...services.facet_service import (
+    BROWSE_PAGE_SIZE,
+    facet_index,
+    get_browse_filters,
+)
+from ...services.login_service import get_account
 from ...services.movie_service import (
-    aggregate_pages,
+    MOVIE_DETAIL_PARTS,
+    PERSON_DETAIL_PARTS,
+    ResourceNotFoundError,
+    get_detail_bundle,
+    get_local_movies,
+    get_recommended_movies,
     render_template_page,
 )
-import requests
-
-GENRES = {
-    "action": 28,
-    "adventure": 12,
-    "animation": 16,
-    "comedy": 35,
-    "crime": 80,
-    "documentary": 99,
-    "drama": 18,
-    "family": 10751,
-    "fantasy": 14,
-    "history": 36,
-    "horror": 27,
-    "music": 10402,
-    "mystery": 9648,
-    "romance": 10749,
-    "science fiction": 878,
-}
-
-
-def set_up_movie_routes(
-    app,
-    account: tmdb.Account,
-):
+from ...services.projection_service import get_credits_page
+from ...services.recommendation_service import content_recommender
+from ...services.search_service import search_index
+from ...services.similarity_service import similarity_index
+
+
+def set_up_movie_routes(app):
     @app.route("/")
     def home() -> str:
         func = tmdb.Movies().popular
         logged_in = current_user.is_authenticated
         return render_template_page(
             "Popular Movies",
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
         )
@@ -48,14 +50,60 @@ def set_up_movie_routes(
     def cooking_movies() -> str:
         logged_in = current_user.is_authenticated
         func = tmdb.Discover().movie
-        keywords = "18293|6808|10637"
+        movies = facet_index.browse(
+            keywords=COOKING_KEYWORDS, limit=None, with_counts=False
+        )["results"]
         return render_template_page(
             "Cooking Movies",
-            account,
+            get_account(),
             func,
             pages=-1,
             logged_in=logged_in,
-            with_keywords=keywords,
+            movies=movies if len(movies) >= MIN_LOCAL_LIST_MOVIES else None,
+            with_keywords="|".join(map(str, COOKING_KEYWORDS)),
+        )
+
+    @app.route("/browse")
+    def browse() -> str:
+        """
+        Route for browsing the local catalog by any combination of
+        genres, keywords and release decades.
+
+        Takes the query parameters read by get_browse_filters, e.g.
+        /browse?genre=action,comedy&decade=1980,1990&sort_by=vote_average.
+
+        Returns:
+            A rendered template displaying the first BROWSE_PAGE_SIZE
+            matching movies, with a button that loads the next ones
+            from /api/browse. If the filters are malformed, the user is
+            redirected to an error page.
+        """
+        logged_in = current_user.is_authenticated
+        try:
+            filters = get_browse_filters(request.args)
+        except ValueError:
+            return redirect("/error")
+
+        page = facet_index.browse(**filters, with_counts=False)
+        next_offset = more_url = None
+        if page["total"] > BROWSE_PAGE_SIZE:
+            next_offset = BROWSE_PAGE_SIZE
+            more_url = url_for(
+                "browse_catalog",
+                **{
+                    name: value
+                    for name, value in request.args.items()
+                    if name != "offset"
+                },
+                limit=BROWSE_PAGE_SIZE,
+            )
+        return render_template_page(
+            "Browse Movies",
+            get_account(),
+            logged_in=logged_in,
+            movies=page["results"],
+            more_url=more_url,
+            next_offset=next_offset,
         )
 
     @app.route("/<genre>-movies")
@@ -78,11 +126,15 @@ def set_up_movie_routes(
         if genre_id is None:
             return redirect("/error")
 
+        movies = facet_index.browse(genres=[genre_id], with_counts=False)[
+            "results"
+        ]
         return render_template_page(
             f"Popular {genre.capitalize()} Movies",
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
+            movies=movies if len(movies) >= MIN_LOCAL_LIST_MOVIES else None,
             with_genres=genre_id,
         )
 
@@ -90,14 +142,8 @@ def set_up_movie_routes(
     @login_required
     def recommended_movies() -> str:
         logged_in = current_user.is_authenticated
-        func = requests.get
-        movies = aggregate_pages(
-            pages=5,
-            func=func,
-            url=RECOMMENDED_MOVIES_URL,
-            session_id=get_session_id(),
-            headers=API_HEADERS,
-        )
+        account = get_account()
+        movies = get_recommended_movies(account)
         return render_template_page(
             "Recommended Movies",
             account,
@@ -109,10 +155,10 @@ def set_up_movie_routes(
     @login_required
     def rated() -> str:
         logged_in = current_user.is_authenticated
-        func = account.rated_movies
+        func = get_account().rated_movies
         return render_template_page(
             "My Ratings",
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
         )
@@ -122,11 +168,14 @@ def set_up_movie_routes(
         query = request.args.get("query")
         logged_in = current_user.is_authenticated
         func = tmdb.Search().movie
+        search_index.index_catalog(movie_catalog)
+        movies = search_index.search(query)
         return render_template_page(
             "Results for " + query,
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
+            movies=movies if len(movies) >= MIN_LOCAL_SEARCH_RESULTS else None,
             query=query,
         )
 
@@ -136,7 +185,7 @@ def set_up_movie_routes(
         func = tmdb.Movies().now_playing
         return render_template_page(
             "In Theaters Now",
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
         )
@@ -147,9 +196,14 @@ def set_up_movie_routes(
         func = tmdb.Movies().top_rated
         return render_template_page(
             "Top Rated Movies",
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
+            movies=(
+                movie_catalog.top_rated()
+                if len(movie_catalog) >= MIN_LOCAL_TOP_RATED_CATALOG
+                else None
+            ),
         )
 
     @app.route("/upcoming-movies")
@@ -158,7 +212,7 @@ def set_up_movie_routes(
         func = tmdb.Movies().upcoming
         return render_template_page(
             "Upcoming Movies",
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
         )
@@ -167,10 +221,10 @@ def set_up_movie_routes(
     @login_required
     def watchlist_movies():
         logged_in = current_user.is_authenticated
-        func = account.watchlist_movies
+        func = get_account().watchlist_movies
         return render_template_page(
             "My Watchlist",
-            account,
+            get_account(),
             func,
             pages=-1,
             logged_in=logged_in,
@@ -178,51 +232,96 @@ def set_up_movie_routes(
 
     @app.route("/similar-movies/<movie_id>/")
     def similar_movies(movie_id: str) -> str:
+        """
+        Route for displaying movies similar to a movie.
+
+        Movies rated alike by local users are listed first, then movies
+        with similar genres and keywords from the local catalog, and
+        TMDB's similar movies if neither knows the movie well enough.
+        The optional genre (a name or ID), min_year and max_year query
+        parameters filter the catalog's similar movies.
+
+        Args:
+            movie_id (str): The ID of the movie. This is taken from the
+                URL.
+        """
         logged_in = current_user.is_authenticated
         movie_title = request.args.get("title")
         func = tmdb.Movies(movie_id).similar_movies
+        filters = {
+            "genre_id": GENRES.get(request.args.get("genre"))
+            or request.args.get("genre", type=int),
+            "min_year": request.args.get("min_year", type=int),
+            "max_year": request.args.get("max_year", type=int),
+        }
+        is_filtered = any(value is not None for value in filters.values())
+
+        movies = []
+        if not is_filtered:
+            movies = get_local_movies(collaborative_model.similar(movie_id))
+        if len(movies) < MIN_LOCAL_SIMILAR_MOVIES:
+            movies = movie_catalog.get_movies(
+                similarity_index.similar(movie_id, **filters)
+            )
+        # Filtered results are shown however few there are, as TMDB's
+        # similar movies cannot be filtered.
+        if len(movies) < MIN_LOCAL_SIMILAR_MOVIES and not (
+            is_filtered and movie_id in similarity_index
+        ):
+            movies = None
         return render_template_page(
             "Movies Similar to " + movie_title,
-            account,
+            get_account(),
             func,
             logged_in=logged_in,
+            movies=movies,
         )
 
     @app.route("/movie/<movie_id>/")
     def movie_page(movie_id: str) -> str:
         logged_in = current_user.is_authenticated
-        movie = tmdb.Movies(movie_id)
-        movies = movie.info()
-        cast = movie.credits()
-        media = movie.videos()
+        try:
+            bundle = get_detail_bundle(
+                tmdb.Movies(movie_id), MOVIE_DETAIL_PARTS
+            )
+        except ResourceNotFoundError:
+            abort(404)
+        content_recommender.add_movie_details(
+            bundle["info"], bundle["credits"], bundle["keywords"]
+        )
         return render_template_page(
             "",
-            account,
-            movies=movies,
+            get_account(),
+            movies=bundle["info"],
             template_name="movie_details.html",
             pages=1,
             logged_in=logged_in,
-            movie_cast=cast,
-            media_items=media,
+            movie_cast=get_credits_page(
+                bundle["credits"], limit=MOVIE_CAST_PAGE_SIZE
+            ),
+            media_items=bundle["videos"],
         )
 
     @app.route("/person/<person_id>/")
     def person_page(person_id: str) -> str:
         logged_in = current_user.is_authenticated
-        person = tmdb.People(person_id)
-        info = person.info()
-        portraits = person.images()
-        tagged_images = person.tagged_images()
-        movie_credits = person.movie_credits()
+        try:
+            bundle = get_detail_bundle(
+                tmdb.People(person_id), PERSON_DETAIL_PARTS
+            )
+        except ResourceNotFoundError:
+            abort(404)
 
         return render_template_page(
             "",
-            account,
+            get_account(),
             template_name="person_details.html",
             pages=1,
             logged_in=logged_in,
-            person_info=info,
-            person_portraits=portraits,
-            person_tagged_images=tagged_images,
-            person_movie_credits=movie_credits,
+            person_info=bundle["info"],
+            person_portraits=bundle["images"],
+            person_tagged_images=bundle["tagged_images"],
+            person_movie_credits=get_credits_page(
+                bundle["movie_credits"], limit=PERSON_CREDITS_PAGE_SIZE
+            ),
         )
@@ -9,6 +9,24 @@ const fetchJSON = async url => {
 const fetchLoggedInStatus = () => fetchJSON('/api/logged_in')
     .then(data => data.logged_in);
 
+// Width-based TMDB renditions served by the /image/ endpoint.
+const IMAGE_WIDTHS = [92, 154, 185, 342, 500, 780];
+
+// Shown in place of a poster, portrait or backdrop that TMDB has none of.
+const NO_IMAGE_URL = "https://www.allianceplast.com/wp-content/uploads/2017/11/no-image.png";
+
+const imageUrl = (path, size) => path ? `/image/${size}${path}` : NO_IMAGE_URL;
+
+function setResponsiveImage(image, path, sizes, fallbackWidth = 342) {
+    if (!path) {
+        image.src = NO_IMAGE_URL;
+        return;
+    }
+    image.src = imageUrl(path, `w${fallbackWidth}`);
+    image.srcset = IMAGE_WIDTHS.map(width => `${imageUrl(path, `w${width}`)} ${width}w`).join(', ');
+    image.sizes = sizes;
+}
+
 function formatDate(movie_release_date) {
     let date = new Date(movie_release_date);
 
@@ -34,6 +52,12 @@ function formatDate(movie_release_date) {
     return formattedDate;
 }
 
+// A movie's entry in a page's memberships index, keyed by movie ID.
+// Movies in none of the user's lists are left out of the index.
+const EMPTY_MEMBERSHIP = { rating: null, watchlisted: false, favorited: false };
+
+const getMembership = (memberships, movieId) => (memberships || {})[movieId] || EMPTY_MEMBERSHIP;
+
 function similarMovieRedirect(movieId, movieTitle) {
     window.location.href = `/similar-movies/${movieId}/?title=${movieTitle}`;
 }
@@ -116,6 +140,29 @@ function createButton(className, textContent, eventListener) {
     return button;
 }
 
+// Adds a button after container that loads the next page of credits
+// from creditsUrl on each click and passes them to onCredits, until
+// there are none left.
+function addShowMoreButton(container, creditsUrl, nextOffset, onCredits) {
+    if (nextOffset === null) return;
+    const button = createButton('show-more-button', 'Show More', async () => {
+        button.disabled = true;
+        try {
+            const page = await fetchJSON(`${creditsUrl}?offset=${nextOffset}`);
+            onCredits(page.results);
+            nextOffset = page.next_offset;
+        } catch (error) {
+            console.error(error);
+        }
+        if (nextOffset === null) {
+            button.remove();
+        } else {
+            button.disabled = false;
+        }
+    });
+    container.after(button);
+}
+
 function createStarContainer(movieData, userRating, movieCard, pathname, cardButtons) {
     const starContainer = document.createElement('div');
     starContainer.classList.add('stars');
@@ -190,23 +237,9 @@ function displayDeleteRatingButton(movieId, movieCard, pathname, cardButtons) {
     }
 }
 
-const getSessionId = () => fetchJSON('/api/session_id')
-    .then(data => data.session_id || Promise.reject('Error fetching session ID: session ID is empty'));
-
-const getAuth = () => fetchJSON('/api/token')
-    .then(data => data.access_token || Promise.reject('Error fetching access token: access token is empty'));
-
 async function deleteRating(movieId, movieCard) {
     try {
-        const [sessionId, auth] = await Promise.all([getSessionId(), getAuth()]);
-        const response = await fetch(`https://api.themoviedb.org/3/movie/${movieId}/rating?session_id=${sessionId}`, {
-            method: 'DELETE',
-            headers: {
-                'accept': 'application/json',
-                'Authorization': `Bearer ${auth}`
-            },
-        });
-        const data = await response.json();
+        const data = await flask_post_request("delete_rating/", { movie_id: movieId });
         if (data.success) {
             console.info('Successfully deleted movie rating:', movieId);
             resetStarColor(movieCard);
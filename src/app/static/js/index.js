@@ -1,18 +1,152 @@
 document.addEventListener('DOMContentLoaded', () => {
-    const parsedElements = ['json-data', 'rated-movies', 'favorite-movies', 'watchlist-movies']
+    const parsedElements = ['json-data', 'memberships']
         .map(id => [id, JSON.parse(document.getElementById(id).textContent)]);
     const parsedData = Object.fromEntries(parsedElements);
-    const { 'json-data': movies, 'rated-movies': ratedMovies, 'favorite-movies': favoriteMovies, 'watchlist-movies': watchlistMovies } = parsedData;
+    const { 'json-data': movies, 'memberships': memberships } = parsedData;
+
+    const { listUrl, nextCursor, streamUrl, moreUrl, nextOffset } = document.getElementById('movie-list').dataset;
 
     fetchLoggedInStatus()
-        .then(isLoggedIn => displayMovies(movies, isLoggedIn, ratedMovies, favoriteMovies, watchlistMovies))
+        .then(isLoggedIn => {
+            const onBatch = (batch, batchMemberships) => displayMovies(batch, isLoggedIn, batchMemberships);
+            onBatch(movies, memberships);
+            if (listUrl) {
+                loadMoviesOnScroll(listUrl, nextCursor, onBatch);
+            } else if (streamUrl) {
+                return streamMovies(streamUrl, onBatch);
+            } else if (moreUrl) {
+                loadMoviesOnClick(moreUrl, nextOffset, onBatch);
+            }
+        })
         .catch(console.error);
+
+    setUpSearchSuggestions();
 });
 
-function displayMovies(movies, isLoggedIn, ratedMovies, favoriteMovies, watchlistMovies) {
+function setUpSearchSuggestions() {
+    const searchField = document.querySelector('#search-bar input[name="query"]');
+    const suggestionList = document.getElementById('search-suggestions');
+    let latestQuery = '';
+
+    searchField.addEventListener('input', () => {
+        const query = searchField.value.trim();
+        latestQuery = query;
+        if (query.length < 2) {
+            suggestionList.replaceChildren();
+            return;
+        }
+
+        fetchJSON(`/api/search/suggest?query=${encodeURIComponent(query)}`)
+            .then(data => {
+                if (query !== latestQuery) return;
+                const options = data.results.map(movie => {
+                    const option = document.createElement('option');
+                    option.value = movie.title;
+                    return option;
+                });
+                suggestionList.replaceChildren(...options);
+            })
+            .catch(console.error);
+    });
+}
+
+// Loads the pages after the one the page was rendered with, starting
+// from its cursor.
+function loadMoviesOnScroll(listUrl, nextCursor, onBatch) {
+    const sentinel = document.createElement('div');
+    sentinel.id = 'movie-list-end';
+    document.getElementById('movie-list').after(sentinel);
+
+    let cursor = nextCursor;
+    let loading = false;
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    }, { rootMargin: '800px' });
+
+    async function loadNextPage() {
+        if (loading || cursor === null) return;
+        loading = true;
+        try {
+            const data = await fetchJSON(`${listUrl}&cursor=${encodeURIComponent(cursor)}`);
+            onBatch(data.results, data.memberships);
+            cursor = data.next_cursor;
+        } catch (error) {
+            console.error(error);
+            cursor = null;
+        }
+        loading = false;
+
+        // Observe again so a sentinel that is still in view after a
+        // short page triggers the next load.
+        observer.unobserve(sentinel);
+        if (cursor !== null) {
+            observer.observe(sentinel);
+        }
+    }
+
+    observer.observe(sentinel);
+}
+
+// Adds a button under the movies that loads the next batch from an
+// offset-paginated API such as /api/browse, until there are no more.
+function loadMoviesOnClick(moreUrl, nextOffset, onBatch) {
+    const button = document.createElement('button');
+    button.id = 'load-more-button';
+    button.classList.add('submit-button');
+    button.textContent = 'Load More';
+    document.getElementById('movie-list').after(button);
+
+    let offset = nextOffset;
+
+    button.addEventListener('click', async () => {
+        button.disabled = true;
+        try {
+            const data = await fetchJSON(`${moreUrl}&offset=${encodeURIComponent(offset)}`);
+            onBatch(data.results, data.memberships);
+            offset = data.next_offset;
+        } catch (error) {
+            console.error(error);
+        }
+        button.disabled = false;
+        if (offset === null) {
+            button.remove();
+        }
+    });
+}
+
+async function streamMovies(url, onBatch) {
+    const response = await fetch(url, { headers: { 'Accept': 'application/x-ndjson' } });
+    if (!response.ok) {
+        throw new Error(`Error with fetch call, HTTP status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => onPage(JSON.parse(line)));
+    }
+    if (buffer.trim()) {
+        onPage(JSON.parse(buffer));
+    }
+
+    function onPage(page) {
+        onBatch(page.results, page.memberships);
+    }
+}
+
+function displayMovies(movies, isLoggedIn, memberships) {
     if (Array.isArray(movies)) {
         movies.forEach((movie) => {
-            const movieCard = createMovieCard(movie, isLoggedIn, ratedMovies, favoriteMovies, watchlistMovies);
+            const movieCard = createMovieCard(movie, isLoggedIn, getMembership(memberships, movie.id));
             document.getElementById('movie-list').append(movieCard);
         });
     } else {
@@ -20,13 +154,13 @@ function displayMovies(movies, isLoggedIn, ratedMovies, favoriteMovies, watchlis
     }
 }
 
-function createMovieCard(movie, isLoggedIn, ratedMovies, favoriteMovies, watchlistMovies) {
+function createMovieCard(movie, isLoggedIn, membership) {
     const movieCard = document.createElement('div');
     movieCard.classList.add('movie-card');
 
     const moviePoster = document.createElement('img');
     moviePoster.classList.add('movie-poster');
-    moviePoster.src = "https://image.tmdb.org/t/p/original/" + movie.poster_path;
+    setResponsiveImage(moviePoster, movie.poster_path, '(max-width: 600px) 150px, 200px', 185);
 
     const movieInfo = document.createElement('div');
     movieInfo.classList.add('movie-info');
@@ -65,12 +199,9 @@ function createMovieCard(movie, isLoggedIn, ratedMovies, favoriteMovies, watchli
 
     // If the user is logged in, create and append the Rate Movie button
     if (isLoggedIn) {
-        const userRating = ratedMovies.find(ratedMovie => ratedMovie.id === movie.id)?.rating;
-        const watchlist = watchlistMovies.find(watchlistMovie => watchlistMovie.id === movie.id);
-        const favorite = favoriteMovies.find(favoriteMovie => favoriteMovie.id === movie.id);
-
-        const inWatchlist = watchlist !== undefined;
-        const inFavorites = favorite !== undefined;
+        const userRating = membership.rating;
+        const inWatchlist = membership.watchlisted;
+        const inFavorites = membership.favorited;
         const starContainer = createStarContainer(movie, userRating, movieCard, window.location.pathname, cardButtons);
 
         if (userRating) {
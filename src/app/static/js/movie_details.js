@@ -1,25 +1,24 @@
 document.addEventListener('DOMContentLoaded', () => {
-    const parsedElements = ['movie-details', 'account-states', 'movie-cast', 'media-items']
+    const parsedElements = ['movie-details', 'memberships', 'movie-cast', 'media-items']
         .map(id => [id, JSON.parse(document.getElementById(id).textContent)]);
     const parsedData = Object.fromEntries(parsedElements);
-    const { 'movie-details': movieDetails, 'account-states': accountStates, 'movie-cast': movieCast, 'media-items': mediaItems } = parsedData;
+    const { 'movie-details': movieDetails, 'memberships': memberships, 'movie-cast': movieCast, 'media-items': mediaItems } = parsedData;
     console.log(movieDetails);
 
     fetchLoggedInStatus()
-        .then(isLoggedIn => displayMovieDetailPage(isLoggedIn, movieDetails, accountStates, movieCast, mediaItems))
+        .then(isLoggedIn => displayMovieDetailPage(isLoggedIn, movieDetails, memberships, movieCast, mediaItems))
         .catch(console.error);
 });
 
-function displayMovieDetailPage(isLoggedIn, movieDetails, accountStates, movieCast, mediaItems) {
-    createMovieDetails(isLoggedIn, movieDetails, accountStates);
-    movieCast = movieCast.cast;
-    if (Array.isArray(movieCast)) {
-        // Iterate only up to the first ten items
-        for (let i = 0; i < Math.min(movieCast.length, 10); i++) {
-            const castMember = movieCast[i];
-            const castCard = createCastCard(castMember);
-            document.getElementById('main-cast').append(castCard);
-        }
+function displayMovieDetailPage(isLoggedIn, movieDetails, memberships, movieCast, mediaItems) {
+    createMovieDetails(isLoggedIn, movieDetails, getMembership(memberships, movieDetails.id));
+    if (Array.isArray(movieCast.results)) {
+        const mainCast = document.getElementById('main-cast');
+        const appendCastCards = cast => cast.forEach(castMember => {
+            mainCast.append(createCastCard(castMember));
+        });
+        appendCastCards(movieCast.results);
+        addShowMoreButton(mainCast, `/api/movie/${movieDetails.id}/credits`, movieCast.next_offset, appendCastCards);
     } else {
         console.error('Error fetching cast:', "cast is not an array");
     }
@@ -32,7 +31,7 @@ function displayMovieDetailPage(isLoggedIn, movieDetails, accountStates, movieCa
     }
 }
 
-function createMovieDetails(isLoggedIn, movieDetails, accountStates) {
+function createMovieDetails(isLoggedIn, movieDetails, membership) {
     const movie = movieDetails;
 
     const movieCard = document.createElement('div');
@@ -40,7 +39,7 @@ function createMovieDetails(isLoggedIn, movieDetails, accountStates) {
 
     const moviePoster = document.createElement('img');
     moviePoster.classList.add('movie-details-poster');
-    moviePoster.src = "https://image.tmdb.org/t/p/original/" + movie.poster_path;
+    setResponsiveImage(moviePoster, movie.poster_path, '(max-width: 600px) 50vw, 360px', 342);
 
     const movieInfo = document.createElement('div');
     movieInfo.classList.add('movie-details-info');
@@ -86,11 +85,9 @@ function createMovieDetails(isLoggedIn, movieDetails, accountStates) {
 
     // If the user is logged in, create and append the Rate Movie button
     if (isLoggedIn) {
-        console.log(accountStates);
-        ratedMovies = accountStates.rated;
-        const userRating = ratedMovies.find(ratedMovie => ratedMovie.id === movie.id)?.rating;
-        const inWatchlist = accountStates.watchlist;
-        const inFavorites = accountStates.favorite;
+        const userRating = membership.rating;
+        const inWatchlist = membership.watchlisted;
+        const inFavorites = membership.favorited;
         const starContainer = createStarContainer(movie, userRating, movieCard, window.location.pathname, cardButtons);
 
         starContainer.classList.add('movie-details-star-container');
@@ -108,7 +105,9 @@ function createMovieDetails(isLoggedIn, movieDetails, accountStates) {
     movieInfo.append(cardButtons, movieTagline, OverviewText, movieDescription);
 
     document.getElementById('banner-wrapped').append(movieCard);
-    document.getElementById('banner-div').style.backgroundImage = "url('https://image.tmdb.org/t/p/original/" + movie.backdrop_path + "')";
+    if (movie.backdrop_path) {
+        document.getElementById('banner-div').style.backgroundImage = "url('" + imageUrl(movie.backdrop_path, 'w1280') + "')";
+    }
 }
 
 function createCastCard(castMember) {
@@ -117,10 +116,7 @@ function createCastCard(castMember) {
 
     const castImage = document.createElement('img');
     castImage.classList.add('cast-image');
-    if (castMember.profile_path == null) {
-        castImage.src = "https://www.allianceplast.com/wp-content/uploads/2017/11/no-image.png";
-    }
-    else { castImage.src = "https://image.tmdb.org/t/p/original/" + castMember.profile_path; }
+    setResponsiveImage(castImage, castMember.profile_path, '(max-width: 600px) 30vw, 18vw', 185);
 
 
     const castInfo = document.createElement('div');
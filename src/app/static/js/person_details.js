@@ -17,11 +17,9 @@ function displayPersonDetailPage(personDetails, personPortraits, personTaggedIma
 
 function createPersonDetails(personDetails, personPortraits, personTaggedImages, personMovieCredits) {
     const person = personDetails;
-    const portraitPath = "https://image.tmdb.org/t/p/original" + person.profile_path;
-
     const personPortrait = document.createElement('img');
     personPortrait.classList.add('person-portrait');
-    personPortrait.src = portraitPath;
+    setResponsiveImage(personPortrait, person.profile_path, '(max-width: 1000px) 200px, 400px', 500);
 
     const personInfo = document.createElement('div');
     personInfo.classList.add('person-info');
@@ -42,7 +40,7 @@ function createPersonDetails(personDetails, personPortraits, personTaggedImages,
     document.getElementById('person-banner-wrapped').append(personPortrait, personInfo);
     createPersonImages(personPortraits);
     createPersonTaggedImages(personTaggedImages);
-    createPersonMovieCredits(personMovieCredits);
+    createPersonMovieCredits(personMovieCredits, person.id);
 }
 
 function createPersonImages(personPortraits) {
@@ -53,10 +51,9 @@ function createPersonImages(personPortraits) {
 
     if (Array.isArray(personPortraits)) {
         personPortraits.forEach(portrait => {
-            let portraitPath = "https://image.tmdb.org/t/p/original" + portrait.file_path;
             let portraitImage = document.createElement('img');
             portraitImage.classList.add('person-image');
-            portraitImage.src = portraitPath;
+            setResponsiveImage(portraitImage, portrait.file_path, '(max-width: 600px) 100vw, 20vw', 342);
             portraitContainer.append(portraitImage);
         });
     }
@@ -72,10 +69,9 @@ function createPersonTaggedImages(personTaggedImages) {
 
     if (Array.isArray(personTaggedImages)) {
         personTaggedImages.forEach(image => {
-            let taggedImagePath = "https://image.tmdb.org/t/p/original" + image.file_path;
             let taggedImage = document.createElement('img');
             taggedImage.classList.add('person-tagged-image');
-            taggedImage.src = taggedImagePath;
+            setResponsiveImage(taggedImage, image.file_path, '(max-width: 600px) 100vw, 20vw', 342);
             taggedImagesContainer.append(taggedImage);
         });
     }
@@ -83,22 +79,25 @@ function createPersonTaggedImages(personTaggedImages) {
 
 }
 
-function createPersonMovieCredits(personMovieCredits) {
-    personMovieCredits = personMovieCredits.cast;
+function createPersonMovieCredits(personMovieCredits, personId) {
     console.log("personMovieCredits: ", personMovieCredits)
 
     const movieCreditContainer = document.createElement('div');
     movieCreditContainer.classList.add('person-movie-credit-container');
 
-    if (Array.isArray(personMovieCredits)) {
-        personMovieCredits.forEach(movieCredit => {
-            if (createMovieCreditDiv(movieCredit) == null) {
-                return;
-            }
-            movieCreditContainer.append(createMovieCreditDiv(movieCredit));
-        });
+    const appendMovieCredits = movieCredits => movieCredits.forEach(movieCredit => {
+        const movieCreditDiv = createMovieCreditDiv(movieCredit);
+        if (movieCreditDiv == null) {
+            return;
+        }
+        movieCreditContainer.append(movieCreditDiv);
+    });
+
+    if (Array.isArray(personMovieCredits.results)) {
+        appendMovieCredits(personMovieCredits.results);
     }
     document.getElementById('person-movie-credit-div').append(movieCreditContainer);
+    addShowMoreButton(movieCreditContainer, `/api/person/${personId}/credits`, personMovieCredits.next_offset, appendMovieCredits);
 }
 
 function createMovieCreditDiv(movieCredit) {
@@ -114,7 +113,7 @@ function createMovieCreditDiv(movieCredit) {
         return;
     }
 
-    moviePoster.src = "https://image.tmdb.org/t/p/w150_and_h225_bestv2" + movieCredit.poster_path;
+    setResponsiveImage(moviePoster, movieCredit.poster_path, '150px', 154);
     movieLink.href = "/movie/" + movieCredit.id;
     movieLink.append(moviePoster);
     movie.append(movieLink, movieName);
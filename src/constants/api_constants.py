@@ -7,22 +7,201 @@ import os
 load_dotenv()
 
 API_KEY = os.getenv("API_KEY")
-if not API_KEY:
-    raise ValueError("API_KEY is not set in .env file")
-
 API_ACCESS_TOKEN = os.getenv("API_ACCESS_TOKEN")
-if not API_ACCESS_TOKEN:
-    raise ValueError("API_ACCESS_TOKEN is not set in .env file")
-
 ACCOUNT_OBJECT_ID = os.getenv("ACCOUNT_OBJECT_ID")
-if not ACCOUNT_OBJECT_ID:
-    raise ValueError("ACCOUNT_OBJECT_ID is not set in .env file")
+# Checked by validate_settings when the app is created, rather than on
+# import, so that modules can be imported without a .env file.
+REQUIRED_SETTINGS = ["API_KEY", "API_ACCESS_TOKEN", "ACCOUNT_OBJECT_ID"]
 
 ACCOUNT_ID = os.getenv("ACCOUNT_ID")
 
+# Must be shared by every worker process so that sessions created by
+# one worker are accepted by the others.
+SECRET_KEY = os.getenv("SECRET_KEY")
+
+MAX_CONCURRENT_PAGE_REQUESTS = int(
+    os.getenv("MAX_CONCURRENT_PAGE_REQUESTS", 5)
+)
+
+# Where /recommendations comes from: "tmdb", "local" (the in-process
+# content and collaborative recommenders) or "blended" (both,
+# interleaved).
+RECOMMENDATION_SOURCE = os.getenv("RECOMMENDATION_SOURCE", "blended")
+# The most movies the content recommender keeps, dropping the least
+# recently seen first.
+CONTENT_RECOMMENDER_MAX_MOVIES = int(
+    os.getenv("CONTENT_RECOMMENDER_MAX_MOVIES", 50000)
+)
+# The most often, in seconds, the content recommender rebuilds its index
+# after movies change. The previous index is used in between.
+CONTENT_RECOMMENDER_REBUILD_INTERVAL = float(
+    os.getenv("CONTENT_RECOMMENDER_REBUILD_INTERVAL", 60)
+)
+
+# Directory of the local movie catalog built by
+# `python -m src.services.catalog_service`.
+CATALOG_DIR = os.getenv("CATALOG_DIR", "catalog")
+
+# /search falls back to TMDB when the local index finds fewer movies.
+MIN_LOCAL_SEARCH_RESULTS = int(os.getenv("MIN_LOCAL_SEARCH_RESULTS", 20))
+# The most movies the search index keeps, dropping the least recently
+# indexed first.
+SEARCH_INDEX_MAX_MOVIES = int(os.getenv("SEARCH_INDEX_MAX_MOVIES", 500000))
+# The genre and cooking pages fall back to TMDB when the catalog has
+# fewer matching movies, as a catalog of only the most popular movies
+# holds a few of each genre. /top-rated falls back to TMDB while the
+# catalog holds fewer movies in all, since its best rated are then
+# only the best rated of the most popular.
+MIN_LOCAL_LIST_MOVIES = int(os.getenv("MIN_LOCAL_LIST_MOVIES", 100))
+MIN_LOCAL_TOP_RATED_CATALOG = int(
+    os.getenv("MIN_LOCAL_TOP_RATED_CATALOG", 10000)
+)
+
+# Whether list pages are rendered with their first page of movies and
+# let the browser load the next ones one page at a time as the user
+# scrolls, or else send their shell first and stream the whole movie
+# grid page by page.
+INFINITE_SCROLL = os.getenv("INFINITE_SCROLL", "True").lower() == "true"
+STREAM_MOVIE_GRIDS = os.getenv("STREAM_MOVIE_GRIDS", "True").lower() == "true"
+
+# Credits embedded in a movie or person page, best billed or best known
+# first. The browser loads the rest from /api/movie/<id>/credits or
+# /api/person/<id>/credits when asked to.
+MOVIE_CAST_PAGE_SIZE = int(os.getenv("MOVIE_CAST_PAGE_SIZE", 10))
+PERSON_CREDITS_PAGE_SIZE = int(os.getenv("PERSON_CREDITS_PAGE_SIZE", 40))
+
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(
+    os.getenv("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+)
+
+DETAIL_PART_TIMEOUT = float(os.getenv("DETAIL_PART_TIMEOUT", 5))
+
+# Upstream HTTP client. The pool must be at least as large as the number
+# of TMDB calls in flight at once across all request threads, and the
+# rate limit stays under TMDB's own (roughly 50 requests per second).
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", 20))
+UPSTREAM_TIMEOUT = (
+    float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 3.05)),
+    float(os.getenv("UPSTREAM_READ_TIMEOUT", 10)),
+)
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", 3))
+UPSTREAM_RATE_LIMIT = float(os.getenv("UPSTREAM_RATE_LIMIT", 40))
+# Whether TMDB calls run as coroutines on one shared event loop with an
+# async HTTP client instead of on a thread per call. Enabled by default
+# when serving through src.app.asgi.
+ASYNC_UPSTREAM = os.getenv("ASYNC_UPSTREAM", "False").lower() == "true"
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_MAX_CONNECTIONS", 100))
+ASGI_WORKER_THREADS = int(os.getenv("ASGI_WORKER_THREADS", 64))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", 30))
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("CACHE_PATH", "cache.sqlite3")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 2048))
+CACHE_STALE_TTL = int(os.getenv("CACHE_STALE_TTL", 3600))
+
+# CACHING ==============================================================
+# Seconds a page of a public, non-user-specific TMDB list stays fresh.
+# Endpoints missing from this map (account lists, v4 recommendations)
+# are never cached.
+PAGE_CACHE_TTLS = {
+    "Movies.popular": 600,
+    "Movies.now_playing": 1800,
+    "Movies.upcoming": 1800,
+    "Movies.top_rated": 3600,
+    "Movies.similar_movies": 3600,
+    "Discover.movie": 1800,
+    "Search.movie": 300,
+}
+
+# Seconds a complete movie or person detail bundle stays fresh.
+DETAIL_CACHE_TTL = int(os.getenv("DETAIL_CACHE_TTL", 21600))
+
+# Seconds a user's rated, watchlist and favorite lists stay fresh, and
+# how much longer they may be served while refreshing in the background.
+ACCOUNT_STATES_TTL = 300
+ACCOUNT_STATES_STALE_TTL = 86400
+
+# HTTP CACHING =========================================================
+# Seconds browsers and proxies may reuse a public page served to an
+# anonymous user before revalidating it with its ETag.
+PUBLIC_PAGE_MAX_AGE = int(os.getenv("PUBLIC_PAGE_MAX_AGE", 60))
+# Whether public pages rendered for anonymous users are kept in memory
+# for RESPONSE_CACHE_TTL seconds and served again without rendering.
+RESPONSE_CACHE_ENABLED = (
+    os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+)
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 60))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 512))
+
+# WRITE-BEHIND =========================================================
+# Rating, watchlist and favorite changes are acknowledged at once and
+# written to TMDB in the background, MUTATION_FLUSH_DELAY seconds after
+# the last change to the same movie. Pending writes are kept in
+# MUTATION_QUEUE_PATH until TMDB accepts them.
+MUTATION_QUEUE_PATH = os.getenv("MUTATION_QUEUE_PATH", "mutations.sqlite3")
+MUTATION_FLUSH_DELAY = float(os.getenv("MUTATION_FLUSH_DELAY", 2))
+MUTATION_MAX_ATTEMPTS = int(os.getenv("MUTATION_MAX_ATTEMPTS", 8))
+
+# COLLABORATIVE FILTERING ==============================================
+# Ratings submitted through the app are appended to RATINGS_LOG_PATH.
+# `python -m src.services.collaborative_service --watch` trains a
+# matrix factorization model on them into CF_MODEL_DIR, which
+# /recommendations and /similar-movies read.
+RATINGS_LOG_PATH = os.getenv("RATINGS_LOG_PATH", "ratings.log")
+CF_MODEL_DIR = os.getenv("CF_MODEL_DIR", "cf_model")
+CF_FACTORS = int(os.getenv("CF_FACTORS", 32))
+CF_REGULARIZATION = float(os.getenv("CF_REGULARIZATION", 0.1))
+CF_ITERATIONS = int(os.getenv("CF_ITERATIONS", 15))
+CF_TRAIN_INTERVAL = float(os.getenv("CF_TRAIN_INTERVAL", 300))
+# Neighbours kept per movie, among movies with at least CF_MIN_RATINGS
+# ratings; movies with fewer are neither recommended nor listed.
+CF_NEIGHBORS = int(os.getenv("CF_NEIGHBORS", 50))
+CF_MIN_RATINGS = int(os.getenv("CF_MIN_RATINGS", 5))
+# /similar-movies falls back to TMDB when the model finds fewer movies.
+MIN_LOCAL_SIMILAR_MOVIES = int(os.getenv("MIN_LOCAL_SIMILAR_MOVIES", 10))
+
+# SIMILAR MOVIES =======================================================
+# The index of catalog movie embeddings that /similar-movies searches,
+# rebuilt after each catalog ingestion. Catalogs of more than
+# SIMILARITY_BRUTE_FORCE_LIMIT movies are split into about sqrt(n)
+# lists, of which a query scans the SIMILARITY_PROBES nearest.
+SIMILARITY_INDEX_DIR = os.getenv("SIMILARITY_INDEX_DIR", "similarity_index")
+SIMILARITY_DIMENSIONS = int(os.getenv("SIMILARITY_DIMENSIONS", 64))
+SIMILARITY_BRUTE_FORCE_LIMIT = int(
+    os.getenv("SIMILARITY_BRUTE_FORCE_LIMIT", 20000)
+)
+SIMILARITY_PROBES = int(os.getenv("SIMILARITY_PROBES", 8))
+
+# PREFETCHING ==========================================================
+# Whether the hot lists (home, top rated, in theaters, upcoming and the
+# genre pages) are refreshed in the background before they expire,
+# together with the detail bundles of their first movies.
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "True").lower() == "true"
+PREFETCH_PAGES = int(os.getenv("PREFETCH_PAGES", 3))
+PREFETCH_DETAIL_MOVIES = int(os.getenv("PREFETCH_DETAIL_MOVIES", 10))
+# The most TMDB requests the prefetcher may make per minute. Refreshes
+# past the budget wait for the next run of their list.
+PREFETCH_BUDGET = int(os.getenv("PREFETCH_BUDGET", 120))
+# Lists are refreshed after this fraction of their TTL, give or take
+# PREFETCH_JITTER of it, so that they do not all come due at once.
+PREFETCH_REFRESH_FRACTION = 0.75
+PREFETCH_JITTER = float(os.getenv("PREFETCH_JITTER", 0.1))
+# Only the process holding a lock on this file prefetches, so that
+# worker processes do not each refresh the same lists, and the budget
+# holds for the whole server. Another takes over if it exits.
+PREFETCH_LOCK_PATH = os.getenv("PREFETCH_LOCK_PATH", "prefetch.lock")
+
 # API ENDPOINTS ========================================================
-API_BASE_URL = "https://api.themoviedb.org/3/"
-API_BASE_URL_V4 = "https://api.themoviedb.org/4/"
+DEFAULT_API_ORIGIN = "https://api.themoviedb.org"
+# Where TMDB requests are sent, e.g. a local stand-in for benchmarks.
+TMDB_API_ORIGIN = os.getenv("TMDB_API_ORIGIN", DEFAULT_API_ORIGIN)
+TMDB_IMAGE_ORIGIN = os.getenv("TMDB_IMAGE_ORIGIN", "https://image.tmdb.org")
+
+API_BASE_URL = f"{TMDB_API_ORIGIN}/3/"
+API_BASE_URL_V4 = f"{TMDB_API_ORIGIN}/4/"
+IMAGE_BASE_URL = f"{TMDB_IMAGE_ORIGIN}/t/p/"
 API_HEADERS = {
     "accept": "application/json",
     "content-type": "application/json",
@@ -30,6 +209,17 @@ API_HEADERS = {
 }
 
 
+def validate_settings():
+    """Checks that every setting in REQUIRED_SETTINGS is set.
+
+    Raises:
+        ValueError: If one of them is missing.
+    """
+    for name in REQUIRED_SETTINGS:
+        if not globals()[name]:
+            raise ValueError(f"{name} is not set in .env file")
+
+
 def generate_api_url(url, base_url=API_BASE_URL):
     """Generates a full API URL by appending the base URL to the given
     URL.
@@ -0,0 +1,25 @@
+# The genre pages, by the URL name of the genre, with their TMDB ids.
+GENRES = {
+    "action": 28,
+    "adventure": 12,
+    "animation": 16,
+    "comedy": 35,
+    "crime": 80,
+    "documentary": 99,
+    "drama": 18,
+    "family": 10751,
+    "fantasy": 14,
+    "history": 36,
+    "horror": 27,
+    "music": 10402,
+    "mystery": 9648,
+    "romance": 10749,
+    "science fiction": 878,
+}
+
+# TMDB keyword ids of the cooking page, any of which matches.
+COOKING_KEYWORDS = [18293, 6808, 10637]
+
+# The ratings TMDB accepts, in steps of MIN_RATING.
+MIN_RATING = 0.5
+MAX_RATING = 10
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ..constants.api_constants import (
+    CACHE_BACKEND,
+    CACHE_MAX_ENTRIES,
+    CACHE_PATH,
+    CACHE_STALE_TTL,
+)
+from .metrics_service import cache_requests
+
+logger = logging.getLogger(__name__)
+
+CacheEntry = Tuple[Any, float]
+
+
+class MemoryCacheBackend:
+    """Keeps cache entries in process memory and evicts the least
+    recently used entry once max_entries is exceeded."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, stored_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend:
+    """Keeps JSON-serializable cache entries in a local SQLite file so
+    that several worker processes can share warm entries.
+
+    Entries are evicted least recently used first once max_entries is
+    exceeded.
+    """
+
+    def __init__(
+        self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are opened on first use in each thread, so that
+        # none is opened before worker processes are forked.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT value, stored_at FROM cache WHERE key = ?",
+                    (key,),
+                ).fetchone()
+                if row is None:
+                    return None
+                connection.execute(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            return json.loads(row[0]), row[1]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading cache entry {key}: {str(e)}")
+            return None
+
+    def set(self, key: str, value: Any, stored_at: float) -> None:
+        try:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache "
+                    "(key, value, stored_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), stored_at, time.time()),
+                )
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                    "ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error writing cache entry {key}: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM cache")
+
+
+class _PendingCall:
+    """A fetch in progress that concurrent callers can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+    def result(self) -> Any:
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class TTLCache:
+    """A time-to-live cache with stale-while-revalidate and request
+    coalescing on top of a pluggable backend.
+
+    Fresh entries are returned directly. Entries past their TTL but
+    within stale_ttl are returned as-is while a background thread
+    refreshes them. Concurrent misses for the same key share a single
+    call to fetch. Lookups are counted in the cache metrics under the
+    cache's name.
+    """
+
+    def __init__(
+        self, backend, stale_ttl: float = CACHE_STALE_TTL, name: str = ""
+    ):
+        self.backend = backend
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self._pending: Dict[str, _PendingCall] = {}
+        self._async_pending: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Any],
+        ttl: float,
+        label: str = "",
+    ):
+        """Returns the cached value for key, calling fetch on a miss.
+
+        Args:
+            key (str): The cache key.
+            fetch (Callable[[], Any]): Produces the value on a miss.
+                If it raises, an expired value for key is returned if
+                one is still stored; otherwise the exception is passed
+                on to every waiting caller. Nothing is cached.
+            ttl (float): Seconds the value stays fresh.
+            label (str, optional): Groups the lookup in the cache
+                metrics, e.g. by endpoint. Defaults to "".
+
+        Returns:
+            Any: The cached or freshly fetched value.
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < ttl:
+                self._record_lookup(label, "hit")
+                return value
+            if age < ttl + self.stale_ttl:
+                self._record_lookup(label, "stale")
+                self._refresh_in_background(key, fetch)
+                return value
+
+        self._record_lookup(label, "miss")
+        try:
+            return self._fetch_once(key, fetch)
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.warning(f"Serving expired {key} after error: {str(e)}")
+            return entry[0]
+
+    async def get_or_fetch_async(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        ttl: float,
+        label: str = "",
+    ):
+        """Coroutine version of get_or_fetch, where fetch returns an
+        awaitable.
+
+        Concurrent misses are coalesced between coroutines running on
+        the same event loop.
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < ttl:
+                self._record_lookup(label, "hit")
+                return value
+            if age < ttl + self.stale_ttl:
+                self._record_lookup(label, "stale")
+                if key not in self._async_pending:
+                    refresh = self._fetch_once_async(key, fetch)
+                    refresh.add_done_callback(
+                        lambda future: self._log_refresh_error(key, future)
+                    )
+                return value
+
+        self._record_lookup(label, "miss")
+        try:
+            return await self._fetch_once_async(key, fetch)
+        except Exception as e:
+            if entry is None:
+                raise
+            logger.warning(f"Serving expired {key} after error: {str(e)}")
+            return entry[0]
+
+    def refresh(
+        self, key: str, fetch: Callable[[], Any], min_age: float = 0
+    ) -> bool:
+        """Calls fetch and stores its value for key ahead of a lookup,
+        unless the cached value is younger than min_age seconds.
+
+        A fetch for key already in progress is joined rather than
+        repeated.
+
+        Args:
+            key (str): The cache key.
+            fetch (Callable[[], Any]): Produces the value. Its
+                exceptions are passed on and nothing is cached.
+            min_age (float, optional): Seconds within which a cached
+                value is kept as it is. Defaults to 0.
+
+        Returns:
+            bool: Whether the value was fetched rather than kept.
+        """
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry[1] < min_age:
+            return False
+        self._fetch_once(key, fetch)
+        return True
+
+    def update(self, key: str, update: Callable[[Any], Any]) -> None:
+        """Replaces the cached value for key with update(value) without
+        changing its age. Does nothing if key is not cached.
+
+        Args:
+            key (str): The cache key.
+            update (Callable[[Any], Any]): Returns the new value given
+                the cached one.
+        """
+        with self._lock:
+            entry = self.backend.get(key)
+            if entry is None:
+                return
+            value, stored_at = entry
+            self.backend.set(key, update(value), stored_at)
+
+    def invalidate(self, key: str) -> None:
+        """Removes key from the cache."""
+        self.backend.delete(key)
+
+    def _record_lookup(self, label: str, result: str) -> None:
+        cache_requests.inc(cache=self.name, label=label, result=result)
+
+    def _fetch_once(self, key: str, fetch: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._pending.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._pending[key] = _PendingCall()
+
+        if is_leader:
+            try:
+                call.value = fetch()
+                self.backend.set(key, call.value, time.time())
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._pending[key]
+                call.done.set()
+
+        return call.result()
+
+    def _fetch_once_async(
+        self, key: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> asyncio.Future:
+        future = self._async_pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_and_store(key, fetch))
+            self._async_pending[key] = future
+            future.add_done_callback(
+                lambda _: self._async_pending.pop(key, None)
+            )
+        # Shielded so that a cancelled caller does not cancel the fetch
+        # the other callers are waiting for.
+        return asyncio.shield(future)
+
+    async def _fetch_and_store(
+        self, key: str, fetch: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        value = await fetch()
+        self.backend.set(key, value, time.time())
+        return value
+
+    def _log_refresh_error(self, key: str, future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                f"Error refreshing cache entry {key}: "
+                f"{str(future.exception())}"
+            )
+
+    def _refresh_in_background(
+        self, key: str, fetch: Callable[[], Any]
+    ) -> None:
+        with self._lock:
+            if key in self._pending:
+                return
+
+        threading.Thread(
+            target=self._refresh, args=(key, fetch), daemon=True
+        ).start()
+
+    def _refresh(self, key: str, fetch: Callable[[], Any]) -> None:
+        try:
+            self._fetch_once(key, fetch)
+        except Exception as e:
+            logger.error(f"Error refreshing cache entry {key}: {str(e)}")
+
+
+def create_cache_backend(backend: str = CACHE_BACKEND):
+    """Creates the cache backend named by the CACHE_BACKEND setting.
+
+    Args:
+        backend (str, optional): "memory" or "sqlite". Defaults to
+            CACHE_BACKEND.
+
+    Returns:
+        The cache backend.
+    """
+    if backend == "sqlite":
+        return SQLiteCacheBackend(CACHE_PATH, CACHE_MAX_ENTRIES)
+    return MemoryCacheBackend(CACHE_MAX_ENTRIES)
+
+
+page_cache = TTLCache(create_cache_backend(), name="page")
@@ -0,0 +1,482 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import tmdbsimple as tmdb
+
+from ..constants.api_constants import (
+    API_KEY,
+    CATALOG_DIR,
+    MAX_CONCURRENT_PAGE_REQUESTS,
+    UPSTREAM_TIMEOUT,
+    validate_settings,
+)
+from .http_service import api_session
+from .movie_service import aggregate_pages
+from .similarity_service import similarity_index
+
+logger = logging.getLogger(__name__)
+
+NUMERIC_COLUMNS = {
+    "id": np.int64,
+    "popularity": np.float32,
+    "vote_average": np.float32,
+    "vote_count": np.int32,
+    "release_date": np.int32,
+}
+STRING_COLUMNS = ["title", "poster_path", "backdrop_path", "overview"]
+LIST_COLUMNS = ["genre_ids", "keyword_ids"]
+
+# TMDB's own top rated list leaves out movies with fewer votes.
+TOP_RATED_MIN_VOTES = 300
+
+
+def normalize_movie(movie: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduces a TMDB list result or detail response to a catalog
+    record.
+
+    Args:
+        movie (Dict[str, Any]): The TMDB movie, optionally with
+            appended keywords.
+
+    Returns:
+        Dict[str, Any]: The catalog record.
+    """
+    genre_ids = movie.get("genre_ids")
+    if genre_ids is None:
+        genre_ids = [genre["id"] for genre in movie.get("genres", [])]
+
+    keywords = movie.get("keywords", {})
+    if isinstance(keywords, dict):
+        keywords = keywords.get("keywords", [])
+
+    record = {
+        column: movie.get(column)
+        for column in [*NUMERIC_COLUMNS, *STRING_COLUMNS]
+    }
+    record["genre_ids"] = list(genre_ids)
+    record["keyword_ids"] = [keyword["id"] for keyword in keywords]
+    return record
+
+
+class MovieCatalog:
+    """A compact, columnar store of movie metadata on local disk.
+
+    Numeric fields are kept in NumPy arrays that are memory-mapped on
+    load, strings in one interned UTF-8 table, and the genre and
+    keyword lists as offset/value array pairs. The catalog is loaded
+    lazily and reloaded whenever an ingestion run replaces it.
+    """
+
+    def __init__(self, path: str = CATALOG_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._columns: Dict[str, np.ndarray] = {}
+        self._loaded_version = None
+
+    def __len__(self) -> int:
+        return len(self._get_columns().get("id", ()))
+
+    def discover(
+        self,
+        with_genres: Optional[int] = None,
+        with_keywords: Optional[str] = None,
+        sort_by: str = "popularity",
+        min_vote_count: int = 0,
+        limit: Optional[int] = 100,
+    ) -> List[Dict[str, Any]]:
+        """Finds catalog movies the way TMDB's discover endpoint does.
+
+        Args:
+            with_genres (Optional[int], optional): Only movies of this
+                genre. Defaults to None.
+            with_keywords (Optional[str], optional): Only movies with
+                any of these "|"-separated keyword IDs. Defaults to
+                None.
+            sort_by (str, optional): The numeric column to sort by,
+                descending. Defaults to "popularity".
+            min_vote_count (int, optional): Only movies with at least
+                this many votes. Defaults to 0.
+            limit (Optional[int], optional): The maximum number of
+                movies to return, or None for all of them. Defaults to
+                100.
+
+        Returns:
+            List[Dict[str, Any]]: The movies, in the same shape as TMDB
+                list results. Empty if there is no catalog.
+        """
+        columns = self._get_columns()
+        if not columns:
+            return []
+
+        mask = columns["vote_count"] >= min_vote_count
+        if with_genres is not None:
+            mask &= self._has_any(columns, "genre_ids", [int(with_genres)])
+        if with_keywords:
+            keyword_ids = [int(id) for id in str(with_keywords).split("|")]
+            mask &= self._has_any(columns, "keyword_ids", keyword_ids)
+
+        rows = np.flatnonzero(mask)
+        order = np.argsort(-columns[sort_by][rows], kind="stable")
+        return [self._get_movie(columns, row) for row in rows[order][:limit]]
+
+    def top_rated(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Finds the best rated catalog movies."""
+        return self.discover(
+            sort_by="vote_average",
+            min_vote_count=TOP_RATED_MIN_VOTES,
+            limit=limit,
+        )
+
+    def load(self) -> bool:
+        """Maps the catalog into memory now rather than on first use.
+
+        Returns:
+            bool: Whether there is a catalog.
+        """
+        return bool(self._get_columns())
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Returns the catalog's memory-mapped column arrays by name,
+        empty if there is no catalog."""
+        return self._get_columns()
+
+    def get_movies_at(
+        self, columns: Dict[str, np.ndarray], rows: Iterable[int]
+    ) -> List[Dict[str, Any]]:
+        """Reads movies by their row in the given columns, as returned
+        by columns.
+
+        Returns:
+            List[Dict[str, Any]]: The movies, in the given order and in
+                the same shape as TMDB list results.
+        """
+        return [self._get_movie(columns, int(row)) for row in rows]
+
+    def get_movies(self, movie_ids: Iterable[int]) -> List[Dict[str, Any]]:
+        """Looks up catalog movies by ID.
+
+        Args:
+            movie_ids (Iterable[int]): The movie IDs.
+
+        Returns:
+            List[Dict[str, Any]]: The movies found, in the given order
+                and in the same shape as TMDB list results.
+        """
+        columns = self._get_columns()
+        if not columns:
+            return []
+
+        ids, id_order = columns["id"], columns["id_order"]
+        movies = []
+        for movie_id in movie_ids:
+            position = int(np.searchsorted(ids, movie_id, sorter=id_order))
+            if position < len(ids) and ids[id_order[position]] == movie_id:
+                movies.append(self._get_movie(columns, id_order[position]))
+        return movies
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Yields every catalog movie as a catalog record."""
+        columns = self._get_columns()
+        for row in range(len(columns.get("id", ()))):
+            movie = self._get_movie(columns, row)
+            record = {
+                column: movie.get(column)
+                for column in [*NUMERIC_COLUMNS, *STRING_COLUMNS]
+            }
+            for column in LIST_COLUMNS:
+                record[column] = self._get_list(columns, column, row)
+            yield record
+
+    def write(self, records: Iterable[Dict[str, Any]]) -> int:
+        """Replaces the catalog on disk with the given records.
+
+        Args:
+            records (Iterable[Dict[str, Any]]): Catalog records, as
+                returned by normalize_movie.
+
+        Returns:
+            int: The number of movies written.
+        """
+        records = list(records)
+        strings: Dict[str, int] = {}
+        columns: Dict[str, np.ndarray] = {}
+
+        for column, dtype in NUMERIC_COLUMNS.items():
+            values = [record.get(column) for record in records]
+            if column == "release_date":
+                values = [encode_date(value) for value in values]
+            columns[column] = np.array(
+                [value or 0 for value in values], dtype=dtype
+            )
+
+        for column in STRING_COLUMNS:
+            columns[column] = np.array(
+                [
+                    strings.setdefault(value, len(strings)) if value else -1
+                    for value in (record.get(column) for record in records)
+                ],
+                dtype=np.int32,
+            )
+
+        for column in LIST_COLUMNS:
+            lists = [record.get(column) or [] for record in records]
+            columns[f"{column}_offsets"] = np.cumsum(
+                [0] + [len(values) for values in lists], dtype=np.int64
+            )
+            columns[column] = np.array(
+                [value for values in lists for value in values],
+                dtype=np.int32,
+            )
+
+        encoded = [value.encode("utf-8") for value in strings]
+        columns["strings"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        columns["string_offsets"] = np.cumsum(
+            [0] + [len(value) for value in encoded], dtype=np.int64
+        )
+
+        staging_path = self.path + ".tmp"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+        for name, values in columns.items():
+            np.save(os.path.join(staging_path, f"{name}.npy"), values)
+        with open(os.path.join(staging_path, "meta.json"), "w") as file:
+            json.dump(
+                {"count": len(records), "updated": date.today().isoformat()},
+                file,
+            )
+
+        old_path = self.path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(staging_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        return len(records)
+
+    def last_updated(self) -> Optional[str]:
+        """Returns the date of the last ingestion run, if any."""
+        try:
+            with open(os.path.join(self.path, "meta.json")) as file:
+                return json.load(file).get("updated")
+        except (OSError, ValueError):
+            return None
+
+    def version(self) -> Optional[tuple]:
+        """Returns a value that changes whenever the catalog on disk is
+        replaced, or None if there is no catalog."""
+        try:
+            meta = os.stat(os.path.join(self.path, "meta.json"))
+        except OSError:
+            return None
+        return meta.st_ino, meta.st_mtime_ns
+
+    def _get_columns(self) -> Dict[str, np.ndarray]:
+        version = self.version()
+        if version is None:
+            return {}
+
+        with self._lock:
+            if version != self._loaded_version:
+                self._columns = self._load()
+                self._loaded_version = version
+            return self._columns
+
+    def _load(self) -> Dict[str, np.ndarray]:
+        columns = {}
+        try:
+            for file_name in os.listdir(self.path):
+                name, extension = os.path.splitext(file_name)
+                if extension == ".npy":
+                    columns[name] = np.load(
+                        os.path.join(self.path, file_name), mmap_mode="r"
+                    )
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading catalog: {str(e)}")
+            return {}
+        if "id" in columns:
+            columns["id_order"] = np.argsort(columns["id"], kind="stable")
+        return columns
+
+    def _has_any(
+        self, columns: Dict[str, np.ndarray], column: str, values: List[int]
+    ) -> np.ndarray:
+        offsets = columns[f"{column}_offsets"]
+        matches = np.isin(columns[column], values)
+        rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+        mask = np.zeros(len(offsets) - 1, dtype=bool)
+        mask[rows[matches]] = True
+        return mask
+
+    def _get_list(
+        self, columns: Dict[str, np.ndarray], column: str, row: int
+    ) -> List[int]:
+        offsets = columns[f"{column}_offsets"]
+        return columns[column][offsets[row]:offsets[row + 1]].tolist()
+
+    def _get_string(
+        self, columns: Dict[str, np.ndarray], ref: int
+    ) -> Optional[str]:
+        if ref < 0:
+            return None
+        offsets = columns["string_offsets"]
+        value = columns["strings"][offsets[ref]:offsets[ref + 1]]
+        return value.tobytes().decode("utf-8")
+
+    def _get_movie(
+        self, columns: Dict[str, np.ndarray], row: int
+    ) -> Dict[str, Any]:
+        movie = {
+            "id": int(columns["id"][row]),
+            "popularity": float(columns["popularity"][row]),
+            "vote_average": round(float(columns["vote_average"][row]), 3),
+            "vote_count": int(columns["vote_count"][row]),
+            "release_date": decode_date(int(columns["release_date"][row])),
+            "genre_ids": self._get_list(columns, "genre_ids", row),
+        }
+        for column in STRING_COLUMNS:
+            ref = int(columns[column][row])
+            movie[column] = self._get_string(columns, ref)
+        return {
+            key: value for key, value in movie.items() if value is not None
+        }
+
+
+def encode_date(value: Optional[str]) -> int:
+    """Packs a "YYYY-MM-DD" date into an int as YYYYMMDD, or 0."""
+    try:
+        return int(value.replace("-", "")) if value else 0
+    except ValueError:
+        return 0
+
+
+def decode_date(value: int) -> Optional[str]:
+    """Unpacks a date packed by encode_date."""
+    if not value:
+        return None
+    year, month, day = value // 10000, value // 100 % 100, value % 100
+    return f"{year:04d}-{month:02d}-{day:02d}"
+
+
+def read_json_lines(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields the movies in a JSON-lines dump, one TMDB movie per line."""
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def fetch_movie_ids(pages: int) -> List[int]:
+    """Gets the IDs of the most popular movies on TMDB."""
+    movies = aggregate_pages(
+        pages, tmdb.Discover().movie, sort_by="popularity.desc"
+    )
+    return [movie["id"] for movie in movies]
+
+
+def fetch_changed_ids(since: str) -> List[int]:
+    """Gets the IDs of the movies TMDB reports as changed since the
+    given date, at most 14 days back."""
+    start_date = max(
+        date.fromisoformat(since), date.today() - timedelta(days=14)
+    )
+    changes = aggregate_pages(
+        -1, tmdb.Changes().movie, start_date=start_date.isoformat()
+    )
+    return [change["id"] for change in changes]
+
+
+def fetch_movies(movie_ids: Iterable[int]) -> Iterator[Dict[str, Any]]:
+    """Fetches the details and keywords of each movie from TMDB,
+    skipping movies that fail to load."""
+    def fetch(movie_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            return tmdb.Movies(movie_id).info(append_to_response="keywords")
+        except Exception as e:
+            logger.error(f"Error fetching movie {movie_id}: {str(e)}")
+            return None
+
+    with ThreadPoolExecutor(MAX_CONCURRENT_PAGE_REQUESTS) as executor:
+        for movie in executor.map(fetch, movie_ids):
+            if movie is not None:
+                yield movie
+
+
+def ingest(catalog: MovieCatalog, movies: Iterable[Dict[str, Any]]) -> int:
+    """Merges movies into the catalog, replacing existing movies with
+    the same ID.
+
+    Args:
+        catalog (MovieCatalog): The catalog to update.
+        movies (Iterable[Dict[str, Any]]): TMDB movies.
+
+    Returns:
+        int: The number of movies in the updated catalog.
+    """
+    records = {record["id"]: record for record in catalog.records()}
+    for movie in movies:
+        record = normalize_movie(movie)
+        if record["id"] is not None:
+            records[record["id"]] = record
+    return catalog.write(records.values())
+
+
+movie_catalog = MovieCatalog()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds or updates the local movie catalog."
+    )
+    parser.add_argument(
+        "--jsonl", help="Ingest a JSON-lines dump instead of TMDB."
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=50,
+        help="Pages of popular movies to ingest from TMDB.",
+    )
+    parser.add_argument(
+        "--changes",
+        action="store_true",
+        help="Only refetch movies TMDB changed since the last run.",
+    )
+    args = parser.parse_args()
+
+    if args.jsonl:
+        movies = read_json_lines(args.jsonl)
+    else:
+        validate_settings()
+        tmdb.API_KEY = API_KEY
+        tmdb.REQUESTS_SESSION = api_session
+        tmdb.REQUESTS_TIMEOUT = UPSTREAM_TIMEOUT
+
+        last_updated = movie_catalog.last_updated()
+        if args.changes and last_updated:
+            known_ids = {record["id"] for record in movie_catalog.records()}
+            movie_ids = [
+                movie_id
+                for movie_id in fetch_changed_ids(last_updated)
+                if movie_id in known_ids
+            ]
+        else:
+            movie_ids = fetch_movie_ids(args.pages)
+        movies = fetch_movies(movie_ids)
+
+    count = ingest(movie_catalog, movies)
+    print(f"Catalog at {movie_catalog.path} now holds {count} movies")
+    count = similarity_index.build(movie_catalog)
+    print(f"Similar movies index at {similarity_index.path} holds {count}")
+
+
+if __name__ == "__main__":
+    main()
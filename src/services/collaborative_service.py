@@ -0,0 +1,604 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..constants.api_constants import (
+    CF_FACTORS,
+    CF_ITERATIONS,
+    CF_MIN_RATINGS,
+    CF_MODEL_DIR,
+    CF_NEIGHBORS,
+    CF_REGULARIZATION,
+    CF_TRAIN_INTERVAL,
+    RATINGS_LOG_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+# One rating event in the log. A rating of 0 records that the user
+# deleted their rating; TMDB's own ratings run from 0.5 to 10.
+RATING_DTYPE = np.dtype(
+    [
+        ("user_id", "<i8"),
+        ("movie_id", "<i8"),
+        ("rating", "<f4"),
+        ("time", "<f8"),
+    ]
+)
+# ALS iterations when training starts from the previous model's item
+# factors rather than from random ones.
+WARM_START_ITERATIONS = 3
+# Ratings, padding included, solved for in one batch. Bounds the memory
+# of a batch to about 2 * CHUNK_RATINGS * factors floats.
+CHUNK_RATINGS = 65536
+
+
+class RatingsLog:
+    """An append-only log of the ratings users submit, in a local binary
+    file of fixed-size records.
+
+    Every append is a single write to a file opened in append mode, so
+    several worker processes can share the log without locking.
+    """
+
+    def __init__(self, path: str = RATINGS_LOG_PATH):
+        self.path = path
+
+    def append(self, user_id: int, movie_id: int, rating: float) -> None:
+        """Records a rating.
+
+        Args:
+            user_id (int): The user's TMDB account ID.
+            movie_id (int): The rated movie.
+            rating (float): The rating, or 0 if it was deleted.
+        """
+        record = np.array(
+            [(user_id, movie_id, rating, time.time())], dtype=RATING_DTYPE
+        )
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, record.tobytes())
+        finally:
+            os.close(fd)
+
+    def read(self) -> np.ndarray:
+        """Reads every complete record in the log, oldest first."""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return np.empty(0, dtype=RATING_DTYPE)
+        return np.fromfile(
+            self.path,
+            dtype=RATING_DTYPE,
+            count=size // RATING_DTYPE.itemsize,
+        )
+
+    def size(self) -> int:
+        """Returns the size of the log in bytes, 0 if there is none."""
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+
+class CollaborativeModel:
+    """Recommends movies from the ratings of users with similar taste,
+    using item factors trained by matrix factorization.
+
+    The model is trained in a separate process by
+    `python -m src.services.collaborative_service` and kept on local
+    disk: the item factors, and a table of each movie's nearest
+    neighbours by the cosine similarity of their factors. It is
+    memory-mapped on first use and reloaded whenever training replaces
+    it, so recommending makes no upstream calls.
+
+    A user's factors are not stored, but solved for from their ratings
+    on each recommendation, so users who rated movies since the last
+    training run get recommendations too.
+    """
+
+    def __init__(self, path: str = CF_MODEL_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._meta: Dict[str, Any] = {}
+        self._loaded_version = None
+
+    def similar(self, movie_id: int, k: int = CF_NEIGHBORS) -> List[int]:
+        """Finds the movies rated most like the given movie.
+
+        Args:
+            movie_id (int): The movie.
+            k (int, optional): The maximum number of movies to return.
+                Defaults to CF_NEIGHBORS.
+
+        Returns:
+            List[int]: The IDs of the most similar movies, most similar
+                first. Empty if the movie has too few ratings.
+        """
+        arrays = self._get_arrays()
+        row = self._get_row(arrays, movie_id)
+        if row is None:
+            return []
+        neighbors = arrays["neighbors"][row, :k]
+        return arrays["item_ids"][neighbors[neighbors >= 0]].tolist()
+
+    def recommend(
+        self,
+        ratings: Dict[int, float],
+        k: int = 100,
+        exclude: Iterable[int] = (),
+    ) -> List[int]:
+        """Finds the movies a user is predicted to rate highest.
+
+        Args:
+            ratings (Dict[int, float]): The user's ratings by movie ID.
+            k (int, optional): The number of movies to return.
+                Defaults to 100.
+            exclude (Iterable[int], optional): Movie IDs never to
+                recommend. Defaults to ().
+
+        Returns:
+            List[int]: The IDs of the recommended movies, best first,
+                all predicted above the average rating.
+        """
+        arrays = self._get_arrays()
+        if not arrays:
+            return []
+
+        rated = [
+            (row, rating)
+            for row, rating in (
+                (self._get_row(arrays, movie_id), rating)
+                for movie_id, rating in ratings.items()
+            )
+            if row is not None
+        ]
+        if not rated:
+            return []
+
+        rows, values = zip(*rated)
+        factors = arrays["item_factors"]
+        user_factors = solve_user(
+            factors[list(rows)],
+            np.array(values, dtype=np.float32) - self._meta["mean"],
+            self._meta["regularization"],
+        )
+        scores = factors @ user_factors
+        scores[arrays["counts"] < CF_MIN_RATINGS] = -np.inf
+        for movie_id in exclude:
+            row = self._get_row(arrays, movie_id)
+            if row is not None:
+                scores[row] = -np.inf
+
+        k = min(k, len(scores))
+        top_rows = np.argpartition(-scores, k - 1)[:k]
+        top_rows = top_rows[np.argsort(-scores[top_rows])]
+        return arrays["item_ids"][top_rows[scores[top_rows] > 0]].tolist()
+
+    def recommend_for_user(
+        self, account_states: Dict[str, Any], k: int = 100
+    ) -> List[int]:
+        """Recommends movies from a user's rated list, leaving out
+        movies already in any of their lists.
+
+        Args:
+            account_states (Dict[str, Any]): The user's account states,
+                as returned by movie_service.get_account_states.
+            k (int, optional): The number of movies to return.
+                Defaults to 100.
+
+        Returns:
+            List[int]: The IDs of the recommended movies, best first.
+        """
+        ratings = {
+            movie["id"]: movie["rating"]
+            for movie in account_states.get("rated", [])
+            if "rating" in movie
+        }
+        exclude = set(account_states.get("memberships", {}))
+        return self.recommend(ratings, k, exclude)
+
+    def write(
+        self,
+        item_ids: np.ndarray,
+        item_factors: np.ndarray,
+        counts: np.ndarray,
+        meta: Dict[str, Any],
+    ) -> None:
+        """Replaces the model on disk, computing its neighbour table.
+
+        Args:
+            item_ids (np.ndarray): The sorted IDs of the trained movies.
+            item_factors (np.ndarray): Their factors, one row each.
+            counts (np.ndarray): Their number of ratings.
+            meta (Dict[str, Any]): The mean rating, regularization and
+                training statistics.
+        """
+        neighbors = build_neighbors(item_factors, counts)
+        staging_path = self.path + ".tmp"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+        arrays = {
+            "item_ids": item_ids,
+            "item_factors": item_factors,
+            "counts": counts,
+            "neighbors": neighbors,
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(staging_path, f"{name}.npy"), values)
+        with open(os.path.join(staging_path, "meta.json"), "w") as file:
+            json.dump(meta, file)
+
+        old_path = self.path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(staging_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    def read(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Returns the arrays and metadata of the model on disk, both
+        empty if there is none."""
+        arrays = self._get_arrays()
+        return arrays, (self._meta if arrays else {})
+
+    def version(self) -> Optional[tuple]:
+        """Returns a value that changes whenever the model on disk is
+        replaced, or None if there is no model."""
+        try:
+            meta = os.stat(os.path.join(self.path, "meta.json"))
+        except OSError:
+            return None
+        return meta.st_ino, meta.st_mtime_ns
+
+    def _get_arrays(self) -> Dict[str, np.ndarray]:
+        version = self.version()
+        if version is None:
+            return {}
+
+        with self._lock:
+            if version != self._loaded_version:
+                self._arrays, self._meta = self._load()
+                self._loaded_version = version
+            return self._arrays
+
+    def _load(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        arrays = {}
+        try:
+            for file_name in os.listdir(self.path):
+                name, extension = os.path.splitext(file_name)
+                if extension == ".npy":
+                    arrays[name] = np.load(
+                        os.path.join(self.path, file_name), mmap_mode="r"
+                    )
+            with open(os.path.join(self.path, "meta.json")) as file:
+                meta = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading collaborative model: {str(e)}")
+            return {}, {}
+        return arrays, meta
+
+    def _get_row(
+        self, arrays: Dict[str, np.ndarray], movie_id: Any
+    ) -> Optional[int]:
+        if not arrays:
+            return None
+        try:
+            movie_id = int(movie_id)
+        except (TypeError, ValueError):
+            return None
+        item_ids = arrays["item_ids"]
+        row = int(np.searchsorted(item_ids, movie_id))
+        if row < len(item_ids) and item_ids[row] == movie_id:
+            return row
+        return None
+
+
+def get_latest_ratings(records: np.ndarray) -> np.ndarray:
+    """Keeps each user's last rating of each movie, dropping deleted
+    ratings.
+
+    Args:
+        records (np.ndarray): Rating events, oldest first.
+
+    Returns:
+        np.ndarray: The current ratings.
+    """
+    order = np.lexsort(
+        (np.arange(len(records)), records["movie_id"], records["user_id"])
+    )
+    records = records[order]
+    is_last = np.ones(len(records), dtype=bool)
+    is_last[:-1] = (records["user_id"][1:] != records["user_id"][:-1]) | (
+        records["movie_id"][1:] != records["movie_id"][:-1]
+    )
+    records = records[is_last]
+    return records[records["rating"] > 0]
+
+
+def solve_user(
+    item_factors: np.ndarray, ratings: np.ndarray, regularization: float
+) -> np.ndarray:
+    """Solves for the factors of one user given the factors of the items
+    they rated and their ratings less the mean.
+
+    Returns:
+        np.ndarray: The user's factors.
+    """
+    item_factors = np.asarray(item_factors, dtype=np.float32)
+    gram = item_factors.T @ item_factors
+    gram += regularization * len(ratings) * np.eye(len(gram))
+    return np.linalg.solve(gram, item_factors.T @ ratings)
+
+
+def solve_factors(
+    matrix, fixed: np.ndarray, regularization: float, executor
+) -> np.ndarray:
+    """Solves one half of an alternating least squares step: the factors
+    of each row of matrix given the factors of its columns.
+
+    Rows are sorted by their number of ratings and solved in batches of
+    rows with about as many ratings each, padded to the same length, so
+    that the normal equations of a whole batch are built by one batched
+    matrix product. Batches run in parallel on the executor's threads,
+    which NumPy releases the GIL for.
+
+    Args:
+        matrix (sparse.csr_matrix): Mean-centred ratings, one row per
+            user or item.
+        fixed (np.ndarray): The factors of its columns.
+        regularization (float): The weight of the L2 penalty, scaled by
+            each row's number of ratings.
+        executor (ThreadPoolExecutor): Runs the batches.
+
+    Returns:
+        np.ndarray: The factors of the rows.
+    """
+    factors = np.zeros((matrix.shape[0], fixed.shape[1]), dtype=np.float32)
+    identity = np.eye(fixed.shape[1], dtype=np.float32)
+    # Padding points at the extra row of zeros.
+    padded_fixed = np.vstack([fixed, np.zeros_like(fixed[:1])])
+    counts = np.diff(matrix.indptr)
+    order = np.argsort(counts, kind="stable")
+    order = order[counts[order] > 0]
+
+    def solve_rows(rows: np.ndarray) -> None:
+        row_counts = counts[rows]
+        length = int(row_counts[-1])
+        positions = np.arange(length)
+        is_rating = positions < row_counts[:, None]
+        offsets = matrix.indptr[rows][:, None] + positions
+        offsets = np.where(is_rating, offsets, 0)
+        columns = np.where(is_rating, matrix.indices[offsets], len(fixed))
+        values = np.where(is_rating, matrix.data[offsets], 0)
+
+        rated = padded_fixed[columns]
+        transposed = rated.transpose(0, 2, 1)
+        grams = transposed @ rated
+        grams += regularization * row_counts[:, None, None] * identity
+        targets = transposed @ values[:, :, None].astype(np.float32)
+        factors[rows] = np.linalg.solve(grams, targets)[:, :, 0]
+
+    futures, start = [], 0
+    while start < len(order):
+        # Rows only get longer, so the batch is sized by its last row.
+        size = max(CHUNK_RATINGS // int(counts[order[start]]), 1)
+        stop = min(start + size, len(order))
+        while stop - start > 1 and (stop - start) * int(
+            counts[order[stop - 1]]
+        ) > 2 * CHUNK_RATINGS:
+            stop = start + max((stop - start) // 2, 1)
+        futures.append(executor.submit(solve_rows, order[start:stop]))
+        start = stop
+    for future in futures:
+        future.result()
+    return factors
+
+
+def train(
+    ratings: np.ndarray,
+    factors: int = CF_FACTORS,
+    regularization: float = CF_REGULARIZATION,
+    iterations: int = CF_ITERATIONS,
+    initial: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+    """Factorizes the user by movie rating matrix by alternating least
+    squares.
+
+    Args:
+        ratings (np.ndarray): The current ratings, as returned by
+            get_latest_ratings.
+        factors (int, optional): The number of latent factors.
+            Defaults to CF_FACTORS.
+        regularization (float, optional): The weight of the L2
+            penalty. Defaults to CF_REGULARIZATION.
+        iterations (int, optional): ALS iterations. Defaults to
+            CF_ITERATIONS.
+        initial (Optional[Tuple[np.ndarray, np.ndarray]], optional):
+            The item IDs and factors of a previous model to start
+            from. Movies it does not know start from random factors.
+            Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, float]: The sorted
+            movie IDs, their factors, their number of ratings and the
+            mean rating.
+    """
+    from scipy import sparse
+
+    user_ids, user_rows = np.unique(ratings["user_id"], return_inverse=True)
+    item_ids, item_rows = np.unique(ratings["movie_id"], return_inverse=True)
+    mean = float(ratings["rating"].mean())
+    matrix = sparse.csr_matrix(
+        (
+            ratings["rating"].astype(np.float32) - mean,
+            (user_rows, item_rows),
+        ),
+        shape=(len(user_ids), len(item_ids)),
+    )
+    transposed = matrix.T.tocsr()
+
+    rng = np.random.default_rng(0)
+    item_factors = rng.normal(
+        scale=0.1, size=(len(item_ids), factors)
+    ).astype(np.float32)
+    if initial is not None and len(initial[0]):
+        initial_ids, initial_factors = initial
+        rows = np.searchsorted(initial_ids, item_ids)
+        rows = np.minimum(rows, len(initial_ids) - 1)
+        known = initial_ids[rows] == item_ids
+        if initial_factors.shape[1] == factors:
+            item_factors[known] = initial_factors[rows[known]]
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for _ in range(iterations):
+            user_factors = solve_factors(
+                matrix, item_factors, regularization, executor
+            )
+            item_factors = solve_factors(
+                transposed, user_factors, regularization, executor
+            )
+
+    counts = np.diff(transposed.indptr).astype(np.int32)
+    return item_ids, item_factors, counts, mean
+
+
+def build_neighbors(
+    item_factors: np.ndarray,
+    counts: np.ndarray,
+    k: int = CF_NEIGHBORS,
+    batch_size: int = 256,
+) -> np.ndarray:
+    """Finds each movie's k nearest neighbours by the cosine similarity
+    of their factors, among the movies with at least CF_MIN_RATINGS
+    ratings.
+
+    Returns:
+        np.ndarray: One row per movie of its neighbours' rows, most
+            similar first, padded with -1.
+    """
+    norms = np.linalg.norm(item_factors, axis=1, keepdims=True)
+    unit = item_factors / np.maximum(norms, 1e-12)
+    candidates = counts >= CF_MIN_RATINGS
+    k = min(k, max(int(candidates.sum()) - 1, 0))
+    neighbors = np.full((len(unit), k), -1, dtype=np.int32)
+    if not k:
+        return neighbors
+
+    for start in range(0, len(unit), batch_size):
+        stop = min(start + batch_size, len(unit))
+        scores = unit[start:stop] @ unit.T
+        scores[:, ~candidates] = -np.inf
+        scores[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        neighbors[start:stop] = np.where(top_scores > 0, top, -1)
+    return neighbors
+
+
+def train_model(
+    log: RatingsLog, model: CollaborativeModel, full: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Trains the model on the ratings log and replaces it on disk.
+
+    Unless full is set, training starts from the factors of the current
+    model and runs WARM_START_ITERATIONS iterations.
+
+    Returns:
+        Optional[Dict[str, Any]]: The new model's metadata, or None if
+            there are no ratings.
+    """
+    log_bytes = log.size()
+    ratings = get_latest_ratings(log.read())
+    if not len(ratings):
+        return None
+
+    started_at = time.perf_counter()
+    arrays, _ = model.read()
+    initial = None
+    iterations = CF_ITERATIONS
+    if arrays and not full:
+        initial = (
+            np.asarray(arrays["item_ids"]),
+            np.asarray(arrays["item_factors"]),
+        )
+        iterations = WARM_START_ITERATIONS
+
+    item_ids, item_factors, counts, mean = train(
+        ratings, iterations=iterations, initial=initial
+    )
+    meta = {
+        "mean": mean,
+        "regularization": CF_REGULARIZATION,
+        "ratings": len(ratings),
+        "users": len(np.unique(ratings["user_id"])),
+        "movies": len(item_ids),
+        "iterations": iterations,
+        "log_bytes": log_bytes,
+        "seconds": time.perf_counter() - started_at,
+        "trained": datetime.now(timezone.utc).isoformat(),
+    }
+    model.write(item_ids, item_factors, counts, meta)
+    return meta
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Trains the collaborative filtering model on the "
+        "local ratings log."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running, and retrain whenever new ratings were logged.",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=CF_TRAIN_INTERVAL,
+        help="Seconds between checks for new ratings with --watch.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Train from scratch rather than from the current model.",
+    )
+    args = parser.parse_args()
+
+    full = args.full
+    while True:
+        _, meta = collaborative_model.read()
+        if full or meta.get("log_bytes") != ratings_log.size():
+            meta = train_model(ratings_log, collaborative_model, full)
+            full = False
+            if meta is None:
+                print(f"No ratings in {ratings_log.path}")
+            else:
+                print(
+                    f"Trained on {meta['ratings']} ratings of "
+                    f"{meta['movies']} movies by {meta['users']} users "
+                    f"in {meta['seconds']:.1f}s"
+                )
+        if not args.watch:
+            break
+        time.sleep(args.interval)
+
+
+ratings_log = RatingsLog()
+collaborative_model = CollaborativeModel()
+
+if __name__ == "__main__":
+    main()
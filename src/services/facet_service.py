@@ -0,0 +1,292 @@
+import threading
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+)
+
+import numpy as np
+
+from ..constants.movie_constants import GENRES
+from .catalog_service import movie_catalog
+
+SORT_COLUMNS = ["popularity", "vote_average", "vote_count", "release_date"]
+# Keywords counted in a browse response, most frequent first.
+KEYWORD_FACET_SIZE = 20
+# Movies on /browse, and in each batch its "Load More" button loads.
+BROWSE_PAGE_SIZE = 100
+
+
+class Postings(NamedTuple):
+    """The sorted catalog rows of every value of one facet, stored as
+    one array: the rows of values[i] are rows[starts[i]:starts[i + 1]].
+    """
+
+    values: np.ndarray
+    starts: np.ndarray
+    rows: np.ndarray
+
+    def get(self, value: int) -> np.ndarray:
+        position = int(np.searchsorted(self.values, value))
+        if position == len(self.values) or self.values[position] != value:
+            return self.rows[:0]
+        return self.rows[self.starts[position]:self.starts[position + 1]]
+
+    def count(self, mask: np.ndarray) -> np.ndarray:
+        """Counts the rows of each value that are set in mask."""
+        if not len(self.rows):
+            return np.zeros(0, dtype=np.int64)
+        return np.add.reduceat(
+            mask[self.rows].astype(np.int64), self.starts[:-1]
+        )
+
+
+class FacetIndex:
+    """Browses the local catalog by genre, keyword and release decade.
+
+    Each facet value has a sorted array of the catalog rows that have
+    it, built once per catalog version from the memory-mapped columns.
+    Filters are answered by intersecting and merging those arrays in
+    memory, and the response counts, for each value of each facet, how
+    many of the matching movies have it.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Postings] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._built_version = None
+
+    def browse(
+        self,
+        genres: Iterable[int] = (),
+        genre_mode: str = "and",
+        keywords: Iterable[int] = (),
+        keyword_mode: str = "or",
+        decades: Iterable[int] = (),
+        sort_by: str = "popularity",
+        min_vote_count: int = 0,
+        offset: int = 0,
+        limit: Optional[int] = BROWSE_PAGE_SIZE,
+        with_counts: bool = True,
+    ) -> Dict[str, Any]:
+        """Finds the catalog movies matching every given facet.
+
+        Args:
+            genres (Iterable[int], optional): TMDB genre IDs.
+                Defaults to ().
+            genre_mode (str, optional): "and" for movies with all of
+                the genres, "or" for movies with any. Defaults to "and".
+            keywords (Iterable[int], optional): TMDB keyword IDs.
+                Defaults to ().
+            keyword_mode (str, optional): "and" or "or", as for genres.
+                Defaults to "or".
+            decades (Iterable[int], optional): Release decades, e.g.
+                1990, any of which matches. Defaults to ().
+            sort_by (str, optional): One of SORT_COLUMNS, sorted
+                descending. Defaults to "popularity".
+            min_vote_count (int, optional): Only movies with at least
+                this many votes. Defaults to 0.
+            offset (int, optional): Matching movies to skip. Defaults
+                to 0.
+            limit (Optional[int], optional): The most movies to return,
+                or None for all of them. Defaults to BROWSE_PAGE_SIZE.
+            with_counts (bool, optional): Whether to count the facet
+                values of the matching movies. Defaults to True.
+
+        Returns:
+            Dict[str, Any]: The page of movies under "results", in the
+                same shape as TMDB list results, the number of matching
+                movies under "total", and with_counts, the counts by
+                facet and value under "facets". Empty if there is no
+                catalog.
+        """
+        postings, columns = self._get_postings()
+        if not postings:
+            return {"results": [], "total": 0, "facets": {}}
+
+        filters = [
+            combine([postings["genres"].get(id) for id in genres], genre_mode),
+            combine(
+                [postings["keywords"].get(id) for id in keywords],
+                keyword_mode,
+            ),
+            combine([postings["decades"].get(d) for d in decades], "or"),
+        ]
+        if min_vote_count:
+            filters.append(
+                np.flatnonzero(columns["vote_count"] >= min_vote_count)
+            )
+        rows = combine([rows for rows in filters if rows is not None], "and")
+        if rows is None:
+            rows = np.arange(len(columns["id"]))
+
+        page_rows = get_top_rows(
+            columns[sort_by][rows], rows, offset, limit
+        )
+        response = {
+            "results": self.catalog.get_movies_at(columns, page_rows),
+            "total": len(rows),
+        }
+        if with_counts:
+            response["facets"] = count_facets(
+                postings, rows, len(columns["id"])
+            )
+        return response
+
+    def _get_postings(self):
+        with self._lock:
+            # The version is read before the columns, so that a catalog
+            # replaced in between is built under the older version and
+            # built again on the next call, rather than left with
+            # postings of the older columns under the newer version.
+            version = self.catalog.version()
+            columns = self.catalog.columns()
+            if not columns:
+                return {}, {}
+            if version != self._built_version:
+                self._postings = build_postings(columns)
+                self._columns = columns
+                self._built_version = version
+            return self._postings, self._columns
+
+
+def build_postings(columns: Dict[str, np.ndarray]) -> Dict[str, Postings]:
+    """Builds the genre, keyword and decade postings of the catalog."""
+    count = len(columns["id"])
+    years = np.asarray(columns["release_date"]) // 10000
+    has_year = years > 0
+    return {
+        "genres": build_list_postings(columns, "genre_ids", count),
+        "keywords": build_list_postings(columns, "keyword_ids", count),
+        "decades": group_rows(
+            np.flatnonzero(has_year), years[has_year] // 10 * 10
+        ),
+    }
+
+
+def build_list_postings(
+    columns: Dict[str, np.ndarray], column: str, count: int
+) -> Postings:
+    offsets = np.asarray(columns[f"{column}_offsets"])
+    rows = np.repeat(np.arange(count), np.diff(offsets))
+    return group_rows(rows, np.asarray(columns[column]))
+
+
+def group_rows(rows: np.ndarray, values: np.ndarray) -> Postings:
+    """Groups rows by value into postings, each sorted by row."""
+    order = np.lexsort((rows, values))
+    rows, values = rows[order], values[order]
+    # A movie listing a value twice is counted once.
+    is_first = np.ones(len(rows), dtype=bool)
+    is_first[1:] = (values[1:] != values[:-1]) | (rows[1:] != rows[:-1])
+    rows, values = rows[is_first], values[is_first]
+    unique_values, starts = np.unique(values, return_index=True)
+    return Postings(
+        unique_values.astype(np.int64),
+        np.append(starts, len(rows)).astype(np.int64),
+        rows.astype(np.int32),
+    )
+
+
+def combine(row_sets: List[np.ndarray], mode: str) -> Optional[np.ndarray]:
+    """Intersects ("and") or merges ("or") sorted row arrays, smallest
+    first, or returns None if there are none to combine."""
+    if not row_sets:
+        return None
+    row_sets = sorted(row_sets, key=len)
+    rows = row_sets[0]
+    for other in row_sets[1:]:
+        if mode == "or":
+            rows = np.union1d(rows, other)
+        else:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+    return rows
+
+
+def get_top_rows(
+    values: np.ndarray,
+    rows: np.ndarray,
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> np.ndarray:
+    """Sorts rows by values, descending, and returns the rows from
+    offset to offset + limit. Only that many are fully sorted."""
+    end = len(rows) if limit is None else min(offset + limit, len(rows))
+    if offset >= end:
+        return rows[:0]
+    values = np.asarray(values)
+    if end < len(rows):
+        top = np.argpartition(-values, end - 1)[:end]
+    else:
+        top = np.arange(len(rows))
+    # Ties are broken by row so that pages do not overlap.
+    top = top[np.lexsort((rows[top], -values[top]))]
+    return rows[top[offset:end]]
+
+
+def count_facets(
+    postings: Dict[str, Postings], rows: np.ndarray, count: int
+) -> Dict[str, Dict[int, int]]:
+    """Counts how many of the given rows have each facet value. Keeps
+    the KEYWORD_FACET_SIZE most frequent keywords, and only values that
+    occur."""
+    mask = np.zeros(count, dtype=bool)
+    mask[rows] = True
+    facets = {}
+    for name, facet in postings.items():
+        counts = facet.count(mask)
+        present = np.flatnonzero(counts)
+        if name == "keywords":
+            present = present[np.argsort(-counts[present], kind="stable")]
+            present = present[:KEYWORD_FACET_SIZE]
+        facets[name] = {
+            int(facet.values[i]): int(counts[i]) for i in present
+        }
+    return facets
+
+
+def get_browse_filters(args: Mapping[str, str]) -> Dict[str, Any]:
+    """Reads browse filters from query parameters: comma-separated
+    genre (names or IDs), keyword and decade lists, genre_mode and
+    keyword_mode ("and" or "or"), sort_by and min_vote_count.
+
+    Returns:
+        Dict[str, Any]: Keyword arguments for FacetIndex.browse.
+
+    Raises:
+        ValueError: If a parameter is malformed.
+    """
+    filters: Dict[str, Any] = {
+        "genres": [
+            GENRES.get(genre) or int(genre)
+            for genre in split_list(args.get("genre"))
+        ],
+        "keywords": [int(id) for id in split_list(args.get("keyword"))],
+        "decades": [int(d) for d in split_list(args.get("decade"))],
+        "genre_mode": args.get("genre_mode", "and"),
+        "keyword_mode": args.get("keyword_mode", "or"),
+        "sort_by": args.get("sort_by", "popularity"),
+        "min_vote_count": int(args.get("min_vote_count", 0)),
+    }
+    if filters["sort_by"] not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {filters['sort_by']}")
+    for mode in ("genre_mode", "keyword_mode"):
+        if filters[mode] not in ("and", "or"):
+            raise ValueError(f"{mode} must be and or or")
+    return filters
+
+
+def split_list(value: Optional[str]) -> List[str]:
+    """Splits a comma-separated query parameter."""
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+facet_index = FacetIndex(movie_catalog)
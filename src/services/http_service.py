@@ -0,0 +1,423 @@
+import asyncio
+import concurrent.futures
+import email.utils
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Coroutine, Dict, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..constants.api_constants import (
+    API_HEADERS,
+    ASYNC_MAX_CONNECTIONS,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    DEFAULT_API_ORIGIN,
+    TMDB_API_ORIGIN,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_POOL_SIZE,
+    UPSTREAM_RATE_LIMIT,
+    UPSTREAM_TIMEOUT,
+)
+from .metrics_service import record_upstream_call
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+RETRY_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+BACKOFF_FACTOR = 0.5
+
+
+def is_client_error(error: Exception) -> bool:
+    """Whether an upstream call failed because the upstream rejected the
+    request, e.g. with 404 for an unknown ID, so that sending it again
+    or differently cannot help. Works with both requests and httpx
+    errors."""
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return (
+        status is not None
+        and 400 <= status < 500
+        and status not in (408, 429)
+    )
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling an upstream that keeps failing."""
+
+
+class TokenBucket:
+    """Limits calls to rate per second on average, allowing bursts of
+    up to capacity calls."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Takes a token, sleeping until one is available."""
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    def reserve(self) -> float:
+        """Takes a token without waiting for it.
+
+        Returns:
+            float: The seconds the caller must wait before using it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated_at) * self.rate,
+            )
+            self._updated_at = now
+            # Taking the token up front, even if that leaves the bucket
+            # in debt, keeps concurrent callers queued in order.
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+
+class CircuitBreaker:
+    """Stops calls to an upstream after failure_threshold consecutive
+    failures, and lets calls through again after reset_timeout seconds.
+    The next failure then opens the circuit again straight away."""
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout: float = CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return (
+                self._opened_at is not None
+                and time.monotonic() - self._opened_at < self.reset_timeout
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.error("Upstream keeps failing, opening circuit")
+                self._opened_at = time.monotonic()
+
+
+class UpstreamSession(requests.Session):
+    """A requests session with a default timeout, an optional rate
+    limiter and a circuit breaker.
+
+    Requests with a retryable method are retried on RETRY_STATUSES and
+    connection errors with exponential backoff, honoring Retry-After,
+    as AsyncUpstreamClient does. Every attempt takes a token from the
+    rate limiter and is recorded by the circuit breaker.
+    """
+
+    def __init__(
+        self,
+        timeout=UPSTREAM_TIMEOUT,
+        rate_limiter: Optional[TokenBucket] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = UPSTREAM_MAX_RETRIES,
+    ):
+        super().__init__()
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.max_retries = max_retries
+
+    def request(self, method, url, *args, **kwargs) -> requests.Response:
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        if kwargs.get("headers"):
+            # tmdbsimple asks for "Connection: close" on every request,
+            # which would defeat the connection pool.
+            kwargs["headers"] = {
+                name: value
+                for name, value in kwargs["headers"].items()
+                if name.lower() != "connection"
+            }
+        params = kwargs.get("params")
+        retries = self.max_retries if method.upper() in RETRY_METHODS else 0
+        for attempt in range(retries + 1):
+            if self.circuit_breaker.is_open():
+                record_upstream_call(method, url, params, "circuit_open")
+                raise CircuitOpenError(f"Circuit open, not calling {url}")
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            delay = BACKOFF_FACTOR * 2**attempt
+            started_at = time.perf_counter()
+            try:
+                response = super().request(
+                    method, resolve_url(url), *args, **kwargs
+                )
+            except requests.RequestException as e:
+                seconds = time.perf_counter() - started_at
+                record_upstream_call(
+                    method, url, params, type(e).__name__, seconds
+                )
+                self.circuit_breaker.record_failure()
+                is_transport_error = isinstance(
+                    e, (requests.ConnectionError, requests.Timeout)
+                )
+                if attempt == retries or not is_transport_error:
+                    raise
+                time.sleep(delay)
+                continue
+
+            seconds = time.perf_counter() - started_at
+            record_upstream_call(
+                method, url, params, str(response.status_code), seconds
+            )
+            if response.status_code not in RETRY_STATUSES:
+                self.circuit_breaker.record_success()
+                return response
+
+            self.circuit_breaker.record_failure()
+            if attempt == retries:
+                return response
+            retry_after = get_retry_after(response)
+            response.close()
+            time.sleep(delay if retry_after is None else retry_after)
+
+
+def create_session(
+    headers: Optional[Dict[str, str]] = None,
+    rate_limit: Optional[float] = None,
+) -> UpstreamSession:
+    """Creates a pooled, keep-alive upstream session.
+
+    Args:
+        headers (Optional[Dict[str, str]], optional): Headers to send
+            with every request. Defaults to None.
+        rate_limit (Optional[float], optional): The maximum average
+            number of requests per second, or None for no limit.
+            Defaults to None.
+
+    Returns:
+        UpstreamSession: The session.
+    """
+    session = UpstreamSession(
+        rate_limiter=TokenBucket(rate_limit) if rate_limit else None
+    )
+    # Retries are made by UpstreamSession.request, so that each attempt
+    # goes through its rate limiter and circuit breaker.
+    adapter = HTTPAdapter(
+        pool_connections=UPSTREAM_POOL_SIZE,
+        pool_maxsize=UPSTREAM_POOL_SIZE,
+        max_retries=0,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+class AsyncUpstreamClient:
+    """The asyncio counterpart of UpstreamSession, backed by httpx.
+
+    Requests with a retryable method are retried on RETRY_STATUSES and
+    connection errors with exponential backoff, honoring Retry-After.
+    All requests must be made from the same event loop, normally the
+    one of upstream_loop.
+
+    httpx is slow to import and only needed in ASYNC_UPSTREAM mode, so
+    it is imported, and the httpx client created, on the first request.
+    """
+
+    def __init__(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        timeout=UPSTREAM_TIMEOUT,
+        max_connections: int = ASYNC_MAX_CONNECTIONS,
+        rate_limiter: Optional[TokenBucket] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        max_retries: int = UPSTREAM_MAX_RETRIES,
+    ):
+        self.headers = headers
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.rate_limiter = rate_limiter
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self._client = None
+
+    async def request(self, method: str, url: str, **kwargs) -> Any:
+        """Sends a request and returns its decoded JSON body.
+
+        Takes the same keyword arguments as httpx.AsyncClient.request.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open.
+            httpx.HTTPError: If the request still fails after the
+                retries.
+        """
+        import httpx
+
+        client = self._get_client()
+        retries = self.max_retries if method in RETRY_METHODS else 0
+        params = kwargs.get("params")
+        for attempt in range(retries + 1):
+            if self.circuit_breaker.is_open():
+                record_upstream_call(method, url, params, "circuit_open")
+                raise CircuitOpenError(f"Circuit open, not calling {url}")
+            if self.rate_limiter is not None:
+                await asyncio.sleep(self.rate_limiter.reserve())
+
+            delay = BACKOFF_FACTOR * 2**attempt
+            started_at = time.perf_counter()
+            try:
+                response = await client.request(
+                    method, resolve_url(url), **kwargs
+                )
+            except httpx.TransportError as e:
+                seconds = time.perf_counter() - started_at
+                record_upstream_call(
+                    method, url, params, type(e).__name__, seconds
+                )
+                self.circuit_breaker.record_failure()
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            seconds = time.perf_counter() - started_at
+            record_upstream_call(
+                method, url, params, str(response.status_code), seconds
+            )
+            if response.status_code not in RETRY_STATUSES:
+                self.circuit_breaker.record_success()
+                response.raise_for_status()
+                return response.json()
+
+            self.circuit_breaker.record_failure()
+            if attempt == retries:
+                response.raise_for_status()
+            retry_after = get_retry_after(response)
+            await asyncio.sleep(delay if retry_after is None else retry_after)
+
+    async def get(self, url: str, **kwargs) -> Any:
+        return await self.request("GET", url, **kwargs)
+
+    def _get_client(self) -> "httpx.AsyncClient":
+        if self._client is None:
+            import httpx
+
+            connect_timeout, read_timeout = self.timeout
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+
+def resolve_url(url: str) -> str:
+    """Points a TMDB API URL at TMDB_API_ORIGIN.
+
+    tmdbsimple always builds URLs on the public API origin, so they are
+    rewritten here rather than where they are built.
+    """
+    if TMDB_API_ORIGIN != DEFAULT_API_ORIGIN and url.startswith(
+        DEFAULT_API_ORIGIN
+    ):
+        return TMDB_API_ORIGIN + url[len(DEFAULT_API_ORIGIN):]
+    return url
+
+
+def get_retry_after(
+    response: Union[requests.Response, "httpx.Response"]
+) -> Optional[float]:
+    """Reads a response's Retry-After header, given either in seconds
+    or as an HTTP date, as seconds from now."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0)
+
+
+class UpstreamLoop:
+    """An event loop running in a background thread, on which request
+    threads run their upstream coroutines.
+
+    Sharing one loop lets every request thread use the same pooled
+    AsyncUpstreamClient, and keeps any number of upstream requests in
+    flight without a thread per request. The loop is started on first
+    use, so that it is started in the worker process rather than in a
+    parent that forks it.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def submit(self, coroutine: Coroutine) -> concurrent.futures.Future:
+        """Schedules a coroutine on the loop.
+
+        Args:
+            coroutine (Coroutine): The coroutine to run.
+
+        Returns:
+            concurrent.futures.Future: The coroutine's eventual result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._get_loop())
+
+    def run(self, coroutine: Coroutine, timeout: Optional[float] = None):
+        """Runs a coroutine on the loop and waits for its result."""
+        return self.submit(coroutine).result(timeout)
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="upstream-loop",
+                    daemon=True,
+                ).start()
+            return self._loop
+
+
+api_session = create_session(API_HEADERS, UPSTREAM_RATE_LIMIT)
+image_session = create_session()
+# Shares its rate limit and circuit breaker with api_session, since both
+# call the same API.
+async_api_client = AsyncUpstreamClient(
+    API_HEADERS,
+    rate_limiter=api_session.rate_limiter,
+    circuit_breaker=api_session.circuit_breaker,
+)
+upstream_loop = UpstreamLoop()
@@ -0,0 +1,155 @@
+import logging
+import os
+import re
+import threading
+from typing import Optional
+
+from ..constants.api_constants import (
+    IMAGE_BASE_URL,
+    IMAGE_CACHE_DIR,
+    IMAGE_CACHE_MAX_BYTES,
+)
+from .http_service import image_session
+
+logger = logging.getLogger(__name__)
+
+# TMDB renditions the image endpoint serves, smallest first.
+IMAGE_SIZES = [
+    "w45",
+    "w92",
+    "w154",
+    "w185",
+    "w300",
+    "w342",
+    "w500",
+    "h632",
+    "w780",
+    "w1280",
+]
+IMAGE_FILENAME = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|jpeg|png|svg)$")
+IMAGE_FETCH_TIMEOUT = 10
+
+
+class ImageCache:
+    """Caches TMDB image files on local disk.
+
+    Once the files exceed max_bytes, the least recently used ones are
+    deleted until the cache is back under 90% of the cap.
+    """
+
+    def __init__(
+        self,
+        path: str = IMAGE_CACHE_DIR,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def get(self, size: str, filename: str) -> Optional[bytes]:
+        file_path = self._get_file_path(size, filename)
+        try:
+            with open(file_path, "rb") as file:
+                content = file.read()
+            os.utime(file_path)
+            return content
+        except OSError:
+            return None
+
+    def set(self, size: str, filename: str, content: bytes) -> None:
+        file_path = self._get_file_path(size, filename)
+        staging_path = f"{file_path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(staging_path, "wb") as file:
+                file.write(content)
+        except OSError as e:
+            logger.error(f"Error caching image {filename}: {str(e)}")
+            return
+
+        with self._lock:
+            # The size of a file being replaced is counted already.
+            try:
+                replaced_bytes = os.stat(file_path).st_size
+            except OSError:
+                replaced_bytes = 0
+            try:
+                os.replace(staging_path, file_path)
+            except OSError as e:
+                logger.error(f"Error caching image {filename}: {str(e)}")
+                return
+
+            if self._total_bytes is None:
+                self._total_bytes = self._measure()
+            else:
+                self._total_bytes += len(content) - replaced_bytes
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _get_file_path(self, size: str, filename: str) -> str:
+        return os.path.join(self.path, f"{size}_{filename}")
+
+    def _measure(self) -> int:
+        return sum(entry.stat().st_size for entry in self._scan())
+
+    def _evict(self) -> None:
+        entries = sorted(
+            self._scan(), key=lambda entry: entry.stat().st_mtime
+        )
+        target_bytes = self.max_bytes * 0.9
+        for entry in entries:
+            if self._total_bytes <= target_bytes:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._total_bytes -= size
+            except OSError:
+                continue
+
+    def _scan(self):
+        try:
+            return [
+                entry
+                for entry in os.scandir(self.path)
+                if entry.is_file() and not entry.name.endswith(".tmp")
+            ]
+        except OSError:
+            return []
+
+
+def is_valid_image(size: str, filename: str) -> bool:
+    """Checks that an image request names a known rendition and a
+    plain TMDB image file name."""
+    return size in IMAGE_SIZES and bool(IMAGE_FILENAME.match(filename))
+
+
+def get_image(size: str, filename: str) -> Optional[bytes]:
+    """Gets a TMDB image rendition, from the disk cache if possible.
+
+    Args:
+        size (str): The rendition, one of IMAGE_SIZES.
+        filename (str): The image's file name, e.g. "abc123.jpg".
+
+    Returns:
+        Optional[bytes]: The image, or None if it could not be fetched.
+    """
+    content = image_cache.get(size, filename)
+    if content is not None:
+        return content
+
+    try:
+        response = image_session.get(
+            f"{IMAGE_BASE_URL}{size}/{filename}", timeout=IMAGE_FETCH_TIMEOUT
+        )
+        response.raise_for_status()
+    except Exception as e:
+        logger.error(f"Error fetching image {size}/{filename}: {str(e)}")
+        return None
+
+    image_cache.set(size, filename, response.content)
+    return response.content
+
+
+image_cache = ImageCache()
@@ -1,3 +1,7 @@
+from typing import Optional
+
+import tmdbsimple as tmdb
+from flask import session
 from flask_login import UserMixin, current_user
 
 
@@ -9,6 +13,30 @@ def get_session_id():
     return ""
 
 
+def get_account() -> Optional[tmdb.Account]:
+    """Returns a TMDB account bound to the current user's session.
+
+    A new account object is built for every call so that concurrent
+    requests never share session state. The TMDB account ID is looked
+    up once per login and kept in the Flask session.
+
+    Returns:
+        Optional[tmdb.Account]: The account, or None if the user is
+            not logged in.
+    """
+    if not current_user.is_authenticated:
+        return None
+
+    account = tmdb.Account(current_user.id)
+    account_id = session.get("account_id")
+    if account_id is None:
+        account.info()
+        session["account_id"] = account.id
+    else:
+        account.id = account_id
+    return account
+
+
 class User(UserMixin):
     def __init__(self, session_id, username=""):
         self.id = session_id
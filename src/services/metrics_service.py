@@ -0,0 +1,331 @@
+import bisect
+import re
+from abc import ABC, abstractmethod
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from urllib.parse import parse_qs, urlsplit
+
+from flask import g, has_request_context
+
+from ..constants.api_constants import DEFAULT_API_ORIGIN, TMDB_API_ORIGIN
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+API_HOSTS = {
+    urlsplit(DEFAULT_API_ORIGIN).hostname,
+    urlsplit(TMDB_API_ORIGIN).hostname,
+}
+# Path segments that identify a resource rather than an endpoint, e.g.
+# movie ids and session ids.
+ID_SEGMENT = re.compile(r"^(\d+|[0-9a-f]{16,})$")
+
+
+class Metric(ABC):
+    """A Prometheus metric with labels."""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Sequence[str]):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def render(self) -> List[str]:
+        """Renders the metric's samples, one per line."""
+
+    def _get_key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+
+class Counter(Metric):
+    """A Prometheus counter with labels."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{format_labels(self.labels, key)} {value}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    """A Prometheus gauge with labels."""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._get_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """A Prometheus histogram with labels."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Sequence[str],
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._get_key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * (len(self.buckets) + 1), 0)
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(
+                (key, (list(counts), total))
+                for key, (counts, total) in self._values.items()
+            )
+
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            bounds = [*map(str, self.buckets), "+Inf"]
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels((*self.labels, "le"), (*key, bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Formats label names and values as a Prometheus label set."""
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label_value(value)}"'
+        for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}"
+
+
+def escape_label_value(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def render_metrics() -> str:
+    """Renders every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def get_upstream_endpoint(url: str) -> str:
+    """Names the endpoint of an upstream URL with its ids replaced,
+    e.g. "3/movie/{id}/similar". URLs of other hosts, such as images,
+    are named by their host."""
+    parts = urlsplit(url)
+    if parts.hostname not in API_HOSTS:
+        return parts.hostname or ""
+    version, *segments = parts.path.strip("/").split("/")
+    return "/".join(
+        [
+            version,
+            *(
+                "{id}" if ID_SEGMENT.match(segment) else segment
+                for segment in segments
+            ),
+        ]
+    )
+
+
+def get_page_label(url: str, params: Optional[Dict[str, Any]]) -> str:
+    """Labels the page of an upstream call, grouping pages after the
+    fifth to keep the number of label values small."""
+    page = (params or {}).get("page")
+    if page is None:
+        page = parse_qs(urlsplit(url).query).get("page", [""])[0]
+    page = str(page)
+    if not page.isdigit():
+        return ""
+    return page if int(page) <= 5 else "6+"
+
+
+def record_upstream_call(
+    method: str,
+    url: str,
+    params: Optional[Dict[str, Any]],
+    status: str,
+    seconds: Optional[float] = None,
+) -> None:
+    """Records an upstream HTTP call in the upstream metrics.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The URL.
+        params (Optional[Dict[str, Any]]): The query parameters, if
+            they are not part of url.
+        status (str): The response status code, or the name of the
+            exception the call raised.
+        seconds (Optional[float], optional): How long the call took, or
+            None if it was never sent. Defaults to None.
+    """
+    labels = {"endpoint": get_upstream_endpoint(url), "method": method}
+    upstream_requests.inc(
+        **labels, page=get_page_label(url, params), status=status
+    )
+    if seconds is not None:
+        upstream_duration.observe(seconds, **labels)
+
+
+@contextmanager
+def server_timing(name: str) -> Iterator[None]:
+    """Adds the time spent in the block to the current response's
+    Server-Timing metric name.
+
+    Blocks nested in a block of the same name are not counted twice.
+    Outside of a request nothing is recorded.
+    """
+    if not has_request_context():
+        yield
+        return
+
+    active = g.setdefault("active_server_timings", set())
+    if name in active:
+        yield
+        return
+
+    active.add(name)
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        active.discard(name)
+        timings = g.setdefault("server_timings", {})
+        timings[name] = (
+            timings.get(name, 0) + time.perf_counter() - started_at
+        )
+
+
+def timed(name: str) -> Callable:
+    """Decorates a function so that the time spent in it is added to
+    the current response's Server-Timing metric name."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with server_timing(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    """Formats durations in seconds as a Server-Timing header value."""
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+    )
+
+
+http_requests = Counter(
+    "reelrecs_http_requests_total",
+    "HTTP requests served, by route, method and status.",
+    ["route", "method", "status"],
+)
+http_duration = Histogram(
+    "reelrecs_http_request_duration_seconds",
+    "Time to produce a response, by route.",
+    ["route", "method"],
+)
+upstream_requests = Counter(
+    "reelrecs_upstream_requests_total",
+    "Upstream HTTP calls, by endpoint, method, page and status.",
+    ["endpoint", "method", "page", "status"],
+)
+upstream_duration = Histogram(
+    "reelrecs_upstream_request_duration_seconds",
+    "Upstream HTTP call latency, by endpoint.",
+    ["endpoint", "method"],
+)
+cache_requests = Counter(
+    "reelrecs_cache_requests_total",
+    "Cache lookups, by cache, label and result (hit, stale or miss). "
+    "Lookups of TMDB data are labelled with the upstream endpoint, as "
+    "in reelrecs_upstream_requests_total.",
+    ["cache", "label", "result"],
+)
+mutations = Counter(
+    "reelrecs_mutations_total",
+    "Rating, watchlist and favorite writes, by list and result "
+    "(queued, sent, retried or dropped).",
+    ["state", "result"],
+)
+prefetch_refreshes = Counter(
+    "reelrecs_prefetch_refreshes_total",
+    "Cache entries visited by the prefetcher, by job and result "
+    "(fetched, fresh, deferred or error).",
+    ["job", "result"],
+)
+prefetch_last_refresh = Gauge(
+    "reelrecs_prefetch_last_refresh_timestamp_seconds",
+    "When each prefetch job last refreshed all of its entries.",
+    ["job"],
+)
+
+METRICS = [
+    http_requests,
+    http_duration,
+    upstream_requests,
+    upstream_duration,
+    cache_requests,
+    mutations,
+    prefetch_refreshes,
+    prefetch_last_refresh,
+]
@@ -1,14 +1,68 @@
+import asyncio
+import copy
+import json
 import logging
-from typing import Any, Callable, Dict, List, Union
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
 
 import requests
 import tmdbsimple as tmdb
-from flask import render_template
+from flask import (
+    Response,
+    jsonify,
+    render_template,
+    request,
+    stream_with_context,
+    url_for,
+)
+
+from ..constants.api_constants import (
+    ACCOUNT_STATES_STALE_TTL,
+    ACCOUNT_STATES_TTL,
+    API_HEADERS,
+    ASYNC_UPSTREAM,
+    CACHE_BACKEND,
+    DETAIL_CACHE_TTL,
+    DETAIL_PART_TIMEOUT,
+    INFINITE_SCROLL,
+    MAX_CONCURRENT_PAGE_REQUESTS,
+    PAGE_CACHE_TTLS,
+    RECOMMENDATION_SOURCE,
+    RECOMMENDED_MOVIES_URL,
+    STREAM_MOVIE_GRIDS,
+)
+from .cache_service import (
+    MemoryCacheBackend,
+    TTLCache,
+    create_cache_backend,
+    page_cache,
+)
+from .collaborative_service import collaborative_model
+from .http_service import (
+    api_session,
+    async_api_client,
+    is_client_error,
+    upstream_loop,
+)
+from .metrics_service import get_upstream_endpoint, server_timing, timed
+from .projection_service import DETAIL_PART_PROJECTIONS, project_movies
+from .recommendation_service import content_recommender, interleave_unique
+from .search_service import search_index
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-handler = logging.FileHandler("logs.txt")
+# Opened on the first record rather than on import.
+handler = logging.FileHandler("logs.txt", delay=True)
 handler.setLevel(logging.INFO)
 
 formatter = logging.Formatter(
@@ -18,32 +72,98 @@ handler.setFormatter(formatter)
 
 logger.addHandler(handler)
 
+ACCOUNT_STATE_KEYS = ["rated", "watchlist", "favorite"]
+# What the memberships index records of a movie, and the entry of a
+# movie in none of the user's lists, which is left out of the index.
+MEMBERSHIP_FIELDS = {
+    "rated": "rating",
+    "watchlist": "watchlisted",
+    "favorite": "favorited",
+}
+EMPTY_MEMBERSHIP = {"rating": None, "watchlisted": False, "favorited": False}
+MOVIE_DETAIL_PARTS = ["credits", "videos", "keywords"]
+PERSON_DETAIL_PARTS = ["images", "tagged_images", "movie_credits"]
+
+
+
+class SharedAccountStatesBackend:
+    """Keeps account states in the SQLite cache, so that every worker
+    process serves the same lists and sees the changes made through
+    the others.
+
+    Entries are stored under "account_states:<session_id>", and the
+    movie IDs of their memberships index, which JSON turns into
+    strings, are restored on the way out.
+    """
+
+    def __init__(self):
+        self.backend = create_cache_backend("sqlite")
+
+    def get(self, key: str):
+        entry = self.backend.get(f"account_states:{key}")
+        if entry is None:
+            return None
+        account_states, stored_at = entry
+        account_states["memberships"] = {
+            int(movie_id): membership
+            for movie_id, membership in account_states.get(
+                "memberships", {}
+            ).items()
+        }
+        return account_states, stored_at
+
+    def set(self, key: str, value: Dict[str, Any], stored_at: float):
+        self.backend.set(f"account_states:{key}", value, stored_at)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(f"account_states:{key}")
+
+
+account_states_cache = TTLCache(
+    SharedAccountStatesBackend()
+    if CACHE_BACKEND == "sqlite"
+    else MemoryCacheBackend(),
+    stale_ttl=ACCOUNT_STATES_STALE_TTL,
+    name="account_states",
+)
+
 
+def share_account_states() -> None:
+    """Moves the account states cache into the SQLite cache, for when
+    several worker processes serve the app. Call before forking."""
+    backend = account_states_cache.backend
+    if not isinstance(backend, SharedAccountStatesBackend):
+        account_states_cache.backend = SharedAccountStatesBackend()
+
+
+@timed("fetch")
 def aggregate_pages(
     pages: int,
     func: Callable = None,
+    max_workers: int = MAX_CONCURRENT_PAGE_REQUESTS,
     **kwargs,
 ) -> List[Dict[str, Any]]:
     """Fetches data from an API endpoint that supports pagination and
-    aggregates the results."""
-    try:
-        if pages == -1:
-            response = func(**kwargs)
-            pages = get_total_pages(response)
+    aggregates the results.
 
-        url = kwargs.get("url")
-        session_id = kwargs.get("session_id")
-        headers = kwargs.get("headers")
+    Pages are requested concurrently, at most max_workers at a time,
+    and merged back in page order. A page that fails to load is logged
+    and skipped without dropping the others.
 
-        kwargs.pop("url", None)
-        kwargs.pop("session_id", None)
-        kwargs.pop("headers", None)
+    Args:
+        pages (int): The number of pages to fetch, or -1 to fetch every
+            page the endpoint reports.
+        func (Callable, optional): The function to call for each page.
+            Defaults to None.
+        max_workers (int, optional): The maximum number of pages to
+            request at once. Defaults to MAX_CONCURRENT_PAGE_REQUESTS.
 
+    Returns:
+        List[Dict[str, Any]]: The results of every page, in page order.
+    """
+    try:
         results = []
-        for i in range(1, pages + 1):
-            page_data = get_page_data(
-                i, func, url, session_id, headers, **kwargs
-            )
+        for page_data in iter_pages(pages, func, max_workers, **kwargs):
             results.extend(page_data)
 
         return results
@@ -53,45 +173,560 @@ def aggregate_pages(
         return []
 
 
+def iter_pages(
+    pages: int,
+    func: Callable = None,
+    max_workers: int = MAX_CONCURRENT_PAGE_REQUESTS,
+    **kwargs,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yields the results of each page of a paginated API endpoint, in
+    page order, as soon as that page has arrived.
+
+    Takes the same arguments as aggregate_pages. Pages are requested
+    concurrently, at most max_workers at a time, or all at once on
+    upstream_loop in ASYNC_UPSTREAM mode. A page that fails to load is
+    yielded as an empty list.
+    """
+    url = kwargs.pop("url", None)
+    session_id = kwargs.pop("session_id", None)
+    headers = kwargs.pop("headers", None)
+
+    first_page = None
+    if pages == -1:
+        response = get_page_response(
+            1, func, url, session_id, headers, **kwargs
+        )
+        pages = response["total_pages"]
+        first_page = response["results"]
+        index_movies(first_page)
+        yield first_page
+
+    page_numbers = range(2 if first_page is not None else 1, pages + 1)
+
+    def fetch_page(page: int) -> List[Dict[str, Any]]:
+        return get_page_data(page, func, url, session_id, headers, **kwargs)
+
+    executor = None
+    futures = []
+    if ASYNC_UPSTREAM:
+        futures = [
+            upstream_loop.submit(
+                get_page_data_async(
+                    page, func, url, session_id, headers, **kwargs
+                )
+            )
+            for page in page_numbers
+        ]
+        page_data = (future.result() for future in futures)
+    elif max_workers > 1 and len(page_numbers) > 1:
+        executor = ThreadPoolExecutor(
+            max_workers=min(max_workers, len(page_numbers))
+        )
+        page_data = executor.map(fetch_page, page_numbers)
+    else:
+        page_data = map(fetch_page, page_numbers)
+
+    try:
+        for data in page_data:
+            index_movies(data)
+            yield data
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        for future in futures:
+            future.cancel()
+
+
+def index_movies(movies: List[Dict[str, Any]]) -> None:
+    """Adds fetched movies to the local recommender and search index."""
+    content_recommender.add_movies(movies)
+    search_index.add_movies(movies)
+
+
+@timed("fetch")
 def get_account_states(account: tmdb.Account) -> Dict[str, Any]:
     """Gets the account states for the user.
 
+    The states are cached per session: they are crawled once, kept up
+    to date by update_account_state and refreshed in the background
+    once ACCOUNT_STATES_TTL has passed. Changes that are queued but not
+    yet written to TMDB are applied to every crawl.
+
     Args:
         account (tmdb.Account): The account to get the states for.
 
     Returns:
-        Dict[str, Any]: The account states.
+        Dict[str, Any]: The rated, watchlist and favorite lists under
+            their ACCOUNT_STATE_KEYS, and the same lists indexed by
+            movie ID under "memberships", as built by
+            build_memberships.
+    """
+
+    def fetch() -> Dict[str, Any]:
+        methods = [
+            account.rated_movies,
+            account.watchlist_movies,
+            account.favorite_movies,
+        ]
+        if ASYNC_UPSTREAM:
+
+            async def fetch_lists() -> List[List[Dict[str, Any]]]:
+                return await asyncio.gather(
+                    *(aggregate_pages_async(-1, method) for method in methods)
+                )
+
+            lists = upstream_loop.run(fetch_lists())
+            for movies in lists:
+                index_movies(movies)
+        else:
+            with ThreadPoolExecutor(max_workers=len(methods)) as executor:
+                lists = list(
+                    executor.map(
+                        lambda method: aggregate_pages(-1, method), methods
+                    )
+                )
+
+        account_states = dict(zip(ACCOUNT_STATE_KEYS, lists))
+        account_states["memberships"] = build_memberships(account_states)
+        # TMDB's lists lack the changes still waiting to be written,
+        # including any made while they were fetched, which would
+        # otherwise be overwritten by a background refresh.
+        from .mutation_service import mutation_queue
+
+        for mutation in mutation_queue.get_pending(account.session_id):
+            account_states = apply_account_state_change(
+                account_states,
+                mutation["state"],
+                mutation["movie_id"],
+                bool(mutation["included"]),
+                **json.loads(mutation["fields"]),
+            )
+        return account_states
+
+    return account_states_cache.get_or_fetch(
+        account.session_id, fetch, ACCOUNT_STATES_TTL
+    )
+
+
+def update_account_state(
+    session_id: str,
+    state: str,
+    movie_id: Union[int, str],
+    included: bool,
+    **fields,
+) -> None:
+    """Applies a successful rating, watchlist or favorite change to the
+    user's cached account states.
+
+    Args:
+        session_id (str): The session the states are cached under.
+        state (str): One of "rated", "watchlist" or "favorite".
+        movie_id (Union[int, str]): The movie that changed.
+        included (bool): Whether the movie is now in the list.
+        **fields: Values to store on the movie's entry, e.g. rating.
+    """
+    account_states_cache.update(
+        session_id,
+        lambda account_states: apply_account_state_change(
+            account_states, state, movie_id, included, **fields
+        ),
+    )
+
+
+def apply_account_state_change(
+    account_states: Dict[str, Any],
+    state: str,
+    movie_id: Union[int, str],
+    included: bool,
+    **fields,
+) -> Dict[str, Any]:
+    """Returns a copy of account states with a rating, watchlist or
+    favorite change applied, taking the same arguments as
+    update_account_state."""
+    movie_id = int(movie_id)
+    movies = account_states.get(state, [])
+    existing = next(
+        (movie for movie in movies if movie.get("id") == movie_id), None
+    )
+    movies = [movie for movie in movies if movie is not existing]
+    movie = None
+    if included:
+        movie = {**(existing or {"id": movie_id}), **fields}
+        movies.append(movie)
+
+    # Copied rather than changed in place, since pages being rendered
+    # may be reading the cached index.
+    memberships = dict(account_states.get("memberships", {}))
+    set_membership(memberships, state, movie_id, movie)
+    return {**account_states, state: movies, "memberships": memberships}
+
+
+def build_memberships(
+    account_states: Dict[str, Any]
+) -> Dict[int, Dict[str, Any]]:
+    """Indexes the user's rated, watchlist and favorite lists by movie
+    ID, so that a movie's states can be looked up without searching the
+    lists.
+
+    Args:
+        account_states (Dict[str, Any]): The lists under their
+            ACCOUNT_STATE_KEYS.
+
+    Returns:
+        Dict[int, Dict[str, Any]]: For each movie in any of the lists,
+            its "rating", or None if unrated, and whether it is
+            "watchlisted" and "favorited".
+    """
+    memberships = {}
+    for state in ACCOUNT_STATE_KEYS:
+        for movie in account_states.get(state, []):
+            set_membership(memberships, state, movie["id"], movie)
+    return memberships
+
+
+def set_membership(
+    memberships: Dict[int, Dict[str, Any]],
+    state: str,
+    movie_id: int,
+    movie: Optional[Dict[str, Any]],
+) -> None:
+    """Records in memberships that a movie is now in the list named by
+    state, given its entry in that list, or that it is not, given None.
+    """
+    entry = {**memberships.get(movie_id, EMPTY_MEMBERSHIP)}
+    if state == "rated":
+        entry["rating"] = movie.get("rating") if movie else None
+    else:
+        entry[MEMBERSHIP_FIELDS[state]] = movie is not None
+
+    if entry == EMPTY_MEMBERSHIP:
+        memberships.pop(movie_id, None)
+    else:
+        memberships[movie_id] = entry
+
+
+def get_page_memberships(
+    account_states: Dict[str, Any],
+    movies: Union[List[Dict[str, Any]], Dict[str, Any], None],
+) -> Dict[int, Dict[str, Any]]:
+    """Picks the entries of the memberships index for the movies on a
+    page, leaving out movies in none of the user's lists.
+
+    Args:
+        account_states (Dict[str, Any]): The user's account states, or
+            an empty dict if the user is not logged in.
+        movies (Union[List[Dict[str, Any]], Dict[str, Any], None]): The
+            movies on the page, or the one movie of a detail page.
+
+    Returns:
+        Dict[int, Dict[str, Any]]: The index entries, by movie ID.
     """
-    methods = [
-        account.rated_movies,
-        account.watchlist_movies,
-        account.favorite_movies,
-    ]
-    keys = ["rated", "watchlist", "favorite"]
+    memberships = account_states.get("memberships", {})
+    if isinstance(movies, dict):
+        movies = [movies]
+    return {
+        movie["id"]: memberships[movie["id"]]
+        for movie in movies or []
+        if movie.get("id") in memberships
+    }
+
+
+def clear_account_states(session_id: str) -> None:
+    """Drops the user's cached account states."""
+    account_states_cache.invalidate(session_id)
 
-    account_states = {
-        key: aggregate_pages(-1, method) for key, method in zip(keys, methods)
+
+def get_local_movies(movie_ids: Iterable[int]) -> List[Dict[str, Any]]:
+    """Looks up movies by ID for rendering, in the catalog or else among
+    the movies the content recommender has seen.
+
+    The catalog is shared by every worker process, while the content
+    recommender only knows the movies its own process has served, so
+    IDs from a model trained elsewhere, such as the collaborative one,
+    are looked up in the catalog first.
+
+    Args:
+        movie_ids (Iterable[int]): The movie IDs.
+
+    Returns:
+        List[Dict[str, Any]]: The movies found, in the given order.
+    """
+    # Imported here, as catalog_service imports this module.
+    from .catalog_service import movie_catalog
+
+    movie_ids = list(movie_ids)
+    movies = {
+        movie["id"]: movie for movie in movie_catalog.get_movies(movie_ids)
     }
+    missing = [movie_id for movie_id in movie_ids if movie_id not in movies]
+    for movie in content_recommender.get_movies(missing):
+        movies[movie["id"]] = movie
+    return [movies[movie_id] for movie_id in movie_ids if movie_id in movies]
+
+
+@timed("fetch")
+def get_recommended_movies(
+    account: tmdb.Account,
+    source: str = RECOMMENDATION_SOURCE,
+    count: int = 100,
+) -> List[Dict[str, Any]]:
+    """Gets movie recommendations for the user.
+
+    Args:
+        account (tmdb.Account): The user's account.
+        source (str, optional): "tmdb" for TMDB's own recommendations,
+            "local" for the collaborative and content recommenders, or
+            "blended" for both, interleaved. "local" falls back to TMDB
+            while the recommenders know too little about the user.
+            Defaults to RECOMMENDATION_SOURCE.
+        count (int, optional): The number of local recommendations to
+            compute. Defaults to 100.
+
+    Returns:
+        List[Dict[str, Any]]: The recommended movies.
+    """
+    local_movies = []
+    if source in ("local", "blended"):
+        account_states = get_account_states(account)
+        local_movies = interleave_unique(
+            get_local_movies(
+                collaborative_model.recommend_for_user(account_states, count)
+            ),
+            content_recommender.recommend_for_user(account_states, count),
+        )
+        if source == "local" and local_movies:
+            return local_movies
+
+    tmdb_movies = aggregate_pages(
+        pages=5,
+        func=api_session.get,
+        url=RECOMMENDED_MOVIES_URL,
+        session_id=account.session_id,
+        headers=API_HEADERS,
+    )
+    return interleave_unique(local_movies, tmdb_movies)
+
+
+class IncompleteBundleError(Exception):
+    """Raised when some parts of a detail bundle could not be fetched.
+
+    Attributes:
+        bundle (Dict[str, Any]): The bundle, with the missing parts left
+            empty.
+    """
+
+    def __init__(self, bundle: Dict[str, Any], missing: List[str]):
+        super().__init__(f"Missing {', '.join(missing)}")
+        self.bundle = bundle
+        self.missing = missing
+
+
+class ResourceNotFoundError(Exception):
+    """Raised when TMDB rejects the request for a movie or person with
+    a client error, e.g. 404 because there is no such ID."""
+
+
+@timed("fetch")
+def get_detail_bundle(
+    resource: Union[tmdb.Movies, tmdb.People],
+    parts: List[str],
+    timeout: float = DETAIL_PART_TIMEOUT,
+) -> Dict[str, Any]:
+    """Fetches a movie's or person's info together with some of its
+    sub-resources.
+
+    The bundle is first requested in a single round-trip using TMDB's
+    append_to_response. If TMDB rejects it with a client error, such as
+    404 for an unknown ID, the movie or person is not found. If it fails
+    otherwise, info and every part are requested concurrently instead,
+    and any part that fails or is not back within timeout seconds is
+    left empty.
+
+    Complete bundles are kept in the page cache for DETAIL_CACHE_TTL.
+    A bundle missing only some parts is returned without being cached,
+    unless an expired complete bundle is still cached, which is
+    returned instead. A bundle without its info is never returned.
+
+    Args:
+        resource (Union[tmdb.Movies, tmdb.People]): The movie or person
+            to fetch.
+        parts (List[str]): The sub-resources to include, named after
+            their tmdbsimple methods, e.g. ["credits", "videos"].
+        timeout (float, optional): Seconds to wait for the parts in the
+            fallback path. Defaults to DETAIL_PART_TIMEOUT.
+
+    Returns:
+        Dict[str, Any]: The info under "info" and each part under its
+            own name.
+
+    Raises:
+        ResourceNotFoundError: If TMDB does not know the movie or
+            person.
+        IncompleteBundleError: If the info could not be fetched.
+    """
+    try:
+        return page_cache.get_or_fetch(
+            get_bundle_cache_key(resource, parts),
+            lambda: fetch_detail_bundle(resource, parts, timeout),
+            DETAIL_CACHE_TTL,
+            get_upstream_label(resource.info),
+        )
+    except IncompleteBundleError as e:
+        if "info" in e.missing:
+            raise
+        return e.bundle
+
+
+def refresh_detail_bundle(
+    resource: Union[tmdb.Movies, tmdb.People], parts: List[str]
+) -> bool:
+    """Fetches a detail bundle into the page cache ahead of
+    get_detail_bundle, unless the cached one is younger than half of
+    DETAIL_CACHE_TTL.
+
+    Returns:
+        bool: Whether the bundle was fetched.
+
+    Raises:
+        IncompleteBundleError: If some parts could not be fetched.
+    """
+    return page_cache.refresh(
+        get_bundle_cache_key(resource, parts),
+        lambda: fetch_detail_bundle(resource, parts),
+        DETAIL_CACHE_TTL / 2,
+    )
+
+
+def fetch_detail_bundle(
+    resource: Union[tmdb.Movies, tmdb.People],
+    parts: List[str],
+    timeout: float = DETAIL_PART_TIMEOUT,
+) -> Dict[str, Any]:
+    """Fetches a detail bundle for get_detail_bundle, bypassing the
+    cache. In ASYNC_UPSTREAM mode it is fetched on upstream_loop.
+
+    Raises:
+        ResourceNotFoundError: If TMDB does not know the movie or
+            person.
+        IncompleteBundleError: If some parts could not be fetched.
+    """
+    if ASYNC_UPSTREAM:
+        return upstream_loop.run(
+            fetch_detail_bundle_async(resource, parts, timeout)
+        )
+
+    try:
+        info = resource.info(append_to_response=",".join(parts))
+        bundle = {part: info.pop(part, {}) for part in parts}
+        bundle["info"] = info
+        return project_bundle(bundle)
+    except Exception as e:
+        if is_client_error(e):
+            raise ResourceNotFoundError(str(e)) from e
+        logger.error(f"Error in fetch_detail_bundle: {str(e)}")
+
+    names = ["info", *parts]
+    executor = ThreadPoolExecutor(max_workers=len(names))
+    futures = {
+        name: executor.submit(getattr(resource, name)) for name in names
+    }
+    wait(futures.values(), timeout=timeout)
+    executor.shutdown(wait=False)
+
+    bundle = {}
+    missing = []
+    for name, future in futures.items():
+        try:
+            bundle[name] = future.result(timeout=0)
+        except Exception as e:
+            if name == "info" and is_client_error(e):
+                raise ResourceNotFoundError(str(e)) from e
+            logger.error(f"Error fetching {name} in fetch_detail_bundle: {e}")
+            bundle[name] = {}
+            missing.append(name)
+
+    bundle = project_bundle(bundle)
+    if missing:
+        raise IncompleteBundleError(bundle, missing)
+    return bundle
+
+
+async def fetch_detail_bundle_async(
+    resource: Union[tmdb.Movies, tmdb.People],
+    parts: List[str],
+    timeout: float = DETAIL_PART_TIMEOUT,
+) -> Dict[str, Any]:
+    """Coroutine version of fetch_detail_bundle. Must run on
+    upstream_loop."""
+    try:
+        info = await call_tmdb_async(
+            resource.info, append_to_response=",".join(parts)
+        )
+        bundle = {part: info.pop(part, {}) for part in parts}
+        bundle["info"] = info
+        return project_bundle(bundle)
+    except Exception as e:
+        if is_client_error(e):
+            raise ResourceNotFoundError(str(e)) from e
+        logger.error(f"Error in fetch_detail_bundle_async: {str(e)}")
+
+    names = ["info", *parts]
+    results = await asyncio.gather(
+        *(
+            asyncio.wait_for(call_tmdb_async(getattr(resource, name)), timeout)
+            for name in names
+        ),
+        return_exceptions=True,
+    )
+
+    bundle = {}
+    missing = []
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            if name == "info" and is_client_error(result):
+                raise ResourceNotFoundError(str(result)) from result
+            logger.error(
+                f"Error fetching {name} in fetch_detail_bundle_async: "
+                f"{result}"
+            )
+            bundle[name] = {}
+            missing.append(name)
+        else:
+            bundle[name] = result
+
+    bundle = project_bundle(bundle)
+    if missing:
+        raise IncompleteBundleError(bundle, missing)
+    return bundle
+
 
-    return account_states
+def project_bundle(bundle: Dict[str, Any]) -> Dict[str, Any]:
+    """Reduces the parts of a detail bundle that have a projection in
+    DETAIL_PART_PROJECTIONS to the fields the pages use."""
+    for name, project_part in DETAIL_PART_PROJECTIONS.items():
+        if name in bundle:
+            bundle[name] = project_part(bundle[name])
+    return bundle
 
 
 def render_template_page(
     title: str,
-    account: tmdb.Account,
+    account: Optional[tmdb.Account],
     func: Callable = None,
     template_name: str = "index.html",
     pages: int = 5,
     logged_in: bool = False,
     **kwargs,
-) -> str:
+) -> Union[str, Response]:
     """Renders the movie template.
 
     Args:
         title (str): The title of the page.
-        account (tmdb.Account): The account to get the states for.
-        func (Callable, optional): The function to call.
-            Defaults to None.
+        account (Optional[tmdb.Account]): The current user's account,
+            as returned by login_service.get_account, or None if the
+            user is not logged in.
+        func (Callable, optional): The function to call. Only called
+            if no movies are passed in. Defaults to None.
         template_name (str, optional): The name of the template.
             Defaults to "index.html".
         pages (int, optional): The number of pages to fetch.
@@ -100,51 +735,148 @@ def render_template_page(
             Defaults to False.
 
     Returns:
-        str: The rendered template.
+        Union[str, Response]: The rendered template. When the movies of
+            index.html have to be fetched, the browser loads them from
+            the same route: the page is rendered with the first page of
+            movies and the browser loads the next ones as the user
+            scrolls with ?format=json&cursor=..., or the page is
+            rendered without movies and all pages are streamed with
+            ?format=ndjson. Each batch of movies comes
+            with the user's ratings, watchlist and favorites of just
+            those movies, as picked by get_page_memberships.
     """
-    movies = (
-        aggregate_pages(pages, func, **kwargs)
-        if func
-        else kwargs.get("movies", [])
+    movies = kwargs.pop("movies", None)
+    list_url = stream_url = next_cursor = None
+    is_movie_grid = func is not None and template_name == "index.html"
+    view_format = request.args.get("format")
+    account_states = (
+        get_account_states(account) if logged_in and account else {}
     )
+    if is_movie_grid and view_format == "json":
+        page = get_movie_list_page(func, request.args.get("cursor"), **kwargs)
+        page["memberships"] = get_page_memberships(
+            account_states, page["results"]
+        )
+        return jsonify(page)
+    if is_movie_grid and view_format == "ndjson":
+        return stream_pages(
+            pages, func, account_states=account_states, **kwargs
+        )
+
+    if not movies and is_movie_grid:
+        if INFINITE_SCROLL:
+            page = get_movie_list_page(func, None, **kwargs)
+            movies = page["results"]
+            next_cursor = page["next_cursor"]
+            if next_cursor is not None:
+                list_url = get_format_url("json")
+        elif STREAM_MOVIE_GRIDS:
+            stream_url = get_format_url("ndjson")
+        else:
+            movies = aggregate_pages(pages, func, **kwargs)
+    elif not movies:
+        movies = aggregate_pages(pages, func, **kwargs) if func else []
+
+    with server_timing("render"):
+        return render_template(
+            template_name,
+            movies=movies or [],
+            list_url=list_url,
+            next_cursor=next_cursor,
+            stream_url=stream_url,
+            title=title,
+            memberships=get_page_memberships(account_states, movies),
+            movie_cast=kwargs.get("movie_cast", []),
+            media_items=kwargs.get("media_items", []),
+            person_info=kwargs.get("person_info", []),
+            person_portraits=kwargs.get("person_portraits", []),
+            person_tagged_images=kwargs.get("person_tagged_images", []),
+            person_movie_credits=kwargs.get("person_movie_credits", []),
+            more_url=kwargs.get("more_url"),
+            next_offset=kwargs.get("next_offset"),
+        )
 
-    account_states = get_account_states(account) if logged_in else {}
-
-    return render_template(
-        template_name,
-        movies=movies,
-        title=title,
-        rated_movies=account_states.get("rated", []),
-        watchlist_movies=account_states.get("watchlist", []),
-        favorite_movies=account_states.get("favorite", []),
-        account_states=account_states,
-        movie_cast=kwargs.get("movie_cast", []),
-        media_items=kwargs.get("media_items", []),
-        person_info=kwargs.get("person_info", []),
-        person_portraits=kwargs.get("person_portraits", []),
-        person_tagged_images=kwargs.get("person_tagged_images", []),
-        person_movie_credits=kwargs.get("person_movie_credits", []),
+
+def get_format_url(view_format: str) -> str:
+    """Builds the URL of the current page in another format."""
+    return url_for(
+        request.endpoint,
+        **{**request.view_args, **request.args, "format": view_format},
     )
 
 
-def clean_data(
-    data: Union[Dict[str, Any], List[Any], Any]
-) -> Union[Dict[str, Any], List[Any], Any]:
-    """Recursively removes any keys or values that are None from a
-    dictionary or list.
+@timed("fetch")
+def get_movie_list_page(
+    func: Callable, cursor: Optional[str] = None, **kwargs
+) -> Dict[str, Any]:
+    """Fetches one page of a paginated API endpoint for infinite
+    scrolling.
+
+    Takes the same keyword arguments as aggregate_pages.
 
     Args:
-        data (Union[Dict[str, Any], List[Any], Any]): The data to clean.
+        func (Callable): The function to call for the page.
+        cursor (Optional[str], optional): The next_cursor of the
+            previous page, or None for the first page. Defaults to
+            None.
 
     Returns:
-        Union[Dict[str, Any], List[Any], Any]: The cleaned data.
+        Dict[str, Any]: The page's movies under "results" and the
+            cursor of the following page under "next_cursor", which is
+            None after the last page.
     """
-    if isinstance(data, dict):
-        return {k: clean_data(v) for k, v in data.items() if v is not None}
-    elif isinstance(data, list):
-        return [clean_data(v) for v in data if v is not None]
-    else:
-        return data
+    page = int(cursor) if cursor and cursor.isdigit() else 1
+    url = kwargs.pop("url", None)
+    session_id = kwargs.pop("session_id", None)
+    headers = kwargs.pop("headers", None)
+
+    try:
+        response = get_page_response(
+            page, func, url, session_id, headers, **kwargs
+        )
+    except Exception as e:
+        logger.error(f"Error in get_movie_list_page: {str(e)}")
+        return {"results": [], "next_cursor": None}
+
+    index_movies(response["results"])
+    has_next_page = page < response["total_pages"]
+    return {
+        "results": response["results"],
+        "next_cursor": str(page + 1) if has_next_page else None,
+    }
+
+
+def stream_pages(
+    pages: int,
+    func: Callable,
+    account_states: Optional[Dict[str, Any]] = None,
+    **kwargs,
+) -> Response:
+    """Streams the results of a paginated API endpoint as NDJSON, one
+    line per page, flushing each page as soon as it has arrived.
+
+    Takes the same arguments as aggregate_pages. Each line holds the
+    page's movies under "results" and their entries of the memberships
+    index of account_states under "memberships".
+    """
+
+    def generate() -> Iterator[str]:
+        try:
+            for page_data in iter_pages(pages, func, **kwargs):
+                memberships = get_page_memberships(
+                    account_states or {}, page_data
+                )
+                yield json.dumps(
+                    {"results": page_data, "memberships": memberships}
+                ) + "\n"
+        except Exception as e:
+            logger.error(f"Error in stream_pages: {str(e)}")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
 
 
 def get_total_pages(response: Union[dict, requests.models.Response]) -> int:
@@ -157,6 +889,18 @@ def get_total_pages(response: Union[dict, requests.models.Response]) -> int:
         return 1
 
 
+def get_page_results(
+    response: Union[dict, requests.models.Response]
+) -> List[Dict[str, Any]]:
+    """Extracts the projected results list from a page response."""
+    if isinstance(response, dict):
+        return project_movies(response.get("results"))
+    elif isinstance(response, requests.models.Response):
+        return project_movies(response.json().get("results"))
+    else:
+        return []
+
+
 def get_page_data(
     page: int,
     func: Callable = None,
@@ -167,17 +911,294 @@ def get_page_data(
 ) -> List[Dict[str, Any]]:
     """Fetches data for one page."""
     try:
-        if url:
-            request_url = url.format(session_id=session_id, page=page)
-            response = func(request_url, headers=headers)
-        else:
-            response = func(page=page, **kwargs)
-
-        if isinstance(response, dict):
-            return clean_data(response.get("results", []))
-        elif isinstance(response, requests.models.Response):
-            return clean_data(response.json().get("results", []))
+        response = get_page_response(
+            page, func, url, session_id, headers, **kwargs
+        )
+        return response["results"]
 
     except Exception as e:
         logger.error(f"Error in get_page_data: {str(e)}")
         return []
+
+
+def get_page_response(
+    page: int,
+    func: Callable = None,
+    url: str = None,
+    session_id: str = None,
+    headers: Dict[str, str] = None,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Fetches one page and reduces it to its projected results and total
+    page count.
+
+    Pages of public endpoints listed in PAGE_CACHE_TTLS are served
+    from the shared page cache. In ASYNC_UPSTREAM mode the page is
+    fetched on upstream_loop. Errors are raised to the caller.
+    """
+    if ASYNC_UPSTREAM:
+        return upstream_loop.run(
+            get_page_response_async(
+                page, func, url, session_id, headers, **kwargs
+            )
+        )
+
+    endpoint = get_endpoint_name(func)
+    ttl = None if url else PAGE_CACHE_TTLS.get(endpoint)
+    if ttl is None:
+        return fetch_page_response(
+            page, func, url, session_id, headers, **kwargs
+        )
+    return page_cache.get_or_fetch(
+        get_page_cache_key(page, func, kwargs),
+        lambda: fetch_page_response(page, func, **kwargs),
+        ttl,
+        get_upstream_label(func),
+    )
+
+
+def refresh_page(page: int, func: Callable, **kwargs) -> bool:
+    """Fetches a page of a cached endpoint into the page cache ahead of
+    get_page_response, unless the cached page is younger than half of
+    its TTL.
+
+    Returns:
+        bool: Whether the page was fetched. Endpoints that are not
+            cached are never fetched.
+    """
+    ttl = PAGE_CACHE_TTLS.get(get_endpoint_name(func))
+    if ttl is None:
+        return False
+
+    def fetch() -> Dict[str, Any]:
+        if ASYNC_UPSTREAM:
+            return upstream_loop.run(
+                fetch_page_response_async(page, func, **kwargs)
+            )
+        return fetch_page_response(page, func, **kwargs)
+
+    return page_cache.refresh(
+        get_page_cache_key(page, func, kwargs), fetch, ttl / 2
+    )
+
+
+def fetch_page_response(
+    page: int,
+    func: Callable = None,
+    url: str = None,
+    session_id: str = None,
+    headers: Dict[str, str] = None,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Fetches a page for get_page_response, bypassing the cache."""
+    if url:
+        request_url = url.format(session_id=session_id, page=page)
+        response = func(request_url, headers=headers)
+    else:
+        response = func(page=page, **kwargs)
+
+    return {
+        "results": get_page_results(response),
+        "total_pages": get_total_pages(response),
+    }
+
+
+async def get_page_response_async(
+    page: int,
+    func: Callable = None,
+    url: str = None,
+    session_id: str = None,
+    headers: Dict[str, str] = None,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Coroutine version of get_page_response. Must run on
+    upstream_loop."""
+    endpoint = get_endpoint_name(func)
+    ttl = None if url else PAGE_CACHE_TTLS.get(endpoint)
+    if ttl is None:
+        return await fetch_page_response_async(
+            page, func, url, session_id, headers, **kwargs
+        )
+    return await page_cache.get_or_fetch_async(
+        get_page_cache_key(page, func, kwargs),
+        lambda: fetch_page_response_async(page, func, **kwargs),
+        ttl,
+        get_upstream_label(func),
+    )
+
+
+async def fetch_page_response_async(
+    page: int,
+    func: Callable = None,
+    url: str = None,
+    session_id: str = None,
+    headers: Dict[str, str] = None,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Coroutine version of fetch_page_response. Must run on
+    upstream_loop."""
+    if url:
+        request_url = url.format(session_id=session_id, page=page)
+        response = await async_api_client.get(request_url, headers=headers)
+    else:
+        response = await call_tmdb_async(func, page=page, **kwargs)
+
+    return {
+        "results": get_page_results(response),
+        "total_pages": get_total_pages(response),
+    }
+
+
+async def get_page_data_async(
+    page: int,
+    func: Callable = None,
+    url: str = None,
+    session_id: str = None,
+    headers: Dict[str, str] = None,
+    **kwargs,
+) -> List[Dict[str, Any]]:
+    """Coroutine version of get_page_data. Must run on upstream_loop."""
+    try:
+        response = await get_page_response_async(
+            page, func, url, session_id, headers, **kwargs
+        )
+        return response["results"]
+
+    except Exception as e:
+        logger.error(f"Error in get_page_data_async: {str(e)}")
+        return []
+
+
+async def aggregate_pages_async(
+    pages: int, func: Callable = None, **kwargs
+) -> List[Dict[str, Any]]:
+    """Coroutine version of aggregate_pages, requesting every page at
+    once. Unlike aggregate_pages it does not index the movies, which is
+    left to the caller, off the event loop. Must run on upstream_loop.
+    """
+    url = kwargs.pop("url", None)
+    session_id = kwargs.pop("session_id", None)
+    headers = kwargs.pop("headers", None)
+
+    results = []
+    first_page = 1
+    if pages == -1:
+        try:
+            response = await get_page_response_async(
+                1, func, url, session_id, headers, **kwargs
+            )
+        except Exception as e:
+            logger.error(f"Error in aggregate_pages_async: {str(e)}")
+            return []
+        pages = response["total_pages"]
+        results.extend(response["results"])
+        first_page = 2
+
+    page_data = await asyncio.gather(
+        *(
+            get_page_data_async(page, func, url, session_id, headers, **kwargs)
+            for page in range(first_page, pages + 1)
+        )
+    )
+    for data in page_data:
+        results.extend(data)
+    return results
+
+
+class _RequestCaptured(Exception):
+    pass
+
+
+def describe_tmdb_request(func: Callable, **kwargs) -> Dict[str, Any]:
+    """Works out the HTTP request a bound tmdbsimple method would send,
+    without sending it.
+
+    Args:
+        func (Callable): The tmdbsimple method, e.g.
+            tmdb.Movies().popular.
+        **kwargs: The arguments to call it with.
+
+    Returns:
+        Dict[str, Any]: The request's method, url, params and json body.
+    """
+    # The method is called on a copy of its object whose _request
+    # records the request instead of sending it.
+    owner = copy.copy(func.__self__)
+    request_args = {}
+
+    def capture(method, path, params=None, payload=None):
+        request_args.update(
+            method=method,
+            url=owner._get_complete_url(path),
+            params=owner._get_params(params),
+            json=payload,
+        )
+        raise _RequestCaptured
+
+    owner._request = capture
+    try:
+        getattr(owner, func.__name__)(**kwargs)
+    except _RequestCaptured:
+        pass
+    return request_args
+
+
+async def call_tmdb_async(func: Callable, **kwargs) -> Dict[str, Any]:
+    """Sends the request of a bound tmdbsimple method through
+    async_api_client. Must run on upstream_loop.
+
+    Args:
+        func (Callable): The tmdbsimple method, e.g.
+            tmdb.Movies().popular.
+        **kwargs: The arguments to call it with.
+
+    Returns:
+        Dict[str, Any]: The decoded response.
+    """
+    request_args = describe_tmdb_request(func, **kwargs)
+    method = request_args.pop("method")
+    url = request_args.pop("url")
+    return await async_api_client.request(method, url, **request_args)
+
+
+def get_bundle_cache_key(
+    resource: Union[tmdb.Movies, tmdb.People], parts: List[str]
+) -> str:
+    """Builds the page cache key of a movie's or person's detail
+    bundle."""
+    return json.dumps(
+        [f"{type(resource).__name__}.bundle", str(resource.id), parts]
+    )
+
+
+def get_page_cache_key(
+    page: int, func: Callable, kwargs: Dict[str, Any]
+) -> str:
+    """Builds the page cache key of a page of a tmdbsimple endpoint."""
+    owner_id = getattr(func.__self__, "id", None)
+    return json.dumps(
+        [get_endpoint_name(func), owner_id, page, kwargs], sort_keys=True
+    )
+
+
+def get_upstream_label(func: Callable) -> str:
+    """Labels a bound tmdbsimple method with the upstream endpoint it
+    calls, as get_upstream_endpoint names the URLs of upstream calls,
+    e.g. "3/movie/popular", so that cache lookups can be matched with
+    the calls they save. Other callables are named by
+    get_endpoint_name."""
+    owner = getattr(func, "__self__", None)
+    path = getattr(owner, "URLS", {}).get(getattr(func, "__name__", ""))
+    if path is None:
+        return get_endpoint_name(func)
+    url = owner._get_complete_url(owner.BASE_PATH + path)
+    return get_upstream_endpoint(url)
+
+
+def get_endpoint_name(func: Callable) -> str:
+    """Names a bound tmdbsimple method as "Class.method", e.g.
+    "Movies.popular". Other callables are named by their own name."""
+    owner = getattr(func, "__self__", None)
+    if owner is None:
+        return getattr(func, "__name__", "")
+    return f"{type(owner).__name__}.{func.__name__}"
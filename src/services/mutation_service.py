@@ -0,0 +1,306 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import requests
+import tmdbsimple as tmdb
+
+from ..constants.api_constants import (
+    MUTATION_FLUSH_DELAY,
+    MUTATION_MAX_ATTEMPTS,
+    MUTATION_QUEUE_PATH,
+)
+from .metrics_service import mutations
+from .movie_service import clear_account_states
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for writes queued by other worker processes.
+POLL_INTERVAL = 1
+MAX_RETRY_DELAY = 300
+# Seconds a worker has to send the writes it claimed before the others
+# may take them over, e.g. because it was killed while sending.
+CLAIM_LEASE = 120
+# Upstream statuses worth retrying. Any other error status means the
+# write can never succeed, e.g. because the session has expired.
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+COLUMNS = [
+    "session_id",
+    "state",
+    "movie_id",
+    "included",
+    "fields",
+    "account_id",
+    "attempts",
+    "due_at",
+    "version",
+]
+
+
+class MutationQueue:
+    """Queues rating, watchlist and favorite changes and writes them to
+    TMDB in the background.
+
+    Changes are kept in a local SQLite file, so that pending writes
+    survive restarts and are shared by every worker process. There is
+    one pending write per session, list and movie: a change replaces
+    any pending change to the same movie, so rapid repeated clicks are
+    sent as one write of the last value. A write is sent flush_delay
+    seconds after the last change, and retried with exponential backoff
+    when TMDB fails or is unreachable.
+    """
+
+    def __init__(
+        self,
+        path: str = MUTATION_QUEUE_PATH,
+        flush_delay: float = MUTATION_FLUSH_DELAY,
+        max_attempts: int = MUTATION_MAX_ATTEMPTS,
+    ):
+        self.path = path
+        self.flush_delay = flush_delay
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._thread = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections are opened on first use in each thread, so that
+        # none is opened before worker processes are forked.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS mutations ("
+                "session_id TEXT NOT NULL, state TEXT NOT NULL, "
+                "movie_id INTEGER NOT NULL, included INTEGER NOT NULL, "
+                "fields TEXT NOT NULL, account_id INTEGER, "
+                "attempts INTEGER NOT NULL, due_at REAL NOT NULL, "
+                "version INTEGER NOT NULL, "
+                "PRIMARY KEY (session_id, state, movie_id))"
+            )
+            self._local.connection = connection
+        return connection
+
+    def enqueue(
+        self,
+        session_id: str,
+        state: str,
+        movie_id: Union[int, str],
+        included: bool,
+        account_id: Optional[int] = None,
+        **fields,
+    ) -> None:
+        """Queues a change, replacing any pending change to the same
+        movie in the same list.
+
+        Args:
+            session_id (str): The TMDB session to write with.
+            state (str): One of "rated", "watchlist" or "favorite".
+            movie_id (Union[int, str]): The movie that changed.
+            included (bool): Whether the movie is now in the list.
+            account_id (Optional[int], optional): The TMDB account ID,
+                required for watchlist and favorite changes. Defaults
+                to None.
+            **fields: Values of the change, e.g. rating.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO mutations "
+                f"({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                (
+                    session_id,
+                    state,
+                    int(movie_id),
+                    int(included),
+                    json.dumps(fields),
+                    account_id,
+                    0,
+                    time.time() + self.flush_delay,
+                    time.time_ns(),
+                ),
+            )
+        mutations.inc(state=state, result="queued")
+        self._wake.set()
+
+    def get_pending(self, session_id: str) -> List[Dict[str, Any]]:
+        """Returns a session's queued changes, oldest first."""
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM mutations "
+                "WHERE session_id = ? ORDER BY version",
+                (session_id,),
+            ).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def start(self) -> None:
+        """Starts flushing in the background, including any writes left
+        pending by a previous run. Does nothing if already started."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="mutation-queue", daemon=True
+            )
+            self._thread.start()
+
+    def flush(self) -> int:
+        """Sends the writes that are due.
+
+        The writes are claimed first, by pushing them CLAIM_LEASE
+        seconds into the future in the same transaction that reads them,
+        so that the flushers of other worker processes do not send them
+        again.
+
+        Returns:
+            int: The number of writes attempted.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            # Taking the write lock before reading keeps another process
+            # from reading the same rows before they are claimed.
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM mutations "
+                "WHERE due_at <= ? ORDER BY due_at",
+                (now,),
+            ).fetchall()
+            connection.execute(
+                "UPDATE mutations SET due_at = ? WHERE due_at <= ?",
+                (now + CLAIM_LEASE, now),
+            )
+        for row in rows:
+            self._send(dict(zip(COLUMNS, row)))
+        return len(rows)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.flush()
+                delay = self._get_next_delay()
+            except Exception as e:
+                logger.error(f"Error flushing mutations: {str(e)}")
+                delay = POLL_INTERVAL
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    def _get_next_delay(self) -> float:
+        with self._connect() as connection:
+            (due_at,) = connection.execute(
+                "SELECT MIN(due_at) FROM mutations"
+            ).fetchone()
+        if due_at is None:
+            return POLL_INTERVAL
+        return min(max(due_at - time.time(), 0), POLL_INTERVAL)
+
+    def _send(self, mutation: Dict[str, Any]) -> None:
+        try:
+            write_mutation(mutation)
+        except Exception as e:
+            self._handle_failure(mutation, e)
+            return
+
+        mutations.inc(state=mutation["state"], result="sent")
+        self._delete(mutation)
+
+    def _handle_failure(
+        self, mutation: Dict[str, Any], error: Exception
+    ) -> None:
+        attempts = mutation["attempts"] + 1
+        description = (
+            f"{mutation['state']} change to movie {mutation['movie_id']}"
+        )
+        if attempts >= self.max_attempts or not is_retryable(error):
+            logger.error(f"Dropping {description}: {str(error)}")
+            mutations.inc(state=mutation["state"], result="dropped")
+            self._delete(mutation)
+            # The cached lists show the change, which TMDB never got.
+            clear_account_states(mutation["session_id"])
+            return
+
+        delay = min(self.flush_delay * 2**attempts, MAX_RETRY_DELAY)
+        logger.warning(
+            f"Retrying {description} in {delay:.0f}s: {str(error)}"
+        )
+        mutations.inc(state=mutation["state"], result="retried")
+        with self._connect() as connection:
+            # Matching the version leaves a newer change to the same
+            # movie, made while this one was being sent, untouched.
+            connection.execute(
+                "UPDATE mutations SET attempts = ?, due_at = ? "
+                "WHERE session_id = ? AND state = ? AND movie_id = ? "
+                "AND version = ?",
+                (
+                    attempts,
+                    time.time() + delay,
+                    mutation["session_id"],
+                    mutation["state"],
+                    mutation["movie_id"],
+                    mutation["version"],
+                ),
+            )
+
+    def _delete(self, mutation: Dict[str, Any]) -> None:
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM mutations WHERE session_id = ? AND state = ? "
+                "AND movie_id = ? AND version = ?",
+                (
+                    mutation["session_id"],
+                    mutation["state"],
+                    mutation["movie_id"],
+                    mutation["version"],
+                ),
+            )
+
+
+def write_mutation(mutation: Dict[str, Any]) -> None:
+    """Sends a queued change to TMDB.
+
+    Raises:
+        requests.RequestException: If TMDB cannot be reached or rejects
+            the change.
+    """
+    session_id = mutation["session_id"]
+    movie_id = mutation["movie_id"]
+    included = bool(mutation["included"])
+    state = mutation["state"]
+
+    if state == "rated":
+        movie = tmdb.Movies(movie_id)
+        if included:
+            fields = json.loads(mutation["fields"])
+            movie.rating(value=fields["rating"], session_id=session_id)
+        else:
+            movie.rating_delete(session_id=session_id)
+        return
+
+    account = tmdb.Account(session_id)
+    account.id = mutation["account_id"]
+    if state == "watchlist":
+        account.watchlist(
+            media_type="movie", media_id=movie_id, watchlist=included
+        )
+    elif state == "favorite":
+        account.favorite(
+            media_type="movie", media_id=movie_id, favorite=included
+        )
+    else:
+        raise ValueError(f"Unknown account state {state}")
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed write may succeed if sent again."""
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is None or response.status_code in RETRY_STATUSES
+    return isinstance(error, requests.RequestException)
+
+
+mutation_queue = MutationQueue()
@@ -0,0 +1,315 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import tmdbsimple as tmdb
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the server runs in one process.
+    fcntl = None
+
+from ..constants.api_constants import (
+    PAGE_CACHE_TTLS,
+    PREFETCH_BUDGET,
+    PREFETCH_DETAIL_MOVIES,
+    PREFETCH_JITTER,
+    PREFETCH_LOCK_PATH,
+    PREFETCH_PAGES,
+    PREFETCH_REFRESH_FRACTION,
+)
+from ..constants.movie_constants import GENRES
+from .cache_service import page_cache
+from .metrics_service import prefetch_last_refresh, prefetch_refreshes
+from .movie_service import (
+    MOVIE_DETAIL_PARTS,
+    get_endpoint_name,
+    get_page_cache_key,
+    index_movies,
+    refresh_detail_bundle,
+    refresh_page,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the first runs of consecutive jobs, so that the lists
+# are warmed one after another in order rather than all at once.
+STARTUP_STAGGER = 1
+# Seconds until a job that ran out of budget or hit an error runs again.
+RETRY_DELAY = 60
+# Seconds between attempts to take over prefetching from another
+# process.
+LOCK_POLL_INTERVAL = 5
+
+# A refresh names the entry it visits and returns whether it was
+# fetched from TMDB.
+Refresh = Tuple[str, Callable[[], bool]]
+
+
+class PrefetchJob:
+    """A hot list to keep in the page cache: its first pages, and the
+    detail bundles of the first movies on its first page.
+
+    Attributes:
+        name (str): The path of the list's page, e.g. "/top-rated".
+        interval (float): Seconds between runs, before jitter.
+        last_refreshed_at (Optional[float]): When the last run that
+            refreshed every entry ended, in Unix time.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable,
+        pages: int = PREFETCH_PAGES,
+        detail_movies: int = PREFETCH_DETAIL_MOVIES,
+        **kwargs,
+    ):
+        self.name = name
+        self.func = func
+        self.pages = pages
+        self.detail_movies = detail_movies
+        self.kwargs = kwargs
+        self.interval = (
+            PAGE_CACHE_TTLS[get_endpoint_name(func)]
+            * PREFETCH_REFRESH_FRACTION
+        )
+        self.next_run_at = 0.0
+        self.last_refreshed_at: Optional[float] = None
+        self.last_run: Dict[str, Any] = {}
+
+    def refreshes(self) -> Iterator[Refresh]:
+        """Yields the job's refreshes in order. The movies whose bundles
+        are refreshed are read from the cached first page, so they are
+        only known once the pages have been refreshed."""
+        for page in range(1, self.pages + 1):
+            yield f"page {page}", partial(self.refresh_page, page)
+
+        entry = page_cache.backend.get(
+            get_page_cache_key(1, self.func, self.kwargs)
+        )
+        movies = entry[0]["results"] if entry is not None else []
+        for movie in movies[: self.detail_movies]:
+            yield f"movie {movie['id']}", partial(
+                refresh_detail_bundle,
+                tmdb.Movies(movie["id"]),
+                MOVIE_DETAIL_PARTS,
+            )
+
+    def refresh_page(self, page: int) -> bool:
+        fetched = refresh_page(page, self.func, **self.kwargs)
+        if fetched:
+            entry = page_cache.backend.get(
+                get_page_cache_key(page, self.func, self.kwargs)
+            )
+            if entry is not None:
+                index_movies(entry[0]["results"])
+        return fetched
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "last_refreshed_at": format_timestamp(self.last_refreshed_at),
+            "next_run_in": max(self.next_run_at - time.monotonic(), 0),
+            "last_run": self.last_run,
+        }
+
+
+class PrefetchScheduler:
+    """Runs prefetch jobs on a background thread, each again after a
+    jittered fraction of its TTL, so that hot lists are refreshed
+    before they expire instead of on a user's request.
+
+    At most budget TMDB requests are made in any minute. Refreshes that
+    do not fit in the budget are deferred, and their job runs again
+    after RETRY_DELAY.
+
+    When several worker processes serve the app, only the one holding
+    an exclusive lock on lock_path runs the jobs. The others wait for
+    the lock, so that one of them takes over if that process exits.
+    """
+
+    def __init__(
+        self,
+        budget: int = PREFETCH_BUDGET,
+        jitter: float = PREFETCH_JITTER,
+        lock_path: str = PREFETCH_LOCK_PATH,
+    ):
+        self.budget = budget
+        self.jitter = jitter
+        self.lock_path = lock_path
+        self.jobs: List[PrefetchJob] = []
+        self._lock_fd = None
+        self._requests: Deque[float] = deque()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts the scheduler, with the hot list jobs if none were
+        added. Does nothing if it is already running.
+
+        Called on the first request rather than at import, so that the
+        jobs are created once tmdbsimple is set up, and only in the
+        processes that serve requests.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            if not self.jobs:
+                self.jobs = create_hot_list_jobs()
+            self._thread = threading.Thread(
+                target=self._run, name="prefetch", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run_job(self, job: PrefetchJob) -> None:
+        """Runs a job's refreshes within the budget and schedules its
+        next run."""
+        started_at = time.monotonic()
+        results = {"fetched": 0, "fresh": 0, "deferred": 0, "error": 0}
+        last_error = None
+        for entry, refresh in job.refreshes():
+            if not self._has_budget():
+                result = "deferred"
+            else:
+                try:
+                    result = "fetched" if refresh() else "fresh"
+                except Exception as e:
+                    result = "error"
+                    last_error = f"{entry}: {str(e)}"
+                    logger.error(
+                        f"Error prefetching {entry} of {job.name}: {str(e)}"
+                    )
+                if result != "fresh":
+                    with self._lock:
+                        self._requests.append(time.monotonic())
+            results[result] += 1
+            prefetch_refreshes.inc(job=job.name, result=result)
+
+        finished_at = time.monotonic()
+        job.last_run = {
+            **results,
+            "seconds": finished_at - started_at,
+            "error": last_error,
+        }
+        if results["deferred"] or results["error"]:
+            job.next_run_at = finished_at + RETRY_DELAY
+            return
+
+        job.last_refreshed_at = time.time()
+        prefetch_last_refresh.set(job.last_refreshed_at, job=job.name)
+        job.next_run_at = finished_at + job.interval * random.uniform(
+            1 - self.jitter, 1 + self.jitter
+        )
+
+    def status(self) -> Dict[str, Any]:
+        """Describes the budget and every job, including when it last
+        refreshed all of its entries."""
+        return {
+            "running": self._thread is not None,
+            "leader": self._lock_fd is not None,
+            "budget": {
+                "per_minute": self.budget,
+                "used": self._count_recent_requests(),
+            },
+            "jobs": [job.status() for job in self.jobs],
+        }
+
+    def _run(self) -> None:
+        while not self._acquire_lock():
+            if self._stopped.wait(LOCK_POLL_INTERVAL):
+                return
+        now = time.monotonic()
+        for index, job in enumerate(self.jobs):
+            job.next_run_at = now + index * STARTUP_STAGGER
+
+        while not self._stopped.is_set():
+            job = min(self.jobs, key=lambda job: job.next_run_at)
+            delay = job.next_run_at - time.monotonic()
+            if delay > 0:
+                self._stopped.wait(delay)
+                continue
+            try:
+                self.run_job(job)
+            except Exception as e:
+                logger.error(f"Error running prefetch job {job.name}: {e}")
+                job.next_run_at = time.monotonic() + RETRY_DELAY
+
+    def _acquire_lock(self) -> bool:
+        """Takes the lock on lock_path without waiting for it, and keeps
+        it until the process exits.
+
+        Returns:
+            bool: Whether this process now holds the lock.
+        """
+        if fcntl is None:
+            return True
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _has_budget(self) -> bool:
+        return self._count_recent_requests() < self.budget
+
+    def _count_recent_requests(self) -> int:
+        window_start = time.monotonic() - 60
+        with self._lock:
+            while self._requests and self._requests[0] < window_start:
+                self._requests.popleft()
+            return len(self._requests)
+
+
+def create_hot_list_jobs() -> List[PrefetchJob]:
+    """Creates a job for each of the lists every visitor can open: the
+    home page, the top rated, in theaters and upcoming pages, and each
+    genre page."""
+    movies = tmdb.Movies()
+    jobs = [
+        PrefetchJob("/", movies.popular),
+        PrefetchJob("/top-rated", movies.top_rated),
+        PrefetchJob("/in-theaters", movies.now_playing),
+        PrefetchJob("/upcoming-movies", movies.upcoming),
+    ]
+    discover = tmdb.Discover()
+    for genre, genre_id in GENRES.items():
+        jobs.append(
+            PrefetchJob(
+                f"/{genre}-movies", discover.movie, with_genres=genre_id
+            )
+        )
+    return jobs
+
+
+def format_timestamp(timestamp: Optional[float]) -> Optional[str]:
+    """Formats a Unix time as an ISO 8601 string in UTC."""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+prefetch_scheduler = PrefetchScheduler()
@@ -0,0 +1,253 @@
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Fields of a movie in a TMDB list response that the movie cards, the
+# search index and the recommenders read. "rating" is only present in
+# the user's rated list.
+LIST_MOVIE_FIELDS = (
+    "id",
+    "title",
+    "original_title",
+    "poster_path",
+    "backdrop_path",
+    "release_date",
+    "vote_average",
+    "vote_count",
+    "popularity",
+    "overview",
+    "genre_ids",
+    "rating",
+)
+
+# Fields of the cast and crew of a movie's credits response.
+MOVIE_CAST_FIELDS = ("id", "name", "character", "profile_path", "order")
+MOVIE_CREW_FIELDS = ("id", "name", "job", "department", "profile_path")
+# Crew jobs kept in a movie's credits. The pages show none of its crew,
+# and the recommender only reads these.
+MOVIE_CREW_JOBS = {"Director", "Screenplay", "Writer"}
+
+# Fields of the movies in a person's movie_credits response.
+PERSON_CAST_FIELDS = (
+    "id",
+    "title",
+    "character",
+    "poster_path",
+    "release_date",
+    "popularity",
+    "vote_count",
+)
+PERSON_CREW_FIELDS = (
+    "id",
+    "title",
+    "job",
+    "department",
+    "poster_path",
+    "release_date",
+    "popularity",
+    "vote_count",
+)
+
+# Joins the roles of a person who is credited more than once on a movie.
+ROLE_SEPARATOR = " / "
+
+
+def project(data: Dict[str, Any], fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Copies the given fields of a TMDB object, leaving out missing
+    and None values.
+
+    Nested values are shared with data rather than copied.
+
+    Args:
+        data (Dict[str, Any]): The TMDB object.
+        fields (Tuple[str, ...]): The fields to keep.
+
+    Returns:
+        Dict[str, Any]: The projected object.
+    """
+    get = data.get
+    return {
+        field: value
+        for field in fields
+        if (value := get(field)) is not None
+    }
+
+
+def project_all(
+    items: Optional[Iterable[Optional[Dict[str, Any]]]],
+    fields: Tuple[str, ...],
+) -> List[Dict[str, Any]]:
+    """Projects every object of a TMDB list, skipping None items."""
+    return [project(item, fields) for item in items or () if item]
+
+
+def project_movies(
+    movies: Optional[Iterable[Optional[Dict[str, Any]]]]
+) -> List[Dict[str, Any]]:
+    """Reduces the results of a TMDB movie list page to LIST_MOVIE_FIELDS.
+
+    Args:
+        movies (Optional[Iterable[Optional[Dict[str, Any]]]]): The
+            page's results.
+
+    Returns:
+        List[Dict[str, Any]]: The projected movies.
+    """
+    return project_all(movies, LIST_MOVIE_FIELDS)
+
+
+def project_credits(
+    credits: Optional[Dict[str, Any]],
+    cast_fields: Tuple[str, ...] = MOVIE_CAST_FIELDS,
+    crew_fields: Tuple[str, ...] = MOVIE_CREW_FIELDS,
+) -> Dict[str, Any]:
+    """Reduces a TMDB credits response to the fields the pages use.
+
+    Args:
+        credits (Optional[Dict[str, Any]]): The credits response.
+        cast_fields (Tuple[str, ...], optional): The fields kept for
+            each cast entry. Defaults to MOVIE_CAST_FIELDS.
+        crew_fields (Tuple[str, ...], optional): The fields kept for
+            each crew entry. Defaults to MOVIE_CREW_FIELDS.
+
+    Returns:
+        Dict[str, Any]: The credits' "cast" and "crew" lists.
+    """
+    credits = credits or {}
+    return {
+        "cast": project_all(credits.get("cast"), cast_fields),
+        "crew": project_all(credits.get("crew"), crew_fields),
+    }
+
+
+def project_movie_credits(
+    credits: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Reduces a movie's credits response to one entry per actor, in
+    billing order, and one per crew member with a job in
+    MOVIE_CREW_JOBS.
+
+    Args:
+        credits (Optional[Dict[str, Any]]): The credits response.
+
+    Returns:
+        Dict[str, Any]: The credits' "cast" and "crew" lists.
+    """
+    credits = project_credits(credits)
+    cast = merge_roles(credits["cast"], "character")
+    cast.sort(key=lambda member: member.get("order", math.inf))
+    crew = [
+        member
+        for member in credits["crew"]
+        if member.get("job") in MOVIE_CREW_JOBS
+    ]
+    return {"cast": cast, "crew": merge_roles(crew, "job")}
+
+
+def project_person_credits(
+    credits: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Reduces a person's movie_credits response to one entry per movie
+    in each of the cast and crew lists, best known movies first.
+
+    Args:
+        credits (Optional[Dict[str, Any]]): The movie_credits response.
+
+    Returns:
+        Dict[str, Any]: The credits' "cast" and "crew" lists.
+    """
+    credits = project_credits(credits, PERSON_CAST_FIELDS, PERSON_CREW_FIELDS)
+    return {
+        "cast": sort_filmography(merge_roles(credits["cast"], "character")),
+        "crew": sort_filmography(merge_roles(credits["crew"], "job")),
+    }
+
+
+def merge_roles(
+    credits: List[Dict[str, Any]], role_field: str
+) -> List[Dict[str, Any]]:
+    """Merges the projected credits that share an ID into the first of
+    them, joining their distinct role_field values with ROLE_SEPARATOR,
+    e.g. the jobs of a director who also wrote the movie.
+
+    Args:
+        credits (List[Dict[str, Any]]): The projected credits.
+        role_field (str): "character" or "job".
+
+    Returns:
+        List[Dict[str, Any]]: One credit per ID, in order of first
+            appearance.
+    """
+    merged: Dict[Any, Dict[str, Any]] = {}
+    roles: Dict[Any, List[str]] = {}
+    for credit in credits:
+        credit_id = credit.get("id")
+        role = credit.get(role_field)
+        if credit_id not in merged:
+            merged[credit_id] = credit
+            roles[credit_id] = [role] if role else []
+        elif role and role not in roles[credit_id]:
+            roles[credit_id].append(role)
+            merged[credit_id] = {
+                **merged[credit_id],
+                role_field: ROLE_SEPARATOR.join(roles[credit_id]),
+            }
+    return list(merged.values())
+
+
+def get_roles(credit: Dict[str, Any], role_field: str) -> List[str]:
+    """Splits the role_field values that merge_roles joined."""
+    role = credit.get(role_field)
+    return role.split(ROLE_SEPARATOR) if role else []
+
+
+def sort_filmography(credits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Sorts a person's movies by vote count and then popularity, most
+    first, leaving the movies without a poster, which the person page
+    skips, at the end."""
+    return sorted(
+        credits,
+        key=lambda movie: (
+            "poster_path" in movie,
+            movie.get("vote_count", 0),
+            movie.get("popularity", 0),
+        ),
+        reverse=True,
+    )
+
+
+def get_credits_page(
+    credits: Dict[str, Any],
+    role: str = "cast",
+    offset: int = 0,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Slices one list of projected credits for a page or a request for
+    more of them.
+
+    Args:
+        credits (Dict[str, Any]): Credits as returned by
+            project_movie_credits or project_person_credits.
+        role (str, optional): "cast" or "crew". Defaults to "cast".
+        offset (int, optional): Credits to skip. Defaults to 0.
+        limit (Optional[int], optional): The most credits to return, or
+            None for all of them. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: The credits under "results", the length of the
+            whole list under "total" and the offset of the following
+            credits under "next_offset", which is None after the last.
+    """
+    items = credits.get(role) or []
+    end = len(items) if limit is None else offset + limit
+    return {
+        "results": items[offset:end],
+        "total": len(items),
+        "next_offset": end if end < len(items) else None,
+    }
+
+
+# Projections applied to the parts of a detail bundle.
+DETAIL_PART_PROJECTIONS = {
+    "credits": project_movie_credits,
+    "movie_credits": project_person_credits,
+}
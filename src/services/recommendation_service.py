@@ -0,0 +1,324 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple, Set
+
+import numpy as np
+
+from ..constants.api_constants import (
+    CONTENT_RECOMMENDER_MAX_MOVIES,
+    CONTENT_RECOMMENDER_REBUILD_INTERVAL,
+)
+from .projection_service import MOVIE_CREW_JOBS, get_roles
+
+if TYPE_CHECKING:
+    from scipy import sparse
+
+# Fields of a movie kept for rendering recommendations as movie cards.
+MOVIE_FIELDS = (
+    "id",
+    "title",
+    "poster_path",
+    "backdrop_path",
+    "release_date",
+    "vote_average",
+    "vote_count",
+    "popularity",
+    "overview",
+    "genre_ids",
+)
+MAX_CAST_FEATURES = 10
+
+
+class FeatureIndex(NamedTuple):
+    ids: np.ndarray
+    rows: Dict[int, int]
+    matrix: "sparse.csr_matrix"
+
+
+class ContentRecommender:
+    """Recommends movies whose genres, keywords, cast and crew resemble
+    those of the movies a user rated or favorited.
+
+    Movies are added as the app fetches them from TMDB, keeping the
+    max_movies most recently seen or looked up. The TF-IDF feature
+    matrix is rebuilt lazily on the first recommendation after movies
+    or features change, so recommending makes no upstream calls. It is
+    built from a snapshot of the features without holding the lock, so
+    that adding movies never waits for it, and at most once every
+    rebuild_interval seconds, using the previous matrix in between.
+    """
+
+    def __init__(
+        self,
+        max_movies: int = CONTENT_RECOMMENDER_MAX_MOVIES,
+        rebuild_interval: float = CONTENT_RECOMMENDER_REBUILD_INTERVAL,
+    ):
+        self.max_movies = max_movies
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._movies: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # Feature sets are replaced rather than changed in place, so
+        # that a shallow copy of the dict is a consistent snapshot.
+        self._features: Dict[int, Set[str]] = {}
+        self._index = None
+        self._changed = False
+        self._built_at = 0.0
+
+    def add_movies(self, movies: Iterable[Dict[str, Any]]) -> None:
+        """Adds movies from a TMDB list response.
+
+        Args:
+            movies (Iterable[Dict[str, Any]]): The list results.
+        """
+        with self._lock:
+            for movie in movies:
+                features = {
+                    f"genre:{genre_id}"
+                    for genre_id in movie.get("genre_ids", [])
+                }
+                self._add(movie, features)
+
+    def add_movie_details(
+        self,
+        info: Dict[str, Any],
+        credits: Dict[str, Any] = None,
+        keywords: Dict[str, Any] = None,
+    ) -> None:
+        """Adds a movie from its detail responses.
+
+        Args:
+            info (Dict[str, Any]): The movie's info response.
+            credits (Dict[str, Any], optional): Its credits response.
+                Defaults to None.
+            keywords (Dict[str, Any], optional): Its keywords response.
+                Defaults to None.
+        """
+        credits = credits or {}
+        keywords = keywords or {}
+        genre_ids = [genre["id"] for genre in info.get("genres", [])]
+
+        features = {f"genre:{genre_id}" for genre_id in genre_ids}
+        features.update(
+            f"keyword:{keyword['id']}"
+            for keyword in keywords.get("keywords", [])
+        )
+        features.update(
+            f"cast:{member['id']}"
+            for member in credits.get("cast", [])[:MAX_CAST_FEATURES]
+        )
+        features.update(
+            f"crew:{member['id']}"
+            for member in credits.get("crew", [])
+            if MOVIE_CREW_JOBS.intersection(get_roles(member, "job"))
+        )
+
+        with self._lock:
+            self._add({**info, "genre_ids": genre_ids}, features)
+
+    def get_movies(self, movie_ids: Iterable[int]) -> List[Dict[str, Any]]:
+        """Looks up movies the recommender has seen, for rendering.
+
+        Args:
+            movie_ids (Iterable[int]): The movie IDs.
+
+        Returns:
+            List[Dict[str, Any]]: The known movies, in the given order.
+        """
+        with self._lock:
+            movies = []
+            for movie_id in movie_ids:
+                if movie_id in self._movies:
+                    self._movies.move_to_end(movie_id)
+                    movies.append(dict(self._movies[movie_id]))
+            return movies
+
+    def recommend(
+        self,
+        weights: Dict[int, float],
+        k: int = 100,
+        exclude: Iterable[int] = (),
+    ) -> List[Dict[str, Any]]:
+        """Scores every known movie against a weighted profile of the
+        given movies and returns the k best matches.
+
+        Args:
+            weights (Dict[int, float]): How much each movie the user
+                interacted with counts towards their profile. Negative
+                weights push similar movies down.
+            k (int, optional): The number of movies to return.
+                Defaults to 100.
+            exclude (Iterable[int], optional): Movie IDs never to
+                recommend. Defaults to ().
+
+        Returns:
+            List[Dict[str, Any]]: The recommended movies, best first.
+        """
+        index = self._get_index()
+        user_rows = [
+            (index.rows[movie_id], weight)
+            for movie_id, weight in weights.items()
+            if movie_id in index.rows
+        ]
+        if not user_rows:
+            return []
+
+        user_weights = np.zeros(len(index.ids), dtype=np.float32)
+        for row, weight in user_rows:
+            user_weights[row] = weight
+
+        profile = index.matrix.T @ user_weights
+        scores = index.matrix @ profile
+
+        excluded_rows = [
+            index.rows[movie_id]
+            for movie_id in exclude
+            if movie_id in index.rows
+        ]
+        scores[excluded_rows] = -np.inf
+
+        k = min(k, len(scores))
+        top_rows = np.argpartition(-scores, k - 1)[:k]
+        top_rows = top_rows[np.argsort(-scores[top_rows])]
+
+        with self._lock:
+            # Movies dropped since the index was built are skipped.
+            return [
+                dict(self._movies[movie_id])
+                for row in top_rows
+                if scores[row] > 0
+                and (movie_id := int(index.ids[row])) in self._movies
+            ]
+
+    def recommend_for_user(
+        self, account_states: Dict[str, Any], k: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Recommends movies from a user's rated and favorite lists,
+        leaving out movies already in any of their lists.
+
+        Args:
+            account_states (Dict[str, Any]): The user's account states,
+                as returned by movie_service.get_account_states.
+            k (int, optional): The number of movies to return.
+                Defaults to 100.
+
+        Returns:
+            List[Dict[str, Any]]: The recommended movies, best first.
+        """
+        weights: Dict[int, float] = {}
+        for movie in account_states.get("rated", []):
+            # TMDB ratings run from 0.5 to 10; centre them on 5 so that
+            # poorly rated movies count against their neighbours.
+            weights[movie["id"]] = (movie.get("rating", 5) - 5) / 5
+        for movie in account_states.get("favorite", []):
+            weights[movie["id"]] = weights.get(movie["id"], 0) + 1
+
+        exclude = set(account_states.get("memberships", {}))
+        return self.recommend(weights, k, exclude)
+
+    def _add(self, movie: Dict[str, Any], features: Set[str]) -> None:
+        movie_id = movie.get("id")
+        if movie_id is None:
+            return
+
+        record = {
+            field: movie[field] for field in MOVIE_FIELDS if field in movie
+        }
+        self._movies[movie_id] = {**self._movies.get(movie_id, {}), **record}
+        self._movies.move_to_end(movie_id)
+
+        known_features = self._features.get(movie_id)
+        if known_features is None or not features <= known_features:
+            self._features[movie_id] = (known_features or set()) | features
+            self._changed = True
+
+        while len(self._movies) > self.max_movies:
+            dropped_id, _ = self._movies.popitem(last=False)
+            del self._features[dropped_id]
+            self._changed = True
+
+    def _get_index(self) -> FeatureIndex:
+        with self._lock:
+            if self._is_index_current():
+                return self._index
+
+        with self._build_lock:
+            with self._lock:
+                # Another thread may have started a build meanwhile.
+                if self._is_index_current():
+                    return self._index
+                features = dict(self._features)
+                self._changed = False
+                self._built_at = time.monotonic()
+
+            index = build_feature_index(features)
+            with self._lock:
+                self._index = index
+            return index
+
+    def _is_index_current(self) -> bool:
+        """Whether the index may be used as it is: it is up to date, or
+        was built less than rebuild_interval seconds ago. Must be called
+        with the lock held."""
+        return self._index is not None and (
+            not self._changed
+            or time.monotonic() - self._built_at < self.rebuild_interval
+        )
+
+
+def build_feature_index(features: Dict[int, Set[str]]) -> FeatureIndex:
+    """Builds the TF-IDF matrix of the given movies' features, with one
+    L2-normalized row per movie."""
+    # Imported here rather than at the top, since SciPy is slow to
+    # import and only needed once there is something to recommend.
+    from scipy import sparse
+
+    ids = list(features)
+    vocabulary: Dict[str, int] = {}
+    rows, columns = [], []
+    for row, movie_id in enumerate(ids):
+        for feature in features[movie_id]:
+            rows.append(row)
+            column = vocabulary.setdefault(feature, len(vocabulary))
+            columns.append(column)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(ids), len(vocabulary)),
+    )
+
+    document_frequency = np.bincount(columns, minlength=len(vocabulary))
+    idf = np.log(len(ids) / np.maximum(document_frequency, 1)) + 1
+    matrix = sparse.csr_matrix(matrix.multiply(idf.astype(np.float32)))
+
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    matrix = sparse.diags(1 / norms).dot(matrix).tocsr()
+
+    return FeatureIndex(
+        np.array(ids, dtype=np.int64),
+        {movie_id: row for row, movie_id in enumerate(ids)},
+        matrix,
+    )
+
+
+def interleave_unique(
+    *sources: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Merges movie lists by taking one movie from each in turn and
+    skipping movies already taken.
+
+    Returns:
+        List[Dict[str, Any]]: The merged list.
+    """
+    merged, seen = [], set()
+    for i in range(max((len(source) for source in sources), default=0)):
+        for source in sources:
+            if i < len(source) and source[i].get("id") not in seen:
+                seen.add(source[i].get("id"))
+                merged.append(source[i])
+    return merged
+
+
+content_recommender = ContentRecommender()
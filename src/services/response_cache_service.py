@@ -0,0 +1,61 @@
+import time
+from typing import Any, Dict, Optional
+
+from ..constants.api_constants import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+)
+from .cache_service import MemoryCacheBackend
+from .metrics_service import cache_requests
+
+
+class ResponseCache:
+    """Keeps rendered responses by URL for ttl seconds, so that they can
+    be served again without running their view or rendering a template.
+
+    Entries are kept in the memory of each process rather than in the
+    CACHE_BACKEND: they are rebuilt cheaply from the page cache, and in
+    a shared SQLite table they would evict its TMDB pages. Lookups are
+    counted in the cache metrics under "response".
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.backend = MemoryCacheBackend(max_entries)
+
+    def get(self, key: str, label: str = "") -> Optional[Dict[str, Any]]:
+        """Returns the response stored for key if it is still fresh.
+
+        Args:
+            key (str): The cache key, usually the request URL.
+            label (str, optional): Groups the lookup in the cache
+                metrics, e.g. by endpoint. Defaults to "".
+
+        Returns:
+            Optional[Dict[str, Any]]: The body under "data", and its
+                "content_type" and "etag", or None.
+        """
+        entry = self.backend.get(key)
+        if entry is not None and time.time() - entry[1] < self.ttl:
+            cache_requests.inc(cache="response", label=label, result="hit")
+            return entry[0]
+        cache_requests.inc(cache="response", label=label, result="miss")
+        return None
+
+    def set(self, key: str, data: bytes, content_type: str, etag: str):
+        """Stores a response body with its content type and ETag."""
+        self.backend.set(
+            key,
+            {"data": data, "content_type": content_type, "etag": etag},
+            time.time(),
+        )
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+response_cache = ResponseCache()
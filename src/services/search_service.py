@@ -0,0 +1,302 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from ..constants.api_constants import SEARCH_INDEX_MAX_MOVIES
+
+# Fields of a movie kept for rendering search results as movie cards.
+MOVIE_FIELDS = (
+    "id",
+    "title",
+    "original_title",
+    "poster_path",
+    "backdrop_path",
+    "release_date",
+    "vote_average",
+    "vote_count",
+    "popularity",
+    "overview",
+    "genre_ids",
+)
+SUGGESTION_FIELDS = ("id", "title", "release_date", "poster_path")
+INDEX_BATCH_SIZE = 1000
+# Matches scored per result a query returns, taken by popularity.
+CANDIDATES_PER_RESULT = 20
+# Sorts after every token, which are made of [a-z0-9].
+TERM_END = "{"
+
+# Where a movie is posted: minus its popularity, then its ID.
+PostingKey = Tuple[float, int]
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lowercase, accent-free alphanumeric tokens."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = text.encode("ascii", "ignore").decode("ascii").lower()
+    return re.findall(r"[a-z0-9]+", text)
+
+
+class SearchIndex:
+    """An in-process inverted index over movie titles.
+
+    Every query token must match a title token, the last one by prefix
+    so that partial input finds results while it is being typed.
+    Matches are ranked by how many tokens matched exactly, whether the
+    whole title matched, and popularity.
+
+    Each token's postings are kept ordered by popularity, so that a
+    query only scores the most popular limit * CANDIDATES_PER_RESULT
+    of its matches, however many titles share a short prefix. They are
+    scored outside the lock. The index keeps the max_movies most
+    recently indexed movies.
+    """
+
+    def __init__(self, max_movies: int = SEARCH_INDEX_MAX_MOVIES):
+        self.max_movies = max_movies
+        self._lock = threading.Lock()
+        self._movies: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._title_tokens: Dict[int, List[str]] = {}
+        # The tokens each movie is posted under, and the key it is
+        # posted with, so that it can be found again in their postings
+        # when its title or popularity changes or it is dropped.
+        self._movie_tokens: Dict[int, Set[str]] = {}
+        self._posting_keys: Dict[int, PostingKey] = {}
+        # Sorted by PostingKey, that is by popularity, descending.
+        self._postings: Dict[str, List[PostingKey]] = {}
+        # The tokens with postings, kept sorted for prefix matching.
+        self._terms: List[str] = []
+        self._catalog_version = None
+
+    def __len__(self) -> int:
+        return len(self._movies)
+
+    def add_movies(self, movies: Iterable[Dict[str, Any]]) -> None:
+        """Indexes movies from TMDB list results or catalog records.
+
+        Args:
+            movies (Iterable[Dict[str, Any]]): The movies to index.
+        """
+        batch = []
+        for movie in movies:
+            batch.append(movie)
+            if len(batch) == INDEX_BATCH_SIZE:
+                self._add_batch(batch)
+                batch = []
+        self._add_batch(batch)
+
+    def index_catalog(self, catalog, background: bool = True) -> None:
+        """Indexes the movies of a catalog, once per catalog version.
+
+        Args:
+            catalog (MovieCatalog): The catalog to index.
+            background (bool, optional): Whether to index on a
+                background thread rather than before returning.
+                Defaults to True.
+        """
+        version = catalog.version()
+        with self._lock:
+            if version is None or version == self._catalog_version:
+                return
+            self._catalog_version = version
+
+        if not background:
+            self.add_movies(catalog.records())
+            return
+        threading.Thread(
+            target=self.add_movies, args=(catalog.records(),), daemon=True
+        ).start()
+
+    def search(self, query: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Finds the movies whose titles match the query.
+
+        Args:
+            query (str): The search query.
+            limit (int, optional): The maximum number of movies to
+                return. Defaults to 100.
+
+        Returns:
+            List[Dict[str, Any]]: The matching movies, best first.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        max_candidates = limit * CANDIDATES_PER_RESULT
+        with self._lock:
+            if len(tokens) > 1:
+                candidates = self._match_tokens(tokens, max_candidates)
+            else:
+                candidates = self._match_prefix(tokens[0], max_candidates)
+            # Records and token lists are replaced rather than changed,
+            # so they can be read after the lock is released.
+            matches = [
+                (self._movies[movie_id], self._title_tokens[movie_id])
+                for movie_id in candidates
+            ]
+
+        best = heapq.nlargest(
+            limit,
+            matches,
+            key=lambda match: score_title(match[0], match[1], tokens),
+        )
+        return [dict(movie) for movie, _ in best]
+
+    def suggest(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Finds typeahead suggestions for partially typed queries.
+
+        Args:
+            query (str): The text typed so far.
+            limit (int, optional): The maximum number of suggestions.
+                Defaults to 10.
+
+        Returns:
+            List[Dict[str, Any]]: The suggested movies, reduced to the
+                fields a suggestion list shows.
+        """
+        return [
+            {
+                field: movie[field]
+                for field in SUGGESTION_FIELDS
+                if field in movie
+            }
+            for movie in self.search(query, limit)
+        ]
+
+    def _match_prefix(self, prefix: str, max_candidates: int) -> Set[int]:
+        """Finds the most popular movies with a token starting with
+        prefix, together with the most popular movies with exactly that
+        token, which would otherwise be crowded out by longer tokens.
+        Must be called with the lock held."""
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + TERM_END)
+        by_popularity = heapq.merge(
+            *(self._postings[term] for term in self._terms[start:end])
+        )
+        candidates = {
+            movie_id
+            for _, movie_id in self._postings.get(prefix, [])[:max_candidates]
+        }
+        for _, movie_id in by_popularity:
+            if len(candidates) >= 2 * max_candidates:
+                break
+            candidates.add(movie_id)
+        return candidates
+
+    def _match_tokens(
+        self, tokens: List[str], max_candidates: int
+    ) -> List[int]:
+        """Finds the most popular movies with every token but the last,
+        and a token starting with the last, by scanning the shortest of
+        their postings. Must be called with the lock held."""
+        *exact_tokens, last_token = tokens
+        shortest = min(
+            (self._postings.get(token, []) for token in exact_tokens),
+            key=len,
+        )
+        exact_tokens = set(exact_tokens)
+        start = bisect.bisect_left(self._terms, last_token)
+        end = bisect.bisect_left(self._terms, last_token + TERM_END)
+        prefix_terms = set(self._terms[start:end])
+        candidates = []
+        for _, movie_id in shortest:
+            movie_tokens = self._movie_tokens[movie_id]
+            if exact_tokens <= movie_tokens and not prefix_terms.isdisjoint(
+                movie_tokens
+            ):
+                candidates.append(movie_id)
+                if len(candidates) >= max_candidates:
+                    break
+        return candidates
+
+    def _add_batch(self, movies: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            changed_terms = set()
+            for movie in movies:
+                movie_id = movie.get("id")
+                if movie_id is None or not movie.get("title"):
+                    continue
+
+                record = {
+                    field: movie[field]
+                    for field in MOVIE_FIELDS
+                    if movie.get(field) is not None
+                }
+                record = {**self._movies.get(movie_id, {}), **record}
+                self._movies[movie_id] = record
+                self._movies.move_to_end(movie_id)
+                self._title_tokens[movie_id] = tokenize(record["title"])
+
+                original_title = record.get("original_title") or ""
+                tokens = set(tokenize(f"{record['title']} {original_title}"))
+                key = (-record.get("popularity", 0), movie_id)
+                old_tokens = self._movie_tokens.get(movie_id, set())
+                old_key = self._posting_keys.get(movie_id)
+                # A movie whose popularity changed moves in every one
+                # of its postings.
+                if key != old_key:
+                    removed, added = old_tokens, tokens
+                else:
+                    removed, added = old_tokens - tokens, tokens - old_tokens
+                for token in removed:
+                    self._unpost(token, old_key, changed_terms)
+                for token in added:
+                    self._post(token, key, changed_terms)
+                self._movie_tokens[movie_id] = tokens
+                self._posting_keys[movie_id] = key
+
+            while len(self._movies) > self.max_movies:
+                dropped_id, _ = self._movies.popitem(last=False)
+                del self._title_tokens[dropped_id]
+                key = self._posting_keys.pop(dropped_id)
+                for token in self._movie_tokens.pop(dropped_id):
+                    self._unpost(token, key, changed_terms)
+
+            self._update_terms(changed_terms)
+
+    def _post(self, token: str, key: PostingKey, changed_terms: Set[str]):
+        postings = self._postings.get(token)
+        if postings is None:
+            postings = self._postings[token] = []
+            changed_terms.add(token)
+        bisect.insort(postings, key)
+
+    def _unpost(self, token: str, key: PostingKey, changed_terms: Set[str]):
+        postings = self._postings[token]
+        del postings[bisect.bisect_left(postings, key)]
+        if not postings:
+            del self._postings[token]
+            changed_terms.add(token)
+
+    def _update_terms(self, changed_terms: Set[str]) -> None:
+        # A new list rather than changed in place, so that a search
+        # never sees it half updated. Merging keeps this linear in the
+        # number of terms rather than sorting them all again.
+        if not changed_terms:
+            return
+        terms = [term for term in self._terms if term not in changed_terms]
+        added = sorted(
+            term for term in changed_terms if term in self._postings
+        )
+        self._terms = list(heapq.merge(terms, added))
+
+
+def score_title(
+    movie: Dict[str, Any], title_tokens: List[str], tokens: List[str]
+) -> float:
+    """Scores how well a movie's title matches the query tokens."""
+    popularity = movie.get("popularity", 0)
+    exact_matches = sum(token in title_tokens for token in tokens)
+    score = exact_matches / len(tokens)
+    if title_tokens == tokens:
+        score += 2
+    elif title_tokens[: len(tokens)] == tokens:
+        score += 1
+    return score + math.log1p(popularity) / 5
+
+
+search_index = SearchIndex()
@@ -0,0 +1,444 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..constants.api_constants import (
+    SIMILARITY_BRUTE_FORCE_LIMIT,
+    SIMILARITY_DIMENSIONS,
+    SIMILARITY_INDEX_DIR,
+    SIMILARITY_PROBES,
+)
+
+logger = logging.getLogger(__name__)
+
+# k-means iterations when partitioning the embeddings into lists, and
+# the most embeddings sampled per list to fit the centroids on.
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 256
+# Embeddings scored at once while assigning them to lists.
+BATCH_SIZE = 4096
+
+
+class SimilarityIndex:
+    """Finds the movies most similar to a movie by the cosine similarity
+    of embeddings of their genres and keywords.
+
+    Embeddings are TF-IDF feature vectors of the catalog's movies,
+    reduced by truncated SVD. Small catalogs are searched exhaustively.
+    Catalogs of more than SIMILARITY_BRUTE_FORCE_LIMIT movies are
+    partitioned by k-means into inverted lists, and a query scans only
+    the lists whose centroids are nearest to it (IVF), more of them if
+    too few of their movies pass the filters.
+
+    The index is built from the catalog after each catalog ingestion,
+    or by `python -m src.services.similarity_service`. It is kept on
+    local disk with the embeddings stored in list order, so that every
+    list is one contiguous slice, memory-mapped on first use and
+    reloaded whenever it is rebuilt.
+    """
+
+    def __init__(self, path: str = SIMILARITY_INDEX_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._loaded_version = None
+
+    def similar(
+        self,
+        movie_id: Any,
+        k: int = 100,
+        genre_id: Optional[int] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        probes: int = SIMILARITY_PROBES,
+    ) -> List[int]:
+        """Finds the movies most similar to a movie.
+
+        Args:
+            movie_id (Any): The movie's ID.
+            k (int, optional): The maximum number of movies to return.
+                Defaults to 100.
+            genre_id (Optional[int], optional): Only movies of this
+                genre. Defaults to None.
+            min_year (Optional[int], optional): Only movies released in
+                or after this year. Defaults to None.
+            max_year (Optional[int], optional): Only movies released in
+                or before this year. Defaults to None.
+            probes (int, optional): The lists to scan at least.
+                Defaults to SIMILARITY_PROBES.
+
+        Returns:
+            List[int]: The IDs of the similar movies, most similar
+                first. Empty if the movie is not indexed.
+        """
+        arrays = self._get_arrays()
+        row = self._get_row(arrays, movie_id)
+        if row is None:
+            return []
+
+        genre_bit = 0
+        if genre_id is not None:
+            positions = np.flatnonzero(
+                arrays["genre_vocabulary"] == genre_id
+            )
+            if not len(positions):
+                return []
+            genre_bit = 1 << int(positions[0])
+
+        def get_mask(start: int, stop: int) -> np.ndarray:
+            mask = np.ones(stop - start, dtype=bool)
+            if start <= row < stop:
+                mask[row - start] = False
+            if genre_bit:
+                mask &= (arrays["genre_bits"][start:stop] & genre_bit) != 0
+            years = arrays["years"][start:stop]
+            if min_year is not None:
+                mask &= years >= min_year
+            if max_year is not None:
+                mask &= (years <= max_year) & (years > 0)
+            return mask
+
+        embeddings = arrays["embeddings"]
+        query = np.asarray(embeddings[row], dtype=np.float32)
+        is_filtered = genre_bit or min_year is not None or max_year is not None
+        if is_filtered:
+            # A selective filter leaves few enough movies to score them
+            # all, which is both faster and exact.
+            rows = np.flatnonzero(get_mask(0, len(embeddings)))
+            if len(rows) <= SIMILARITY_BRUTE_FORCE_LIMIT:
+                return self._get_top(arrays, rows, embeddings[rows] @ query, k)
+
+        offsets = arrays["list_offsets"]
+        bounds = get_score_bounds(
+            arrays["centroids"] @ query, arrays["list_radii"]
+        )
+        list_order = np.argsort(-bounds)
+        found_rows: List[np.ndarray] = []
+        found_scores: List[np.ndarray] = []
+        for i, list_index in enumerate(list_order):
+            start, stop = offsets[list_index], offsets[list_index + 1]
+            mask = get_mask(start, stop)
+            found_rows.append(start + np.flatnonzero(mask))
+            found_scores.append((embeddings[start:stop] @ query)[mask])
+            if i + 1 < probes or i + 1 == len(list_order):
+                continue
+            # No movie in the lists left can beat the k-th best found
+            # once that scores at least the next list's bound.
+            scores = np.concatenate(found_scores)
+            if len(scores) >= k:
+                kth_score = np.partition(scores, len(scores) - k)[-k]
+                if kth_score >= bounds[list_order[i + 1]]:
+                    break
+
+        return self._get_top(
+            arrays,
+            np.concatenate(found_rows),
+            np.concatenate(found_scores),
+            k,
+        )
+
+    def __contains__(self, movie_id: Any) -> bool:
+        return self._get_row(self._get_arrays(), movie_id) is not None
+
+    def build(
+        self, catalog, brute_force_limit: int = SIMILARITY_BRUTE_FORCE_LIMIT
+    ) -> int:
+        """Replaces the index on disk with one of the catalog's movies.
+
+        Args:
+            catalog (MovieCatalog): The catalog to index.
+            brute_force_limit (int, optional): The most movies to search
+                exhaustively rather than by IVF. Defaults to
+                SIMILARITY_BRUTE_FORCE_LIMIT.
+
+        Returns:
+            int: The number of movies indexed.
+        """
+        from scipy import sparse
+
+        ids, years, genre_lists, features = [], [], [], []
+        for record in catalog.records():
+            ids.append(record["id"])
+            years.append(int((record.get("release_date") or "0")[:4]))
+            genre_lists.append(record.get("genre_ids") or [])
+            features.append(
+                [f"genre:{genre_id}" for genre_id in genre_lists[-1]]
+                + [f"keyword:{id}" for id in record.get("keyword_ids") or []]
+            )
+
+        vocabulary: Dict[str, int] = {}
+        rows, columns = [], []
+        for row, movie_features in enumerate(features):
+            for feature in movie_features:
+                rows.append(row)
+                column = vocabulary.setdefault(feature, len(vocabulary))
+                columns.append(column)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+            shape=(len(ids), len(vocabulary)),
+        )
+        embeddings = embed(matrix)
+
+        list_count = 1
+        if len(ids) > brute_force_limit:
+            list_count = int(np.sqrt(len(ids)))
+        centroids, assignments = partition(embeddings, list_count)
+        order = np.argsort(assignments, kind="stable")
+        # The lowest similarity of a list's movies to its centroid.
+        # Movies without features never match, so they do not count.
+        list_radii = np.ones(list_count, dtype=np.float32)
+        has_features = embeddings.any(axis=1)
+        np.minimum.at(
+            list_radii,
+            assignments[has_features],
+            np.einsum(
+                "ij,ij->i",
+                embeddings[has_features],
+                centroids[assignments[has_features]],
+            ),
+        )
+
+        genre_vocabulary = np.array(
+            sorted({id for genre_ids in genre_lists for id in genre_ids}),
+            dtype=np.int64,
+        )[:63]
+        genre_positions = {
+            int(id): position for position, id in enumerate(genre_vocabulary)
+        }
+        genre_bits = np.array(
+            [
+                sum(
+                    1 << genre_positions[id]
+                    for id in set(genre_ids)
+                    if id in genre_positions
+                )
+                for genre_ids in genre_lists
+            ],
+            dtype=np.int64,
+        )
+
+        ids = np.array(ids, dtype=np.int64)[order]
+        arrays = {
+            "ids": ids,
+            "id_order": np.argsort(ids, kind="stable"),
+            "embeddings": embeddings[order],
+            "centroids": centroids,
+            "list_radii": list_radii,
+            "list_offsets": np.searchsorted(
+                assignments[order], np.arange(list_count + 1)
+            ),
+            "years": np.array(years, dtype=np.int16)[order],
+            "genre_bits": genre_bits[order],
+            "genre_vocabulary": genre_vocabulary,
+        }
+
+        staging_path = self.path + ".tmp"
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+        for name, values in arrays.items():
+            np.save(os.path.join(staging_path, f"{name}.npy"), values)
+        with open(os.path.join(staging_path, "meta.json"), "w") as file:
+            json.dump({"count": len(ids), "lists": list_count}, file)
+
+        old_path = self.path + ".old"
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old_path)
+        os.rename(staging_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        return len(ids)
+
+    def load(self) -> bool:
+        """Maps the index into memory now rather than on first use.
+
+        Returns:
+            bool: Whether there is an index.
+        """
+        return bool(self._get_arrays())
+
+    def version(self) -> Optional[tuple]:
+        """Returns a value that changes whenever the index on disk is
+        replaced, or None if there is no index."""
+        try:
+            meta = os.stat(os.path.join(self.path, "meta.json"))
+        except OSError:
+            return None
+        return meta.st_ino, meta.st_mtime_ns
+
+    def _get_arrays(self) -> Dict[str, np.ndarray]:
+        version = self.version()
+        if version is None:
+            return {}
+
+        with self._lock:
+            if version != self._loaded_version:
+                self._arrays = self._load()
+                self._loaded_version = version
+            return self._arrays
+
+    def _load(self) -> Dict[str, np.ndarray]:
+        arrays = {}
+        try:
+            for file_name in os.listdir(self.path):
+                name, extension = os.path.splitext(file_name)
+                if extension == ".npy":
+                    arrays[name] = np.load(
+                        os.path.join(self.path, file_name), mmap_mode="r"
+                    )
+        except (OSError, ValueError) as e:
+            logger.error(f"Error loading similarity index: {str(e)}")
+            return {}
+        return arrays
+
+    def _get_top(
+        self,
+        arrays: Dict[str, np.ndarray],
+        rows: np.ndarray,
+        scores: np.ndarray,
+        k: int,
+    ) -> List[int]:
+        rows, scores = rows[scores > 0], scores[scores > 0]
+        if not len(rows):
+            return []
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return arrays["ids"][rows[top]].tolist()
+
+    def _get_row(
+        self, arrays: Dict[str, np.ndarray], movie_id: Any
+    ) -> Optional[int]:
+        if not arrays:
+            return None
+        try:
+            movie_id = int(movie_id)
+        except (TypeError, ValueError):
+            return None
+        ids, id_order = arrays["ids"], arrays["id_order"]
+        position = int(np.searchsorted(ids, movie_id, sorter=id_order))
+        if position < len(ids) and ids[id_order[position]] == movie_id:
+            return int(id_order[position])
+        return None
+
+
+def get_score_bounds(
+    centroid_scores: np.ndarray, list_radii: np.ndarray
+) -> np.ndarray:
+    """Bounds the similarity of a query to any movie in each list.
+
+    A movie lies within the angle arccos(radius) of its list's centroid,
+    so its angle to the query is at least the query's angle to the
+    centroid less that.
+
+    Args:
+        centroid_scores (np.ndarray): The query's cosine similarity to
+            each list's centroid.
+        list_radii (np.ndarray): The lowest cosine similarity of each
+            list's movies to its centroid.
+
+    Returns:
+        np.ndarray: The highest possible similarity in each list.
+    """
+    query_angles = np.arccos(np.clip(centroid_scores, -1, 1))
+    radius_angles = np.arccos(np.clip(list_radii, -1, 1))
+    return np.cos(np.maximum(query_angles - radius_angles, 0))
+
+
+def embed(matrix, dimensions: int = SIMILARITY_DIMENSIONS) -> np.ndarray:
+    """Embeds the rows of a binary movie by feature matrix: weights the
+    features by TF-IDF, reduces them to at most the given number of
+    dimensions by truncated SVD and normalizes the rows.
+
+    Returns:
+        np.ndarray: One unit-length row per movie, or all zeros for
+            movies without features.
+    """
+    from scipy import sparse
+    from scipy.sparse.linalg import svds
+
+    document_frequency = np.bincount(
+        matrix.indices, minlength=matrix.shape[1]
+    )
+    idf = np.log(matrix.shape[0] / np.maximum(document_frequency, 1)) + 1
+    matrix = sparse.csr_matrix(matrix.multiply(idf.astype(np.float32)))
+
+    if min(matrix.shape) - 1 > dimensions:
+        u, s, _ = svds(matrix, k=dimensions, random_state=0)
+        embeddings = u * s
+    else:
+        embeddings = matrix.toarray()
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def partition(embeddings: np.ndarray, list_count: int):
+    """Clusters unit-length embeddings into lists by spherical k-means,
+    fitted on a sample.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The list centroids, and the list
+            of each embedding.
+    """
+    if list_count <= 1:
+        centroids = np.zeros((1, embeddings.shape[1]), dtype=np.float32)
+        return centroids, np.zeros(len(embeddings), dtype=np.int64)
+
+    rng = np.random.default_rng(0)
+    sample_size = min(len(embeddings), list_count * KMEANS_SAMPLE_PER_LIST)
+    sample = embeddings[
+        rng.choice(len(embeddings), sample_size, replace=False)
+    ]
+    centroids = sample[rng.choice(sample_size, list_count, replace=False)]
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # A list left empty keeps its centroid.
+        centroids = np.where(
+            norms > 0, sums / np.maximum(norms, 1e-12), centroids
+        )
+    return centroids.astype(np.float32), assign(embeddings, centroids)
+
+
+def assign(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Returns the index of each embedding's most similar centroid."""
+    assignments = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), BATCH_SIZE):
+        batch = embeddings[start:start + BATCH_SIZE]
+        assignments[start:start + BATCH_SIZE] = np.argmax(
+            batch @ centroids.T, axis=1
+        )
+    return assignments
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Builds the similar movies index from the catalog."
+    )
+    parser.parse_args()
+
+    # Imported here, as catalog_service imports this module.
+    from .catalog_service import movie_catalog
+
+    started_at = time.perf_counter()
+    count = similarity_index.build(movie_catalog)
+    print(
+        f"Indexed {count} movies at {similarity_index.path} in "
+        f"{time.perf_counter() - started_at:.1f}s"
+    )
+
+
+similarity_index = SimilarityIndex()
+
+if __name__ == "__main__":
+    main()